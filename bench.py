@@ -0,0 +1,230 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from algosdk.future import transaction
+from pysrc import config, metrics
+from pysrc.stub import NodeStub
+
+# Protocol scenarios against the local algod/indexer stub (pysrc/stub.py):
+#
+#   setup       opt-in and setup per user, users in parallel
+#   login       load_lsigs per user (chain head + indexer note search),
+#               5 passes over all users
+#   pay         one user, one payment per prepare/confirm cycle
+#   batch       one user, payments in batches of 15 per cycle
+#   concurrent  every user paying from its own thread
+#   pipeline    every user through PipelineScheduler
+#
+# Reports throughput, p50/p99 latency of one operation and node calls
+# per authentication (per user for setup and login), and compares them
+# with a baseline file: python bench.py --save writes one,
+# python bench.py --check fails on regressions beyond --tolerance.
+
+SCENARIOS = ["setup", "login", "pay", "batch", "concurrent", "pipeline"]
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+def percentile(values, p):
+  values = sorted(values)
+  return values[min(len(values)-1, int(len(values)*p))]
+
+def timed(f, *args):
+  t = time.perf_counter()
+  f(*args)
+  return time.perf_counter()-t
+
+class User:
+  def __init__(self, app, k):
+    from pysrc.account import Account
+    from pysrc.smart import Smart
+    from pysrc.passkit import make_lsigs
+    self.account = Account().generate()
+    self.smart = Smart(sender=self.account)
+    self.smart.id = app["appId"]
+    self.lsigs = make_lsigs(self.account, app)
+    self.passwd = os.urandom(32)
+    self.k = k
+    self.by_passwd = None
+
+  def setup(self):
+    from pysrc.passkit import TransactionByPasswd, setup
+    self.smart.opt_in()
+    setup(self.smart, self.lsigs, self.passwd, self.k)
+    self.by_passwd = TransactionByPasswd(self.smart, self.lsigs, self.passwd)
+
+  def payments(self, receiver, n):
+    from pysrc.params import suggested_params
+    params = suggested_params()
+    return [transaction.PaymentTxn(self.account.address, params, receiver, 1, note=os.urandom(8)) for _ in range(n)]
+
+class Bench:
+  def __init__(self, args):
+    from pysrc.account import Account
+    self.args = args
+    self.stub = NodeStub(round_time=args.round_time, latency=args.latency/1000).start()
+    config.use(algod_client=self.stub.algod_client(), indexer_client=self.stub.indexer_client())
+    self.developer = Account().generate()
+    self.app = self.stub.deploy(self.developer, args.optimized)
+    self.users = [User(self.app, 12*args.payments+30) for _ in range(args.users)]
+
+  def calls(self):
+    return sum(self.stub.calls.values())
+
+  # (operations, authentications, latencies) of one scenario
+  def setup(self):
+    with ThreadPoolExecutor(max_workers=len(self.users)) as executor:
+      latencies = list(executor.map(lambda u: timed(u.setup), self.users))
+    return len(self.users), len(self.users), latencies
+
+  def login(self):
+    from pysrc.passkit import load_lsigs
+    latencies = []
+    for user in self.users*5:
+      t = time.perf_counter()
+      if load_lsigs(self.app["appId"], user.passwd, user.k) is None:
+        raise Exception("Credentials of "+user.account.address+" not found")
+      latencies.append(time.perf_counter()-t)
+    return len(latencies), len(latencies), latencies
+
+  def pay(self):
+    from pysrc.batch import send_batch
+    user = self.users[0]
+    latencies = [timed(send_batch, user.by_passwd, user.payments(self.developer.address, 1)) for _ in range(self.args.payments)]
+    return self.args.payments, self.args.payments, latencies
+
+  def batch(self):
+    from pysrc.batch import send_batch, split_batches, MAX_BATCH
+    user = self.users[0]
+    chunks = split_batches(user.payments(self.developer.address, self.args.payments), MAX_BATCH)
+    latencies = []
+    for chunk in chunks:
+      latencies += [timed(send_batch, user.by_passwd, chunk)/len(chunk)]*len(chunk)
+    return self.args.payments, len(chunks), latencies
+
+  def concurrent(self):
+    from pysrc.batch import send_batch
+    def run(user):
+      return [timed(send_batch, user.by_passwd, user.payments(self.developer.address, 1)) for _ in range(self.args.payments)]
+    with ThreadPoolExecutor(max_workers=len(self.users)) as executor:
+      latencies = sum(executor.map(run, self.users), [])
+    return len(latencies), len(latencies), latencies
+
+  def pipeline(self):
+    from pysrc.pipeline import PipelineScheduler
+    scheduler = PipelineScheduler(depth=self.args.depth)
+    latencies = []
+    futures = []
+    for user in self.users:
+      user.by_passwd.reload()
+      scheduler.add_user(user.by_passwd)
+    for user in self.users:
+      for txn in user.payments(self.developer.address, self.args.payments):
+        t = time.perf_counter()
+        future = scheduler.submit(user.account.address, [txn])
+        future.add_done_callback(lambda f, t=t: latencies.append(time.perf_counter()-t))
+        futures.append(future)
+    scheduler.run()
+    for future in futures:
+      future.result()
+    return len(futures), len(futures), latencies
+
+  def run(self, name):
+    calls = self.calls()
+    with contextlib.redirect_stdout(io.StringIO()):
+      t = time.perf_counter()
+      ops, auths, latencies = getattr(self, name)()
+      elapsed = time.perf_counter()-t
+    return {
+      "ops": ops,
+      "ops_per_s": ops/elapsed,
+      "p50_ms": 1000*percentile(latencies, 0.5),
+      "p99_ms": 1000*percentile(latencies, 0.99),
+      "calls_per_auth": (self.calls()-calls)/auths
+    }
+
+# Relative changes of the current results, positive is worse.
+# Latency changes smaller than `noise` ms count as no change.
+def regressions(results, baseline, noise=0):
+  def latency(r, b):
+    return 0.0 if abs(r-b) < noise else (r-b)/b
+  changes = {}
+  for name, r in results.items():
+    b = baseline.get(name)
+    if b is None:
+      continue
+    changes[name] = {
+      "ops_per_s": (b["ops_per_s"]-r["ops_per_s"])/b["ops_per_s"],
+      "p50_ms": latency(r["p50_ms"], b["p50_ms"]),
+      "p99_ms": latency(r["p99_ms"], b["p99_ms"]),
+      "calls_per_auth": (r["calls_per_auth"]-b["calls_per_auth"])/b["calls_per_auth"]
+    }
+  return changes
+
+def main():
+  parser = argparse.ArgumentParser(description="PassDApp benchmarks against a local node stub")
+  parser.add_argument("scenarios", nargs="*", default=SCENARIOS, help=", ".join(SCENARIOS))
+  parser.add_argument("--users", type=int, default=8)
+  parser.add_argument("--payments", type=int, default=10, help="payments per user")
+  parser.add_argument("--round-time", type=float, default=0.2, help="seconds per round")
+  parser.add_argument("--latency", type=float, default=1, help="ms added to every request")
+  parser.add_argument("--depth", type=int, default=8, help="pipeline depth")
+  parser.add_argument("--optimized", action="store_true", help="optimized approval program")
+  parser.add_argument("--baseline", default=BASELINE)
+  parser.add_argument("--save", action="store_true", help="store the results as the baseline")
+  parser.add_argument("--check", action="store_true", help="exit with 1 on regressions")
+  parser.add_argument("--tolerance", type=float, default=0.25)
+  parser.add_argument("--noise", type=float, default=25, help="ms of latency change to ignore")
+  parser.add_argument("--metrics", help="write Prometheus metrics of the run to this file")
+  args = parser.parse_args()
+  for name in args.scenarios:
+    if name not in SCENARIOS:
+      parser.error("unknown scenario "+name)
+
+  if args.metrics:
+    metrics.registry.enable(metrics.PrometheusExporter(args.metrics))
+  settings = {k: getattr(args, k) for k in ("users", "payments", "round_time", "latency", "depth", "optimized")}
+  bench = Bench(args)
+  print(" ".join(["%s: %s" % (k, v) for k, v in settings.items()]))
+
+  # setup is always run, the other scenarios need set up users
+  results = {}
+  for name in SCENARIOS:
+    if name == "setup" or name in args.scenarios:
+      results[name] = bench.run(name)
+
+  baseline = {}
+  if os.path.exists(args.baseline) and not args.save:
+    with open(args.baseline) as f:
+      stored = json.load(f)
+    if stored["settings"] != settings:
+      print("baseline settings differ: "+json.dumps(stored["settings"]))
+    baseline = stored["results"]
+  changes = regressions(results, baseline, args.noise)
+
+  print("%-11s %7s %10s %10s %10s %11s" % ("scenario", "ops", "ops/s", "p50, ms", "p99, ms", "calls/auth"))
+  failed = []
+  for name, r in results.items():
+    print("%-11s %7d %10.1f %10.1f %10.1f %11.1f" % (name, r["ops"], r["ops_per_s"], r["p50_ms"], r["p99_ms"], r["calls_per_auth"]))
+    if name in changes:
+      c = changes[name]
+      print("%-11s %7s %9.0f%% %9.0f%% %9.0f%% %10.0f%%" % ("", "vs base", -100*c["ops_per_s"], 100*c["p50_ms"], 100*c["p99_ms"], 100*c["calls_per_auth"]))
+      failed += [name+" "+k for k, v in c.items() if v > args.tolerance]
+
+  if args.save:
+    with open(args.baseline, "w") as f:
+      json.dump({"settings": settings, "results": results}, f, indent=2)
+    print("baseline saved to "+args.baseline)
+  if args.metrics:
+    metrics.registry.export()
+  bench.stub.stop()
+  if failed:
+    print("regressions over %.0f%%: %s" % (100*args.tolerance, ", ".join(failed)))
+    if args.check:
+      sys.exit(1)
+
+if __name__ == "__main__":
+  main()
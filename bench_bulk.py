@@ -0,0 +1,30 @@
+import os
+import sys
+import time
+import base64
+from pysrc.bulk import derive_batch
+
+users = int(sys.argv[1]) if len(sys.argv)>=2 else 64
+iterations_count = int(sys.argv[2]) if len(sys.argv)>=3 else 100000
+k = 1000
+
+salt = base64.b64encode(os.urandom(32)).decode('UTF8')
+items = [(salt, "user password "+str(i), k) for i in range(users)]
+
+cores = os.cpu_count() or 1
+workers_list = sorted(set([1, 2, 4, 8, 16, cores]))
+workers_list = [w for w in workers_list if w<=cores]
+
+if __name__ == "__main__":
+  print("users: %d, pbkdf2 iterations: %d, chain length: %d, cores: %d" % (users, iterations_count, k, cores))
+  print("%8s %8s %10s %10s %8s" % ("mode", "workers", "time, s", "users/s", "scaling"))
+  for threads in [False, True]:
+    base = None
+    for workers in workers_list:
+      t = time.perf_counter()
+      derive_batch(items, iterations_count, workers=workers, threads=threads)
+      t = time.perf_counter()-t
+      rate = users/t
+      base = base or rate
+      mode = "threads" if threads else "procs"
+      print("%8s %8d %10.3f %10.1f %7.2fx" % (mode, workers, t, rate, rate/base))
@@ -0,0 +1,45 @@
+import sys
+import time
+from pysrc.passkit import secret_iterate
+from pysrc.hashchain import HashChain
+
+# Replays the secrets TransactionByPasswd needs for a run of payments
+# (cancel, confirm, prepare) starting from counter k.
+def payment_indices(k, payments):
+  indices = []
+  for _ in range(payments):
+    dk = k%3
+    if dk==0: dk=3
+    prepare_k = k-dk
+    indices.append((k, [k-1, prepare_k-2, prepare_k]))
+    k = prepare_k-2
+  return indices
+
+def run_loop(passwd, plan):
+  for k, indices in plan:
+    for i in indices:
+      secret_iterate(passwd, i)
+
+def run_chain(passwd, plan):
+  chain = HashChain(passwd)
+  for k, indices in plan:
+    chain.discard_above(k)
+    for i in indices:
+      chain.get(i)
+  return chain
+
+def measure(f, *args):
+  t = time.perf_counter()
+  r = f(*args)
+  return time.perf_counter()-t, r
+
+passwd = b"\x00"*32
+payments = int(sys.argv[1]) if len(sys.argv)>=2 else 10
+
+print("payments per run: "+str(payments))
+print("%10s %12s %12s %10s %12s" % ("k", "loop, s", "chain, s", "speedup", "checkpoints"))
+for k in [1000, 100000, 1000000]:
+  plan = payment_indices(k, payments)
+  t_loop, _ = measure(run_loop, passwd, plan)
+  t_chain, chain = measure(run_chain, passwd, plan)
+  print("%10d %12.4f %12.4f %9.1fx %12d" % (k, t_loop, t_chain, t_loop/t_chain, len(chain)))
@@ -0,0 +1,38 @@
+import sys
+import os
+import statistics
+import subprocess
+
+# Import time of pysrc modules in fresh interpreters (median of several
+# runs), and which heavy dependencies each import pulls in.
+
+MODULES = [
+  "pysrc.config", "pysrc.hashchain", "pysrc.session", "pysrc.passdapp",
+  "pysrc.params", "pysrc.transaction", "pysrc.passkit", "pysrc.simulator"
+]
+HEAVY = ["yaml", "pyteal", "algosdk", "nacl", "http.client"]
+
+SCRIPT = """
+import sys, time
+t = time.perf_counter()
+import %s
+print(time.perf_counter()-t)
+print(" ".join([m for m in %r if m in sys.modules]))
+"""
+
+def measure(module, runs):
+  times = []
+  for _ in range(runs):
+    out = subprocess.run(
+      [sys.executable, "-c", SCRIPT % (module, HEAVY)],
+      capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    ).stdout.split("\n")
+    times.append(float(out[0]))
+  return statistics.median(times), out[1]
+
+runs = int(sys.argv[1]) if len(sys.argv)>=2 else 5
+modules = sys.argv[2:] or MODULES
+print("%-20s %10s  %s" % ("module", "import ms", "loaded"))
+for module in modules:
+  t, loaded = measure(module, runs)
+  print("%-20s %10.1f  %s" % (module, 1000*t, loaded))
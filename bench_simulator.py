@@ -0,0 +1,74 @@
+import sys
+import os
+import time
+from algosdk.future import transaction
+from pysrc.account import Account
+from pysrc.smart import Smart
+from pysrc.passkit import TransactionByPasswd, make_lsigs, encodeLSigs, get_chain
+from pysrc.batch import Batch
+from pysrc.simulator import Ledger, deploy
+
+# Full PassDApp flow (opt-in, setup, prepare/confirm per payment) against
+# the in-process ledger: no node, no network. Every group goes through
+# signature, logic signature and approval program evaluation.
+
+def opt_in(ledger, account, app_id):
+  txn = transaction.ApplicationOptInTxn(account.address, ledger.suggested_params(), app_id)
+  ledger.submit([txn.sign(account.private)])
+
+def setup(ledger, account, app_id, lsigs, passwd, k):
+  secret = get_chain(passwd).get(k)
+  txn = transaction.ApplicationNoOpTxn(
+    account.address, ledger.suggested_params(), app_id,
+    ["setup", secret, k.to_bytes(8, 'big')], note=secret+encodeLSigs(lsigs)
+  )
+  ledger.submit([txn.sign(account.private)])
+
+def pay(ledger, by_passwd, receiver, amount):
+  params = ledger.suggested_params()
+  by_passwd.reload()
+  if not by_passwd.check_mark_before_prepare():
+    raise Exception("Mark is not empty")
+  batch = Batch(by_passwd, [transaction.PaymentTxn(by_passwd.lsigs["address"], params, receiver, amount)], params)
+  ledger.submit([batch.prepare])
+  ledger.advance()
+  if not by_passwd.check_mark_after_prepare(batch.mark):
+    raise Exception("Mark differs from the confirm txid")
+  ledger.submit(batch.group)
+  ledger.advance()
+
+users = int(sys.argv[1]) if len(sys.argv)>=2 else 10
+payments = int(sys.argv[2]) if len(sys.argv)>=3 else 100
+optimized = len(sys.argv)>=4 and sys.argv[3] == "optimized"
+
+ledger = Ledger()
+developer = Account().generate()
+d = deploy(ledger, developer, optimized)
+app_id = d["appId"]
+
+t = time.perf_counter()
+by_passwds = []
+for _ in range(users):
+  account = Account().generate()
+  lsigs = make_lsigs(account, d)
+  passwd = os.urandom(32)
+  k = 3*payments+10
+  opt_in(ledger, account, app_id)
+  setup(ledger, account, app_id, lsigs, passwd, k)
+  ledger.advance()
+  smart = Smart(sender=account, mirror=ledger)
+  smart.id = app_id
+  by_passwds.append(TransactionByPasswd(smart, lsigs, passwd))
+setup_time = time.perf_counter()-t
+
+t = time.perf_counter()
+for _ in range(payments):
+  for by_passwd in by_passwds:
+    pay(ledger, by_passwd, developer.address, 1)
+elapsed = time.perf_counter()-t
+
+auths = users*payments
+print("%d users, %d payments each, %s approval program" % (users, payments, "optimized" if optimized else "original"))
+print("setup:  %.2f s (%.1f ms per user)" % (setup_time, 1000*setup_time/users))
+print("auth:   %.2f s, %.0f auth/s, %.3f ms per prepare/confirm cycle" % (elapsed, auths/elapsed, 1000*elapsed/auths))
+print("ledger: round %d, %d transactions" % (ledger.round, len(ledger.txns)))
@@ -0,0 +1,66 @@
+import sys
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from algosdk.v2client import algod
+from pysrc.transport import PooledAlgodClient
+
+# Local algod stub answering /v2/status with keep-alive enabled.
+class StubHandler(BaseHTTPRequestHandler):
+  protocol_version = "HTTP/1.1"
+  disable_nagle_algorithm = True
+  delay = 0
+
+  def do_GET(self):
+    if self.delay:
+      time.sleep(self.delay)
+    body = json.dumps({"last-round": 1}).encode()
+    self.send_response(200)
+    self.send_header("Content-Type", "application/json")
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):
+    pass
+
+def percentile(values, p):
+  values = sorted(values)
+  return values[min(len(values)-1, int(len(values)*p))]
+
+def run(client, requests, threads):
+  latencies = []
+  def call(_):
+    t = time.perf_counter()
+    client.status()
+    latencies.append(time.perf_counter()-t)
+  t = time.perf_counter()
+  with ThreadPoolExecutor(max_workers=threads) as executor:
+    list(executor.map(call, range(requests)))
+  return time.perf_counter()-t, latencies
+
+requests = int(sys.argv[1]) if len(sys.argv)>=2 else 2000
+StubHandler.delay = float(sys.argv[2])/1000 if len(sys.argv)>=3 else 0
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+server.daemon_threads = True
+threading.Thread(target=server.serve_forever, daemon=True).start()
+address = "http://127.0.0.1:%d" % server.server_address[1]
+
+print("requests: %d, stub delay: %.1f ms" % (requests, StubHandler.delay*1000))
+print("%8s %8s %10s %10s %10s %10s" % ("client", "threads", "req/s", "p50, ms", "p99, ms", "calls"))
+for threads in [1, 8, 32]:
+  clients = [
+    ("urllib", algod.AlgodClient("a"*64, address)),
+    ("pooled", PooledAlgodClient("a"*64, address, pool_size=threads))
+  ]
+  for name, client in clients:
+    t, latencies = run(client, requests, threads)
+    calls = client.transport.calls if name == "pooled" else requests
+    print("%8s %8d %10.0f %10.3f %10.3f %10d" % (
+      name, threads, requests/t,
+      percentile(latencies, 0.5)*1000, percentile(latencies, 0.99)*1000, calls
+    ))
+server.shutdown()
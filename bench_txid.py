@@ -0,0 +1,45 @@
+import sys
+import time
+import base64
+from algosdk import account, constants, encoding
+from algosdk.future import transaction
+from pysrc import txid
+
+# Transaction ids and group ids for n transactions (groups of 16) with
+# algosdk's encoder and with pysrc.txid; both must agree.
+
+def sdk_txid_raw(txn):
+  return encoding.checksum(constants.txid_prefix+base64.b64decode(encoding.msgpack_encode(txn)))
+
+def make_txns(n):
+  _, sender = account.generate_account()
+  _, receiver = account.generate_account()
+  params = transaction.SuggestedParams(1000, 1000, 2000, "SGO1GKSzyE7IEPItTxCByw9x8FmnrCDexi9/cOUJOiI=", "testnet-v1.0", True)
+  txns = []
+  for i in range(n):
+    if i%2:
+      txns.append(transaction.PaymentTxn(sender, params, receiver, i+1))
+    else:
+      txns.append(transaction.ApplicationNoOpTxn(sender, params, 1234, ["confirm", i.to_bytes(32, "big")], accounts=[receiver]))
+  return txns
+
+def run(name, f, txns):
+  t = time.perf_counter()
+  result = f(txns)
+  elapsed = time.perf_counter()-t
+  print("%-24s %8.1f ms %10.0f txn/s" % (name, 1000*elapsed, len(txns)/elapsed))
+  return result, elapsed
+
+def groups(txns):
+  return [txns[i:i+constants.tx_group_limit] for i in range(0, len(txns), constants.tx_group_limit)]
+
+n = int(sys.argv[1]) if len(sys.argv)>=2 else 10000
+txns = make_txns(n)
+print("%d transactions" % n)
+a, ta = run("txid algosdk", lambda ts: [sdk_txid_raw(t) for t in ts], txns)
+b, tb = run("txid fast", lambda ts: [txid.txid_raw(t) for t in ts], txns)
+c, tc = run("group id algosdk", lambda ts: [transaction.calculate_group_id(g) for g in groups(ts)], txns)
+d, td = run("group id fast", lambda ts: [txid.calculate_group_id(g) for g in groups(ts)], txns)
+if a != b or c != d:
+  sys.exit("Mismatch between algosdk and fast ids")
+print("speedup: txid %.1fx, group id %.1fx" % (ta/tb, tc/td))
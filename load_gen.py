@@ -0,0 +1,414 @@
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import math
+import multiprocessing
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FutureTimeout
+from algosdk import error
+from algosdk.future import transaction
+from pysrc import config
+
+# Sustained password-authenticated payment load.
+#
+#   create  generate --accounts accounts
+#   fund    one payment from the developer account to each of them
+#   optin   Smart.opt_in per account
+#   setup   passkit.setup per account
+#   load    payments at --rate per second for --duration seconds per
+#           step, split over --workers processes; each worker drives its
+#           accounts through a PipelineScheduler and paces submissions
+#           by rounds: every new round adds rate*(time since the last
+#           round) payments to its budget
+#   drain   wait up to --drain seconds for queued payments
+#
+# Several comma separated rates run as consecutive steps on the same
+# accounts, e.g. --rate 5,10,20,40, to find where a deployment
+# saturates. Results (achieved TPS, latency, errors by category and
+# phase timings) are written to --out. With --stub everything runs
+# against a local node stub (pysrc/stub.py) instead of config.yml.
+
+def percentile(values, p):
+  if not values:
+    return None
+  values = sorted(values)
+  return values[min(len(values)-1, int(len(values)*p))]
+
+def classify(e):
+  from pysrc.passkit import StateCheckError
+  from pysrc.validate import category
+  if isinstance(e, StateCheckError):
+    return "state"
+  if isinstance(e, error.AlgodHTTPError):
+    if e.code is not None and e.code >= 500:
+      return "http_"+str(e.code)
+    return "rejected_"+category(str(e))
+  if isinstance(e, (TimeoutError, FutureTimeout)):
+    return "timeout"
+  if isinstance(e, (OSError, http.client.HTTPException)):
+    return "connection"
+  return type(e).__name__
+
+def use_endpoints(endpoints):
+  if endpoints is not None:
+    from pysrc.transport import PooledAlgodClient, PooledIndexerClient
+    config.use(
+      algod_client=PooledAlgodClient("a"*64, endpoints["algod"]),
+      indexer_client=PooledIndexerClient("a"*64, endpoints["indexer"])
+    )
+
+# Runs `f` for every item on `threads` threads; failures by category
+def run_phase(f, items, threads, verbose):
+  errors = Counter()
+  def run(item):
+    try:
+      f(item)
+      return True
+    except Exception as e:
+      errors[classify(e)] += 1
+      return False
+  out = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+  with out, ThreadPoolExecutor(max_workers=threads) as executor:
+    passed = list(executor.map(run, items))
+  return [item for item, ok in zip(items, passed) if ok], errors
+
+def fund(developer, accounts, amount):
+  from pysrc.params import suggested_params
+  from pysrc.follower import get_follower
+  from pysrc.txid import txid
+  client = config.algod_client
+  params = suggested_params()
+  futures = {}
+  for account in accounts:
+    txn = transaction.PaymentTxn(developer.address, params, account.address, amount)
+    try:
+      client.send_transaction(txn.sign(developer.private))
+      futures[account] = get_follower().wait_for(txid(txn), last_valid=txn.last_valid_round)
+    except Exception as e:
+      futures[account] = Future()
+      futures[account].set_exception(e)
+  return futures
+
+def opt_in_account(app_id):
+  from pysrc.smart import Smart
+  def run(account):
+    smart = Smart(sender=account)
+    smart.id = app_id
+    smart.opt_in()
+  return run
+
+def setup_account(app, k):
+  from pysrc.smart import Smart
+  from pysrc.passkit import make_lsigs, setup
+  def run(entry):
+    account, passwd = entry
+    smart = Smart(sender=account)
+    smart.id = app["appId"]
+    setup(smart, make_lsigs(account, app), passwd, k)
+    smart.read_local_state()
+    if smart.get_local_state_int("counter") != k:
+      raise Exception("Setup of "+account.address+" was not applied")
+  return run
+
+class Load:
+  def __init__(self, spec):
+    from pysrc.account import Account
+    from pysrc.smart import Smart
+    from pysrc.passkit import TransactionByPasswd, make_lsigs
+    from pysrc.pipeline import PipelineScheduler
+    self.spec = spec
+    self.batch = spec["batch"]
+    self.scheduler = PipelineScheduler(depth=spec["depth"])
+    self.addresses = []
+    for mnemonic, passwd in spec["accounts"]:
+      account = Account().fromDict({"mnemonic": mnemonic})
+      smart = Smart(sender=account)
+      smart.id = spec["app"]["appId"]
+      self.scheduler.add_user(TransactionByPasswd(smart, make_lsigs(account, spec["app"]), passwd))
+      self.addresses.append(account.address)
+    self.next = 0
+    self.failed = set()
+    self.completions = []
+    # Guards step results, updated from future callbacks
+    self.lock = threading.Lock()
+    self.running = True
+
+  def drive(self):
+    while self.running or not self.scheduler.idle():
+      pending = self.scheduler.step()
+      if pending:
+        wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+      else:
+        time.sleep(0.01)
+
+  def submit(self, step):
+    from pysrc.params import suggested_params
+    for _ in range(len(self.addresses)):
+      address = self.addresses[self.next%len(self.addresses)]
+      self.next += 1
+      if address not in self.failed:
+        break
+    else:
+      self.error(step, "no_accounts")
+      return
+    params = suggested_params()
+    txns = [transaction.PaymentTxn(address, params, self.spec["receiver"], 1, note=os.urandom(8)) for _ in range(self.batch)]
+    try:
+      future = self.scheduler.submit(address, txns)
+    except Exception as e:
+      self.failed.add(address)
+      self.error(step, classify(e))
+      return
+    with self.lock:
+      step["submitted"] += 1
+    t = time.monotonic()
+    def done(f):
+      now = time.monotonic()
+      e = f.exception()
+      if e is not None:
+        self.error(step, classify(e))
+        return
+      with self.lock:
+        step["latencies"].append(now-t)
+        self.completions.append(now)
+    future.add_done_callback(done)
+
+  def error(self, step, category):
+    with self.lock:
+      step["errors"][category] += 1
+
+  def run(self):
+    from pysrc.follower import get_follower
+    follower = get_follower()
+    driver = threading.Thread(target=self.drive, daemon=True)
+    driver.start()
+    round = config.algod_client.status()["last-round"]
+    time.sleep(max(0, self.spec["start_at"]-time.time()))
+    steps = []
+    for rate, duration in self.spec["steps"]:
+      step = {"rate": rate, "submitted": 0, "latencies": [], "errors": Counter(), "rounds": 0}
+      steps.append(step)
+      rate = rate/self.batch/self.spec["workers"]
+      start = last = time.monotonic()
+      step["start"] = start
+      budget = 0.0
+      while time.monotonic()-start < duration:
+        round = follower.wait_for_round(round+1).result()
+        now = time.monotonic()
+        budget += rate*(now-last)
+        last = now
+        step["rounds"] += 1
+        while budget >= 1:
+          self.submit(step)
+          budget -= 1
+      step["end"] = time.monotonic()
+    self.running = False
+    t = time.monotonic()
+    driver.join(self.spec["drain"])
+    drain = time.monotonic()-t
+    unfinished = self.scheduler.backlog()+sum([1 for u in self.scheduler.users.values() if u.pending is not None])
+    with self.lock:
+      results = []
+      for step in steps:
+        # Throughput over the settled part of the step, whichever step
+        # submitted the completed payments
+        start = step["start"]+self.spec["settle"]*(step["end"]-step["start"])
+        in_window = len([c for c in self.completions if start <= c < step["end"]])
+        results.append({
+          "rate": step["rate"],
+          "duration": step["end"]-start,
+          "rounds": step["rounds"],
+          "submitted": step["submitted"],
+          "confirmed": len(step["latencies"]),
+          "confirmed_in_window": in_window,
+          "latencies": list(step["latencies"]),
+          "errors": dict(step["errors"])
+        })
+    return {"steps": results, "drain": drain, "unfinished": unfinished, "scheduler": self.scheduler.stats()}
+
+def worker(spec):
+  if spec["profile"]:
+    config.use_profile(spec["profile"])
+  use_endpoints(spec["endpoints"])
+  with contextlib.redirect_stdout(io.StringIO()) if not spec["verbose"] else contextlib.nullcontext():
+    return Load(spec).run()
+
+def merge(args, rates, outputs):
+  steps = []
+  for i, rate in enumerate(rates):
+    parts = [o["steps"][i] for o in outputs]
+    duration = max([p["duration"] for p in parts])
+    latencies = sum([p["latencies"] for p in parts], [])
+    errors = Counter()
+    for p in parts:
+      errors.update(p["errors"])
+    confirmed = sum([p["confirmed_in_window"] for p in parts])
+    steps.append({
+      "target_tps": rate,
+      "achieved_tps": confirmed*args.batch/duration,
+      "auth_per_s": confirmed/duration,
+      "rounds": max([p["rounds"] for p in parts]),
+      "submitted": sum([p["submitted"] for p in parts]),
+      "confirmed": sum([p["confirmed"] for p in parts]),
+      "p50_ms": 1000*percentile(latencies, 0.5) if latencies else None,
+      "p99_ms": 1000*percentile(latencies, 0.99) if latencies else None,
+      "errors": dict(errors)
+    })
+  return steps
+
+def main():
+  parser = argparse.ArgumentParser(description="Password-authenticated payment load generator")
+  parser.add_argument("--accounts", type=int, default=10)
+  parser.add_argument("--rate", default="5", help="target payments per second, comma separated for steps")
+  parser.add_argument("--duration", type=float, default=30, help="seconds per rate step")
+  parser.add_argument("--workers", type=int, default=1, help="worker processes")
+  parser.add_argument("--batch", type=int, default=1, help="payments per authentication")
+  parser.add_argument("--depth", type=int, default=8, help="pipeline depth")
+  parser.add_argument("--fund", type=int, help="microalgos per account (default from the expected fees)")
+  parser.add_argument("--k", type=int, help="hash chain length (default from the expected load)")
+  parser.add_argument("--threads", type=int, default=16, help="threads for opt-in and setup")
+  parser.add_argument("--drain", type=float, default=30, help="seconds to wait for queued payments")
+  parser.add_argument("--settle", type=float, default=0.25, help="fraction of each step left out of its throughput")
+  parser.add_argument("--warmup", type=float, default=3, help="seconds for workers to start")
+  parser.add_argument("--profile", help="config profile, config.<profile>.yml")
+  parser.add_argument("--stub", action="store_true", help="run against a local node stub")
+  parser.add_argument("--round-time", type=float, default=1, help="stub seconds per round")
+  parser.add_argument("--out", default="load_results.json")
+  parser.add_argument("--verbose", action="store_true")
+  args = parser.parse_args()
+
+  from pysrc.account import Account
+  from pysrc.pipeline import MAX_TXNS
+  rates = [float(r) for r in args.rate.split(",")]
+  if args.accounts < 1 or args.workers < 1 or args.workers > args.accounts:
+    parser.error("need at least one account per worker")
+  if args.batch < 1 or args.batch > MAX_TXNS:
+    parser.error("batch must be 1 to "+str(MAX_TXNS))
+  if args.profile:
+    config.use_profile(args.profile)
+
+  # Each authentication costs 3 chain steps and prepare, confirm and batch fees
+  auths = math.ceil(sum(rates)*args.duration/args.batch/args.accounts)
+  k = args.k or 3*math.ceil(1.5*auths)+30
+  amount = args.fund or 500000+2*auths*(2+args.batch)*1000+auths*args.batch
+
+  phases = {}
+  errors = {}
+  t = time.monotonic()
+  endpoints = None
+  stub = None
+  if args.stub:
+    from pysrc.stub import NodeStub
+    stub = NodeStub(round_time=args.round_time).start()
+    endpoints = {"algod": stub.address("algod"), "indexer": stub.address("indexer")}
+    use_endpoints(endpoints)
+    developer = Account().generate()
+    app = stub.deploy(developer)
+  else:
+    from pysrc.passdapp import load_app
+    developer = config.developer
+    app = load_app()
+  print("app %d, %d accounts, k %d, %d microalgos each" % (app["appId"], args.accounts, k, amount))
+
+  accounts = [Account().generate() for _ in range(args.accounts)]
+  phases["create"] = time.monotonic()-t
+
+  t = time.monotonic()
+  futures = fund(developer, accounts, amount)
+  funded = []
+  errors["fund"] = Counter()
+  for account, future in futures.items():
+    try:
+      future.result(60)
+      funded.append(account)
+    except Exception as e:
+      errors["fund"][classify(e)] += 1
+  phases["fund"] = time.monotonic()-t
+  print("fund:  %d of %d in %.1f s" % (len(funded), len(accounts), phases["fund"]))
+
+  t = time.monotonic()
+  opted, errors["optin"] = run_phase(opt_in_account(app["appId"]), funded, args.threads, args.verbose)
+  phases["optin"] = time.monotonic()-t
+  print("optin: %d of %d in %.1f s" % (len(opted), len(funded), phases["optin"]))
+
+  t = time.monotonic()
+  entries = [(account, os.urandom(32)) for account in opted]
+  ready, errors["setup"] = run_phase(setup_account(app, k), entries, args.threads, args.verbose)
+  phases["setup"] = time.monotonic()-t
+  print("setup: %d of %d in %.1f s" % (len(ready), len(opted), phases["setup"]))
+  if len(ready) < args.workers:
+    raise SystemExit("Not enough accounts set up")
+
+  t = time.monotonic()
+  specs = []
+  for i in range(args.workers):
+    specs.append({
+      "profile": args.profile,
+      "endpoints": endpoints,
+      "app": app,
+      "receiver": developer.address,
+      "accounts": [(a.toDict()["mnemonic"], p) for a, p in ready[i::args.workers]],
+      "steps": [(rate, args.duration) for rate in rates],
+      "workers": args.workers,
+      "batch": args.batch,
+      "depth": args.depth,
+      "drain": args.drain,
+      "settle": args.settle,
+      "start_at": time.time()+args.warmup,
+      "verbose": args.verbose
+    })
+  if args.workers == 1:
+    outputs = [worker(specs[0])]
+  else:
+    # Spawned, so workers do not inherit the follower and params threads
+    with multiprocessing.get_context("spawn").Pool(args.workers) as pool:
+      outputs = pool.map(worker, specs)
+  phases["drain"] = max([o["drain"] for o in outputs])
+  phases["load"] = time.monotonic()-t-phases["drain"]
+
+  steps = merge(args, rates, outputs)
+  errors["load"] = Counter()
+  for step in steps:
+    errors["load"].update(step["errors"])
+  saturated = next((s["target_tps"] for s in steps if s["achieved_tps"] < 0.9*s["target_tps"]), None)
+  scheduler = Counter()
+  for o in outputs:
+    scheduler.update({k: v for k, v in o["scheduler"].items() if k in ("sent", "confirmed", "failures")})
+
+  print("%10s %10s %8s %8s %10s %10s  %s" % ("target", "achieved", "sent", "done", "p50, ms", "p99, ms", "errors"))
+  for s in steps:
+    print("%10.1f %10.1f %8d %8d %10s %10s  %s" % (
+      s["target_tps"], s["achieved_tps"], s["submitted"], s["confirmed"],
+      "%.0f" % s["p50_ms"] if s["p50_ms"] is not None else "-",
+      "%.0f" % s["p99_ms"] if s["p99_ms"] is not None else "-",
+      json.dumps(s["errors"])
+    ))
+  if saturated is not None:
+    print("saturated at %.1f payments/s" % saturated)
+
+  results = {
+    "settings": {k: v for k, v in vars(args).items() if k not in ("out", "verbose")},
+    "app_id": app["appId"],
+    "k": k,
+    "fund": amount,
+    "accounts": {"created": len(accounts), "funded": len(funded), "opted_in": len(opted), "ready": len(ready)},
+    "phases": phases,
+    "steps": steps,
+    "saturated_at": saturated,
+    "unfinished": sum([o["unfinished"] for o in outputs]),
+    "pipeline": dict(scheduler),
+    "errors": {phase: dict(c) for phase, c in errors.items()}
+  }
+  with open(args.out, "w") as f:
+    json.dump(results, f, indent=2)
+  print("results written to "+args.out)
+  if stub is not None:
+    stub.stop()
+
+if __name__ == "__main__":
+  main()
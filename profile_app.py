@@ -0,0 +1,102 @@
+import sys
+import copy
+import random
+import hashlib
+from pyteal import compileTeal, Mode
+from pysrc.passdapp import approval_program, approval_program_optimized
+from pysrc.teal import parse, evaluate, Context, BUDGET, APPLICATION
+
+# Opcode count and cost per PassDApp call type for the current and the
+# optimized approval program, followed by a differential check that both
+# accept and reject the same calls and leave the same local state.
+
+def H(x, n=1):
+  for _ in range(n):
+    x = hashlib.sha256(x).digest()
+  return x
+
+SENDER = b"S"*32
+CREATOR = b"C"*32
+TXID = b"T"*32
+
+def state(counter, secret, mark):
+  return {SENDER: {b"counter": counter, b"secret": secret, b"mark": mark}}
+
+def txn(on_completion, args, app_id=1, sender=SENDER):
+  return {
+    "Sender": sender, "ApplicationID": app_id, "OnCompletion": on_completion,
+    "ApplicationArgs": args, "TxID": TXID, "Fee": 1000
+  }
+
+# Valid call of each type for a counter value
+def scenario(branch, counter):
+  x = b"x"*32
+  if branch == "optin":
+    return txn(1, []), {SENDER: {}}
+  if branch == "setup":
+    return txn(0, [b"setup", H(x), (1000).to_bytes(8, "big")]), state(counter, b"", b"")
+  if branch == "prepare":
+    d = (counter-1)%3+1
+    return txn(0, [b"prepare", x, TXID]), state(counter, H(x, d), b"")
+  if branch == "confirm":
+    return txn(0, [b"confirm", x]), state(counter, H(x, 2), TXID)
+  if branch == "cancel":
+    return txn(0, [b"cancel", x]), state(counter, H(x), b"")
+
+def run(program, t, local):
+  local = copy.deepcopy(local)
+  ctx = Context(t, local=local, app_id=t["ApplicationID"], creator=CREATOR, mode=APPLICATION)
+  return evaluate(program, ctx), local
+
+def random_case(rnd):
+  x = rnd.choice([b"x"*32, b"y"*32, b""])
+  counter = rnd.choice([0, 1, 2, 3, 4, 5, 6, 7, 999, 1000, 2**64-1])
+  secret = rnd.choice([H(x, rnd.randint(0, 4)), b"", 5])
+  mark = rnd.choice([b"", TXID, b"z"])
+  local = {SENDER: {b"counter": counter, b"secret": secret, b"mark": mark}}
+  if rnd.random() < 0.1:
+    local = {SENDER: {}}
+  name = rnd.choice([b"setup", b"prepare", b"confirm", b"cancel", b"other"])
+  args = [name]+[rnd.choice([x, TXID, H(x), (7).to_bytes(8, "big"), b"\x01"*9]) for _ in range(rnd.randint(0, 3))]
+  if rnd.random() < 0.05:
+    args = []
+  on_completion = rnd.choice([0, 0, 0, 0, 1, 2, 4, 5])
+  app_id = 0 if rnd.random() < 0.05 else 1
+  sender = rnd.choice([SENDER, SENDER, CREATOR])
+  if sender != SENDER:
+    local[sender] = local[SENDER]
+  return txn(on_completion, args, app_id, sender), local
+
+def compile_program(d):
+  return parse(compileTeal(d["program"], mode=Mode.Application, version=3))
+
+original = compile_program(approval_program())
+optimized = compile_program(approval_program_optimized())
+
+branches = ["optin", "setup", "prepare", "confirm", "cancel"]
+print("%-8s %6s %10s %10s %10s %10s %8s" % ("call", "phase", "ops", "cost", "opt ops", "opt cost", "budget"))
+for branch in branches:
+  for counter in [999, 1000, 1001]:
+    t, local = scenario(branch, counter)
+    a, _ = run(original, t, local)
+    b, _ = run(optimized, t, local)
+    if not (a.approved and b.approved):
+      sys.exit("Scenario "+branch+" rejected: "+str(a.error or b.error))
+    print("%-8s %6d %10d %10d %10d %10d %8d" % (branch, counter%3, a.steps, a.cost, b.steps, b.cost, BUDGET[APPLICATION]))
+
+cases = int(sys.argv[1]) if len(sys.argv)>=2 else 20000
+rnd = random.Random(1)
+mismatches = 0
+approved = 0
+for _ in range(cases):
+  t, local = random_case(rnd)
+  a, local_a = run(original, t, local)
+  b, local_b = run(optimized, t, local)
+  if a.approved != b.approved or (a.approved and local_a != local_b):
+    mismatches += 1
+    if mismatches <= 5:
+      print("Mismatch:", t, local, a.approved, a.error, b.approved, b.error)
+  approved += a.approved
+print("\nDifferential check: %d cases, %d approved, %d mismatches" % (cases, approved, mismatches))
+if mismatches:
+  sys.exit(1)
@@ -0,0 +1,206 @@
+import asyncio
+import json
+from urllib import parse
+import aiohttp
+from algosdk import constants, error
+from algosdk.future import transaction
+from algosdk.v2client.algod import api_version_path_prefix
+from .params import get_provider
+from .follower import get_follower
+from .transaction import last_valid
+from .txid import encode_group
+from .passkit import StateCheckError, TransactionByPasswd, get_chain, loadK
+from .session import Session
+from .batch import Batch
+from . import metrics
+
+LABELS = (("endpoint", "algod"),)
+
+# Non-blocking counterparts of the algod calls used by the protocol.
+# Confirmation still goes through the shared BlockFollower thread, so
+# any number of coroutines waiting for transactions cost one follower.
+class AsyncAlgodClient:
+  def __init__(self, algod_token, algod_address, headers=None, limit=100):
+    self.algod_token = algod_token
+    self.algod_address = algod_address
+    self.headers = headers
+    self.limit = limit
+    self.session = None
+
+  def get_session(self):
+    if self.session is None or self.session.closed:
+      self.session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=self.limit)
+      )
+    return self.session
+
+  async def close(self):
+    if self.session is not None:
+      await self.session.close()
+
+  async def algod_request(self, method, requrl, params=None, data=None,
+                          headers=None, response_format="json"):
+    header = {}
+    if self.headers:
+      header.update(self.headers)
+    if headers:
+      header.update(headers)
+    if requrl not in constants.no_auth:
+      header.update({constants.algod_auth_header: self.algod_token})
+    if requrl not in constants.unversioned_paths:
+      requrl = api_version_path_prefix + requrl
+    if params:
+      requrl = requrl + "?" + parse.urlencode(params)
+
+    metrics.count("http_calls", 1, LABELS)
+    with metrics.span("http_request", LABELS):
+      async with self.get_session().request(method, self.algod_address+requrl,
+                                            headers=header, data=data) as resp:
+        body = await resp.read()
+    if resp.status >= 400:
+      e = body.decode("utf-8")
+      try:
+        e = json.loads(e)["message"]
+      except Exception:
+        pass
+      raise error.AlgodHTTPError(e, resp.status)
+    if response_format == "json":
+      try:
+        return json.loads(body)
+      except json.JSONDecodeError:
+        return None
+    return body
+
+  async def status(self):
+    return await self.algod_request("GET", "/status")
+
+  async def status_after_block(self, round_num):
+    return await self.algod_request("GET", "/status/wait-for-block-after/"+str(round_num))
+
+  async def account_info(self, address):
+    return await self.algod_request("GET", "/accounts/"+address)
+
+  async def pending_transaction_info(self, txid):
+    return await self.algod_request("GET", "/transactions/pending/"+txid, {"format": "json"})
+
+  async def suggested_params(self):
+    provider = get_provider()
+    params = provider.cached()
+    if params is not None:
+      return params
+    res = await self.algod_request("GET", "/transactions/params")
+    params = transaction.SuggestedParams(
+      res["fee"],
+      res["last-round"],
+      res["last-round"] + 1000,
+      res["genesis-hash"],
+      res["genesis-id"],
+      False,
+      res["consensus-version"],
+      res["min-fee"]
+    )
+    provider.store(params)
+    return params
+
+  async def send_raw_transaction(self, raw):
+    headers = {'Content-Type': 'application/x-binary'}
+    res = await self.algod_request("POST", "/transactions", data=raw, headers=headers)
+    return res["txId"]
+
+  async def send_transactions(self, txns):
+    for txn in txns:
+      assert not isinstance(txn, transaction.Transaction), \
+        f"Attempt to send UNSIGNED transaction {txn}"
+    return await self.send_raw_transaction(encode_group(txns))
+
+  async def send_transaction(self, txn):
+    return await self.send_transactions([txn])
+
+async def wait_for_confirmation(txid, wait_for_next_round=False, last_valid=None):
+  future = metrics.track("confirmation_wait", get_follower().wait_for(txid, wait_for_next_round, last_valid))
+  return await asyncio.wrap_future(future)
+
+async def send_transaction(client, signed_tx, **kwargs):
+  tx_info = None
+  try:
+    with metrics.span("send"):
+      tx_confirm = await client.send_transaction(signed_tx)
+    tx_info = await wait_for_confirmation(tx_confirm, last_valid=signed_tx.transaction.last_valid_round, **kwargs)
+  except Exception as e:
+    metrics.count("send_failures")
+    print(e)
+  return tx_info
+
+async def send_transactions(client, signed_txs, **kwargs):
+  tx_info = None
+  try:
+    with metrics.span("send"):
+      tx_confirm = await client.send_transactions(signed_txs)
+    tx_info = await wait_for_confirmation(tx_confirm, last_valid=last_valid(signed_txs), **kwargs)
+  except Exception as e:
+    metrics.count("send_failures")
+    print(e)
+  return tx_info
+
+async def read_local_state(client, smart, strict=False):
+  with metrics.span("read_local_state"):
+    mirror = smart.param.get("mirror")
+    if mirror is not None:
+      local_state = mirror.local_state(smart.param['sender'], strict, int(smart.id))
+      if local_state is not None:
+        smart.local_state = local_state
+        return smart
+    return smart.set_local_state(await client.account_info(smart.param['sender']))
+
+class AsyncTransactionByPasswd(TransactionByPasswd):
+  def __init__(self, client, smart, lsigs, passwd):
+    if isinstance(passwd, Session):
+      passwd.acquire()
+    self.client = client
+    self.smart = smart
+    self.lsigs = lsigs
+    self.passwd = passwd
+    self.epoch = 0
+    self.chain = get_chain(passwd)
+    self.k = None
+
+  @classmethod
+  async def create(cls, client, smart, lsigs, passwd):
+    self = cls(client, smart, lsigs, passwd)
+    await self.reload()
+    return self
+
+  async def reload(self):
+    await read_local_state(self.client, self.smart)
+    self.follow_epoch(loadK(self.smart))
+    self.chain.discard_above(self.k)
+
+  async def gen_tx_confirm(self):
+    return TransactionByPasswd.gen_tx_confirm(self, await self.client.suggested_params())
+
+  async def gen_tx_prepare(self, mark):
+    return TransactionByPasswd.gen_tx_prepare(self, mark, await self.client.suggested_params())
+
+  async def gen_cancel(self):
+    return TransactionByPasswd.gen_cancel(self, await self.client.suggested_params())
+
+  async def check_mark_before_prepare(self):
+    await read_local_state(self.client, self.smart, strict=True)
+    return self.smart.get_local_state_bytes("mark") == b""
+
+  async def check_mark_after_prepare(self, mark):
+    await read_local_state(self.client, self.smart, strict=True)
+    return self.smart.get_local_state_bytes("mark") == mark
+
+# Full prepare/confirm round trip for transactions from the lsigs owner,
+# as in test.py. Returns the confirmation info of the group or None.
+async def send_by_passwd(by_passwd, txns):
+  if not await by_passwd.check_mark_before_prepare():
+    raise StateCheckError("Contract state check failed. For security reasons you have to do setup again.")
+  batch = Batch(by_passwd, txns, await by_passwd.client.suggested_params())
+  await send_transaction(by_passwd.client, batch.prepare)
+  if not await by_passwd.check_mark_after_prepare(batch.mark):
+    raise StateCheckError("Contract state check failed. For security reasons you have to do setup again.")
+  tx_info = await send_transactions(by_passwd.client, batch.group)
+  await by_passwd.reload()
+  return tx_info
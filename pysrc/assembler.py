@@ -0,0 +1,219 @@
+from collections import Counter
+from .teal import Program, TealError, parse
+
+# TEAL v3 bytecode <-> the instruction list used by pysrc.teal.
+# assemble() lets programs be built without algod's compile endpoint;
+# disassemble() reads bytecode from LogicSig.logic or app create calls.
+
+OPCODES = {
+  0x00: "err", 0x01: "sha256", 0x02: "keccak256", 0x03: "sha512_256", 0x04: "ed25519verify",
+  0x08: "+", 0x09: "-", 0x0a: "/", 0x0b: "*", 0x0c: "<", 0x0d: ">", 0x0e: "<=", 0x0f: ">=",
+  0x10: "&&", 0x11: "||", 0x12: "==", 0x13: "!=", 0x14: "!", 0x15: "len", 0x16: "itob",
+  0x17: "btoi", 0x18: "%", 0x19: "|", 0x1a: "&", 0x1b: "^", 0x1c: "~", 0x1d: "mulw", 0x1e: "addw",
+  0x20: "intcblock", 0x21: "intc", 0x22: "intc_0", 0x23: "intc_1", 0x24: "intc_2", 0x25: "intc_3",
+  0x26: "bytecblock", 0x27: "bytec", 0x28: "bytec_0", 0x29: "bytec_1", 0x2a: "bytec_2", 0x2b: "bytec_3",
+  0x2c: "arg", 0x2d: "arg_0", 0x2e: "arg_1", 0x2f: "arg_2", 0x30: "arg_3",
+  0x31: "txn", 0x32: "global", 0x33: "gtxn", 0x34: "load", 0x35: "store", 0x36: "txna",
+  0x37: "gtxna", 0x38: "gtxns", 0x39: "gtxnsa",
+  0x40: "bnz", 0x41: "bz", 0x42: "b", 0x43: "return", 0x44: "assert",
+  0x48: "pop", 0x49: "dup", 0x4a: "dup2", 0x4b: "dig", 0x4c: "swap", 0x4d: "select",
+  0x50: "concat", 0x51: "substring", 0x52: "substring3", 0x53: "getbit", 0x54: "setbit",
+  0x55: "getbyte", 0x56: "setbyte",
+  0x60: "balance", 0x61: "app_opted_in", 0x62: "app_local_get", 0x63: "app_local_get_ex",
+  0x64: "app_global_get", 0x65: "app_global_get_ex", 0x66: "app_local_put", 0x67: "app_global_put",
+  0x68: "app_local_del", 0x69: "app_global_del", 0x70: "asset_holding_get", 0x71: "asset_params_get",
+  0x78: "min_balance", 0x80: "pushbytes", 0x81: "pushint"
+}
+OPCODE_BYTES = {name: code for code, name in OPCODES.items()}
+
+TXN_FIELDS = [
+  "Sender", "Fee", "FirstValid", "FirstValidTime", "LastValid", "Note", "Lease", "Receiver",
+  "Amount", "CloseRemainderTo", "VotePK", "SelectionPK", "VoteFirst", "VoteLast",
+  "VoteKeyDilution", "Type", "TypeEnum", "XferAsset", "AssetAmount", "AssetSender",
+  "AssetReceiver", "AssetCloseTo", "GroupIndex", "TxID", "ApplicationID", "OnCompletion",
+  "ApplicationArgs", "NumAppArgs", "Accounts", "NumAccounts", "ApprovalProgram",
+  "ClearStateProgram", "RekeyTo", "ConfigAsset", "ConfigAssetTotal", "ConfigAssetDecimals",
+  "ConfigAssetDefaultFrozen", "ConfigAssetUnitName", "ConfigAssetName", "ConfigAssetURL",
+  "ConfigAssetMetadataHash", "ConfigAssetManager", "ConfigAssetReserve", "ConfigAssetFreeze",
+  "ConfigAssetClawback", "FreezeAsset", "FreezeAssetAccount", "FreezeAssetFrozen", "Assets",
+  "NumAssets", "Applications", "NumApplications", "GlobalNumUint", "GlobalNumByteSlice",
+  "LocalNumUint", "LocalNumByteSlice"
+]
+GLOBAL_FIELDS = [
+  "MinTxnFee", "MinBalance", "MaxTxnLife", "ZeroAddress", "GroupSize", "LogicSigVersion",
+  "Round", "LatestTimestamp", "CurrentApplicationID", "CreatorAddress"
+]
+
+BRANCHES = ("bnz", "bz", "b")
+
+def varuint(n):
+  out = bytearray()
+  while True:
+    b = n & 0x7f
+    n >>= 7
+    if n:
+      out.append(b | 0x80)
+    else:
+      out.append(b)
+      return bytes(out)
+
+def read_varuint(code, pc):
+  n = 0
+  shift = 0
+  while True:
+    if pc >= len(code):
+      raise TealError("Truncated varuint")
+    b = code[pc]
+    pc += 1
+    n |= (b & 0x7f) << shift
+    shift += 7
+    if b < 0x80:
+      return n, pc
+
+def const_block(values):
+  counts = Counter(values)
+  return sorted(counts, key=lambda v: -counts[v])
+
+def encode_const(index, short_base, long_op):
+  if index < 4:
+    return bytes([short_base+index])
+  return bytes([OPCODE_BYTES[long_op], index])
+
+def encode(op, arg, ints, byteslices):
+  if op == "int":
+    return encode_const(ints.index(arg), OPCODE_BYTES["intc_0"], "intc")
+  if op == "byte":
+    return encode_const(byteslices.index(arg), OPCODE_BYTES["bytec_0"], "bytec")
+  if op not in OPCODE_BYTES:
+    raise TealError("Unknown opcode "+op)
+  code = bytes([OPCODE_BYTES[op]])
+  if op == "arg":
+    return bytes([OPCODE_BYTES["arg_0"]+arg]) if arg < 4 else code+bytes([arg])
+  if op in ("txn", "gtxns"):
+    return code+bytes([TXN_FIELDS.index(arg)])
+  if op in ("txna", "gtxnsa"):
+    return code+bytes([TXN_FIELDS.index(arg[0]), arg[1]])
+  if op == "gtxn":
+    return code+bytes([arg[0], TXN_FIELDS.index(arg[1])])
+  if op == "gtxna":
+    return code+bytes([arg[0], TXN_FIELDS.index(arg[1]), arg[2]])
+  if op == "global":
+    return code+bytes([GLOBAL_FIELDS.index(arg)])
+  if op in ("load", "store"):
+    return code+bytes([arg])
+  if arg is not None:
+    raise TealError("Unsupported immediate for "+op)
+  return code
+
+def assemble(source):
+  program = parse(source)
+  ints = const_block([arg for op, arg in program.ops if op == "int"])
+  byteslices = const_block([arg for op, arg in program.ops if op == "byte"])
+  header = varuint(program.version)
+  if ints:
+    header += bytes([OPCODE_BYTES["intcblock"]])+varuint(len(ints))+b"".join([varuint(v) for v in ints])
+  if byteslices:
+    header += bytes([OPCODE_BYTES["bytecblock"]])+varuint(len(byteslices))+ \
+      b"".join([varuint(len(v))+v for v in byteslices])
+  chunks = []
+  for op, arg in program.ops:
+    if op in BRANCHES:
+      chunks.append(bytes([OPCODE_BYTES[op], 0, 0]))
+    else:
+      chunks.append(encode(op, arg, ints, byteslices))
+  offsets = [0]
+  for chunk in chunks:
+    offsets.append(offsets[-1]+len(chunk))
+  for i, (op, target) in enumerate(program.ops):
+    if op in BRANCHES:
+      rel = offsets[target]-offsets[i+1]
+      if rel < 0:
+        raise TealError("Backward branches are not allowed in TEAL v3")
+      chunks[i] = bytes([OPCODE_BYTES[op]])+rel.to_bytes(2, "big")
+  return header+b"".join(chunks)
+
+def disassemble(code, name=None):
+  version, pc = read_varuint(code, 0)
+  ints = []
+  byteslices = []
+  ops = []
+  starts = {}
+  branches = []
+  while pc < len(code):
+    starts[pc] = len(ops)
+    op = OPCODES.get(code[pc])
+    if op is None:
+      raise TealError("Unknown opcode 0x%02x" % code[pc], pc)
+    pc += 1
+    if op == "intcblock":
+      n, pc = read_varuint(code, pc)
+      ints = []
+      for _ in range(n):
+        v, pc = read_varuint(code, pc)
+        ints.append(v)
+      continue
+    if op == "bytecblock":
+      n, pc = read_varuint(code, pc)
+      byteslices = []
+      for _ in range(n):
+        l, pc = read_varuint(code, pc)
+        byteslices.append(bytes(code[pc:pc+l]))
+        pc += l
+      continue
+    if op.startswith("intc_"):
+      ops.append(("int", ints[int(op[-1])]))
+    elif op == "intc":
+      ops.append(("int", ints[code[pc]]))
+      pc += 1
+    elif op.startswith("bytec_"):
+      ops.append(("byte", byteslices[int(op[-1])]))
+    elif op == "bytec":
+      ops.append(("byte", byteslices[code[pc]]))
+      pc += 1
+    elif op == "pushint":
+      v, pc = read_varuint(code, pc)
+      ops.append(("int", v))
+    elif op == "pushbytes":
+      l, pc = read_varuint(code, pc)
+      ops.append(("byte", bytes(code[pc:pc+l])))
+      pc += l
+    elif op.startswith("arg_"):
+      ops.append(("arg", int(op[-1])))
+    elif op in ("arg", "load", "store"):
+      ops.append((op, code[pc]))
+      pc += 1
+    elif op in ("txn", "gtxns"):
+      ops.append((op, TXN_FIELDS[code[pc]]))
+      pc += 1
+    elif op in ("txna", "gtxnsa"):
+      ops.append((op, (TXN_FIELDS[code[pc]], code[pc+1])))
+      pc += 2
+    elif op == "gtxn":
+      ops.append((op, (code[pc], TXN_FIELDS[code[pc+1]])))
+      pc += 2
+    elif op == "gtxna":
+      ops.append((op, (code[pc], TXN_FIELDS[code[pc+1]], code[pc+2])))
+      pc += 3
+    elif op == "global":
+      ops.append((op, GLOBAL_FIELDS[code[pc]]))
+      pc += 1
+    elif op in BRANCHES:
+      rel = int.from_bytes(code[pc:pc+2], "big", signed=True)
+      pc += 2
+      branches.append(len(ops))
+      ops.append((op, pc+rel))
+    elif op in ("dig", "asset_holding_get", "asset_params_get"):
+      ops.append((op, code[pc]))
+      pc += 1
+    elif op == "substring":
+      ops.append((op, (code[pc], code[pc+1])))
+      pc += 2
+    else:
+      ops.append((op, None))
+  starts[pc] = len(ops)
+  for i in branches:
+    op, target = ops[i]
+    if target not in starts:
+      raise TealError("Branch into the middle of an instruction")
+    ops[i] = (op, starts[target])
+  return Program(ops, version, name)
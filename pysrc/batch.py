@@ -0,0 +1,45 @@
+from .transaction import send_transaction, send_transactions
+from .passkit import StateCheckError, TransactionByPasswd
+from .txid import assign_group_id
+
+# A group holds at most 16 transactions, one of them is the confirm call
+MAX_BATCH = 15
+
+# One prepare/confirm cycle authorizing up to MAX_BATCH transactions
+# from the lsigs owner: every transaction points at the single confirm
+# call placed at the end of the group.
+class Batch:
+  def __init__(self, by_passwd, txns, params=None):
+    if len(txns) == 0 or len(txns) > MAX_BATCH:
+      raise ValueError("Batch must contain 1 to "+str(MAX_BATCH)+" transactions")
+    for txn in txns:
+      if txn.sender != by_passwd.lsigs["address"]:
+        raise ValueError("Transaction sender differs from credentials address")
+    # Base class builders, so async subclasses can pass prefetched params
+    tx_confirm = TransactionByPasswd.gen_tx_confirm(by_passwd, params)
+    assign_group_id(txns+[tx_confirm.transaction])
+    self.mark = by_passwd.gen_mark(tx_confirm)
+    self.prepare = TransactionByPasswd.gen_tx_prepare(by_passwd, self.mark, params)
+    self.group = by_passwd.sign_txs(txns, len(txns))+[tx_confirm]
+
+def split_batches(txns, size=MAX_BATCH):
+  return [txns[i:i+size] for i in range(0, len(txns), size)]
+
+# Sends any number of transactions, MAX_BATCH per OTP step.
+# Each batch takes a prepare round and a confirm round.
+def send_batch(by_passwd, txns):
+  results = []
+  for chunk in split_batches(txns):
+    by_passwd.reload()
+    if not by_passwd.check_mark_before_prepare():
+      raise StateCheckError("Contract state check failed. For security reasons you have to do setup again.")
+    batch = Batch(by_passwd, chunk)
+    send_transaction(batch.prepare)
+    if not by_passwd.check_mark_after_prepare(batch.mark):
+      raise StateCheckError("Contract state check failed. For security reasons you have to do setup again.")
+    tx_info = send_transactions(batch.group)
+    if tx_info is None:
+      raise StateCheckError("Batch confirmation failed")
+    results.append(tx_info)
+  by_passwd.reload()
+  return results
@@ -0,0 +1,34 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pysrc.passkit import pbkdf2_hash_password, secret_iterate
+
+# Key derivation and chain heads for many users at once, e.g. onboarding.
+# PBKDF2 releases the GIL, so threads scale for the derivation part;
+# the hash chain itself is hashed in 32-byte steps which hold the GIL,
+# hence processes are the default.
+
+def derive_chunk(chunk, iterations_count):
+  result = []
+  for salt, passwd, k in chunk:
+    key = pbkdf2_hash_password(salt, passwd, iterations_count)
+    result.append((key, secret_iterate(key, k)))
+  return result
+
+def split(items, chunksize):
+  return [items[i:i+chunksize] for i in range(0, len(items), chunksize)]
+
+# items: list of (salt, password, k); returns list of (derived key, chain head)
+def derive_batch(items, iterations_count, workers=None, chunksize=None, threads=False):
+  items = list(items)
+  if len(items)==0:
+    return []
+  workers = workers or os.cpu_count() or 1
+  if chunksize is None:
+    chunksize = max(1, -(-len(items)//(workers*4)))
+  chunks = split(items, chunksize)
+  if workers==1:
+    return [r for chunk in chunks for r in derive_chunk(chunk, iterations_count)]
+  Executor = ThreadPoolExecutor if threads else ProcessPoolExecutor
+  with Executor(max_workers=workers) as executor:
+    results = executor.map(derive_chunk, chunks, [iterations_count]*len(chunks))
+    return [r for chunk in results for r in chunk]
@@ -0,0 +1,123 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from . import config
+
+# Persistent cache of algod compile results and PyTeal output.
+# Programs are keyed by TEAL version and SHA-256 of the source and hold
+# the compile response ({"result": base64 bytecode, "hash": address}).
+# PyTeal output is keyed by the program builder, its arguments, the
+# source of the module defining it and the PyTeal version, so editing
+# programs.py or upgrading PyTeal invalidates it.
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+cache_location = os.path.join(root, ".cache", "compile.json")
+
+def teal_version(source):
+  m = re.match(r"\s*#pragma version (\d+)", source)
+  return int(m.group(1)) if m else 1
+
+def program_key(source):
+  return "v%d:%s" % (teal_version(source), hashlib.sha256(source.encode()).hexdigest())
+
+def pyteal_version():
+  from importlib import metadata
+  try:
+    return metadata.version("pyteal")
+  except metadata.PackageNotFoundError:
+    return "unknown"
+
+def file_digest(filename):
+  with open(filename, "rb") as f:
+    return hashlib.sha256(f.read()).hexdigest()
+
+class CompileCache:
+  def __init__(self, location=cache_location, client=None, workers=4):
+    self.location = location
+    self.client = client
+    self.workers = workers
+    self.lock = threading.Lock()
+    self.programs = {}
+    self.teal = {}
+    self.digests = {}
+    self.hits = 0
+    self.misses = 0
+    self.load()
+
+  def load(self):
+    if self.location is None or not os.path.exists(self.location):
+      return
+    try:
+      with open(self.location) as f:
+        d = json.load(f)
+      self.programs = d.get("programs", {})
+      self.teal = d.get("teal", {})
+    except (OSError, ValueError) as e:
+      print("Ignoring compile cache "+self.location+": "+str(e))
+
+  def save(self):
+    if self.location is None:
+      return
+    os.makedirs(os.path.dirname(self.location), exist_ok=True)
+    with self.lock:
+      data = json.dumps({"programs": self.programs, "teal": self.teal}, indent=1)
+    tmp = self.location+".tmp"
+    with open(tmp, "w") as f:
+      f.write(data)
+    os.replace(tmp, self.location)
+
+  def compile(self, source):
+    return self.compile_many([source])[0]
+
+  # Compile responses in the order of sources, misses compiled in parallel
+  def compile_many(self, sources):
+    keys = [program_key(s) for s in sources]
+    with self.lock:
+      missing = {}
+      for key, source in zip(keys, sources):
+        if key not in self.programs:
+          missing[key] = source
+      self.hits += len(sources)-len(missing)
+      self.misses += len(missing)
+    if missing:
+      from multiprocessing.pool import ThreadPool
+      client = self.client or config.algod_client
+      with ThreadPool(min(self.workers, len(missing))) as pool:
+        results = pool.map(client.compile, list(missing.values()))
+      with self.lock:
+        for key, result in zip(missing, results):
+          self.programs[key] = {"result": result["result"], "hash": result["hash"]}
+      self.save()
+    with self.lock:
+      return [dict(self.programs[key]) for key in keys]
+
+  def module_digest(self, module_file):
+    digest = self.digests.get(module_file)
+    if digest is None:
+      digest = file_digest(module_file)
+      self.digests[module_file] = digest
+    return digest
+
+  # TEAL source produced by build(), cached under the builder's identity
+  def pyteal(self, module_file, name, args, build):
+    key = hashlib.sha256(json.dumps(
+      [self.module_digest(module_file), pyteal_version(), name, args]
+    ).encode()).hexdigest()
+    with self.lock:
+      teal = self.teal.get(key)
+    if teal is None:
+      teal = build()
+      with self.lock:
+        self.teal[key] = teal
+      self.save()
+    return teal
+
+cache = None
+
+def get_cache():
+  global cache
+  if cache is None:
+    cache = CompileCache()
+  return cache
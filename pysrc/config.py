@@ -1,33 +1,93 @@
-import yaml
 import os
-from pathlib import Path
-from pysrc.account import Account
-from algosdk.v2client import algod, indexer
+import threading
 
-developer = Account().generate()
+# Nothing is read or built on import. The config file, the developer
+# account and the clients are created the first time they are accessed
+# as config.config, config.developer, config.algod_client and
+# config.indexer_client. use_profile("name") (or PASSDAPP_PROFILE)
+# switches to config.name.yml; the default profile is config.yml.
 
-algod_client = None
-indexer_client = None
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+config_location = os.path.join(root, "config.yml")
 
-path = Path(os.path.dirname(__file__))
-config_location = os.path.join(path.parent, "config.yml")
+profile = os.environ.get("PASSDAPP_PROFILE") or None
+loaded = {}
+lock = threading.RLock()
 
-def load_config():
+LAZY = ("config", "developer", "algod_client", "indexer_client")
+
+def config_path(name=None):
+  if name is None:
+    return config_location
+  return os.path.join(root, "config."+name+".yml")
+
+def load_config(name=None):
   try:
-    with open(config_location) as file:
+    import yaml
+    with open(config_path(name or profile)) as file:
       return yaml.full_load(file)
   except:
     return None
 
+# Clients already handed out keep talking to the previous profile; the
+# shared block follower and params provider switch on their next use
+def use_profile(name):
+  global profile
+  with lock:
+    profile = name
+    loaded.clear()
+
+# Sets values directly, e.g. clients of a local node stub
+def use(**values):
+  with lock:
+    loaded.update(values)
+
+def build(name):
+  if name == "config":
+    return load_config()
+  config = get("config")
+  if name == "developer":
+    from pysrc.account import Account
+    if config is None:
+      return Account().generate()
+    return Account().fromDict(config["developer_credentials"])
+  if config is None:
+    return None
+  from pysrc.transport import PooledAlgodClient, PooledIndexerClient
+  configClient = config["client_credentials"]
+  token = dict([
+    [configClient["token_key"], configClient["token_value"]]
+  ])
+  # Optional pool settings, e.g. {pool_size: 16, max_concurrency: 8, retries: 3}
+  transport = config.get("transport") or {}
+  if name == "algod_client":
+    return PooledAlgodClient(configClient["token_value"], configClient["algod_address"], token, **transport)
+  return PooledIndexerClient(configClient["token_value"], configClient["indexer_address"], token, **transport)
+
+def get(name):
+  with lock:
+    if name not in loaded:
+      loaded[name] = build(name)
+    return loaded[name]
+
+def __getattr__(name):
+  if name in LAZY:
+    return get(name)
+  raise AttributeError("module "+__name__+" has no attribute "+name)
+
 # token_key: str, token_value: str, algod_address: str, indexer_address: str
 def gen_config(**client): 
   config = {
     "client_credentials": client,
-    "developer_credentials": developer.toDict()
+    "developer_credentials": get("developer").toDict()
   }  
 
-  with open(config_location, 'w') as f:
+  import yaml
+  with open(config_path(profile), 'w') as f:
     yaml.dump(config, f, default_flow_style=False)
+  with lock:
+    for name in ("config", "algod_client", "indexer_client"):
+      loaded.pop(name, None)
 
 def gen_config_sandbox():
   gen_config(
@@ -44,17 +104,3 @@ def gen_config_purestake(token: str):
     "algod_address": "https://testnet-algorand.api.purestake.io/ps2", 
     "indexer_address": "https://testnet-algorand.api.purestake.io/idx2"
   })
-
-config = load_config()
-
-if config!=None:
-  configClient = config["client_credentials"]
-  algod_address_ps2 = configClient["algod_address"]
-  algod_address_idx2 = configClient["indexer_address"]
-  token = dict([
-    [configClient["token_key"], configClient["token_value"]]
-  ])
-
-  developer = Account().fromDict(config["developer_credentials"])
-  algod_client = algod.AlgodClient(configClient["token_value"], algod_address_ps2, token)
-  indexer_client = indexer.IndexerClient(configClient["token_value"], algod_address_idx2, token)
@@ -0,0 +1,78 @@
+import base64
+import sqlite3
+import threading
+from . import config
+from .search import search_pages
+
+# Local index of setup notes: chain head -> encoded lsig bundle.
+# Built by paging through the app's setup calls from the last indexed
+# round and extended incrementally, so a login is a primary key lookup
+# instead of an indexer note-prefix scan.
+class CredentialIndex:
+  def __init__(self, app_id, path=":memory:", client=None):
+    self.app_id = int(app_id)
+    self.client = client or config.indexer_client
+    self.lock = threading.Lock()
+    self.db = sqlite3.connect(path, check_same_thread=False)
+    self.db.executescript("""
+      CREATE TABLE IF NOT EXISTS creds (
+        app_id INTEGER NOT NULL,
+        prefix BLOB NOT NULL,
+        round INTEGER NOT NULL,
+        bundle BLOB NOT NULL,
+        PRIMARY KEY (app_id, prefix)
+      );
+      CREATE TABLE IF NOT EXISTS progress (
+        app_id INTEGER PRIMARY KEY,
+        round INTEGER NOT NULL
+      );
+    """)
+
+  @property
+  def round(self):
+    with self.lock:
+      row = self.db.execute("SELECT round FROM progress WHERE app_id=?", (self.app_id,)).fetchone()
+    return row[0] if row else None
+
+  def add(self, tx):
+    if "note" not in tx:
+      return False
+    args = tx.get("application-transaction", {}).get("application-args", [])
+    if len(args) < 2 or base64.b64decode(args[0]) != b"setup":
+      return False
+    prefix = base64.b64decode(args[1])
+    note = base64.b64decode(tx["note"])
+    if not note.startswith(prefix):
+      return False
+    self.db.execute(
+      "INSERT OR REPLACE INTO creds (app_id, prefix, round, bundle) VALUES (?, ?, ?, ?)",
+      (self.app_id, prefix, tx.get("confirmed-round", 0), note[len(prefix):])
+    )
+    return True
+
+  def update(self):
+    start = self.round
+    min_round = start+1 if start is not None else None
+    added = 0
+    for page in search_pages(self.client, txn_type="appl", application_id=self.app_id, min_round=min_round):
+      with self.lock:
+        for tx in page.get("transactions", []):
+          added += self.add(tx)
+        current_round = page.get("current-round")
+        if current_round is not None:
+          self.db.execute(
+            "INSERT OR REPLACE INTO progress (app_id, round) VALUES (?, ?)",
+            (self.app_id, current_round)
+          )
+        self.db.commit()
+    return added
+
+  def get(self, prefix):
+    with self.lock:
+      row = self.db.execute(
+        "SELECT bundle FROM creds WHERE app_id=? AND prefix=?", (self.app_id, prefix)
+      ).fetchone()
+    return row[0] if row else None
+
+  def close(self):
+    self.db.close()
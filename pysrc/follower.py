@@ -0,0 +1,206 @@
+import heapq
+import itertools
+import threading
+import time
+import msgpack
+from concurrent.futures import Future
+from algosdk import constants, error
+from . import config
+from .txid import digest, txid_str
+
+def sort_dict(d):
+  return {k: sort_dict(v) if isinstance(v, dict) else v for k, v in sorted(d.items())}
+
+# Transaction ids of a block fetched in msgpack format.
+# Blocks store transactions without genesis hash (and without genesis id
+# when "hgi" is set), so both are restored before hashing.
+def block_txids(block):
+  txids = []
+  for stxn in block.get("txns", []):
+    txn = dict(stxn["txn"])
+    txn["gh"] = block["gh"]
+    if stxn.get("hgi"):
+      txn["gen"] = block["gen"]
+    txids.append(txid_str(digest(constants.txid_prefix, sort_dict(txn))))
+  return txids
+
+# Rounds a transaction can stay valid, the bound for waiters that do
+# not pass the last valid round of their transaction. It is counted from
+# the first round the follower sees after the wait started: last_round
+# is stale while the follower idles.
+MAX_TXN_LIFE = 1000
+
+class Pending:
+  def __init__(self, txid, wait_for_next_round, registered, last_valid):
+    self.txid = txid
+    self.wait_for_next_round = wait_for_next_round
+    self.checked = registered
+    self.last_valid = last_valid
+    self.errors = 0
+    self.visible_round = None
+    self.info = None
+    self.future = Future()
+
+# Follows the chain once for all in-flight transactions.
+# Every new round costs one status_after_block and one block fetch, and
+# each confirmed transaction one pending_transaction_info for its result.
+# Transactions not seen in a block within `fallback_rounds` are polled
+# directly, which also surfaces pool errors. A transaction fails once
+# the chain passes its last valid round, when algod no longer knows it
+# (404) or after `max_errors` failed lookups; the others keep waiting.
+class BlockFollower:
+  def __init__(self, client, fallback_rounds=3, retry_delay=1, max_errors=5):
+    self.client = client
+    self.fallback_rounds = fallback_rounds
+    self.retry_delay = retry_delay
+    self.max_errors = max_errors
+    self.pending = {}
+    self.visible = []
+    self.round_waiters = []
+    self.seq = itertools.count()
+    self.last_round = None
+    self.lock = threading.Lock()
+    self.wakeup = threading.Event()
+    self.thread = None
+
+  def start(self):
+    with self.lock:
+      if self.thread is None:
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+    return self
+
+  def wait_for(self, txid, wait_for_next_round=False, last_valid=None):
+    with self.lock:
+      p = self.pending.get(txid)
+      if p is None:
+        p = Pending(txid, wait_for_next_round, self.last_round, last_valid)
+        self.pending[txid] = p
+    self.start()
+    self.wakeup.set()
+    return p.future
+
+  def wait_for_round(self, round):
+    future = Future()
+    with self.lock:
+      if self.last_round is not None and self.last_round >= round:
+        future.set_result(self.last_round)
+        return future
+      heapq.heappush(self.round_waiters, (round, next(self.seq), future))
+    self.start()
+    self.wakeup.set()
+    return future
+
+  def idle(self):
+    with self.lock:
+      return not self.pending and not self.visible and not self.round_waiters
+
+  def run(self):
+    while True:
+      try:
+        if self.last_round is None or self.idle():
+          self.wakeup.wait()
+          self.wakeup.clear()
+          # Transactions may have landed in the current round already
+          round = self.client.status().get('last-round')
+          self.scan(round)
+          self.advance(round)
+          continue
+        round = self.client.status_after_block(self.last_round).get('last-round')
+        for r in range(self.last_round+1, round+1):
+          self.scan(r)
+        self.advance(round)
+      except Exception as e:
+        print(e)
+        time.sleep(self.retry_delay)
+
+  def scan(self, round):
+    with self.lock:
+      if not self.pending:
+        return
+    block = msgpack.unpackb(
+      self.client.block_info(round, response_format="msgpack"),
+      raw=False, strict_map_key=False
+    )["block"]
+    for txid in block_txids(block):
+      with self.lock:
+        p = self.pending.get(txid)
+      if p is not None:
+        try:
+          self.confirmed(p, self.client.pending_transaction_info(txid))
+        except Exception as e:
+          # Polled again on the next round
+          p.checked = None
+          self.lookup_failed(p, e)
+
+  def confirmed(self, p, info):
+    with self.lock:
+      if self.pending.pop(p.txid, None) is None:
+        return
+      if p.wait_for_next_round:
+        p.info = info
+        p.visible_round = info.get('confirmed-round')+1
+        self.visible.append(p)
+        return
+    p.future.set_result(info)
+
+  def fail(self, p, e):
+    with self.lock:
+      if self.pending.pop(p.txid, None) is None:
+        return
+    p.future.set_exception(e)
+
+  def lookup_failed(self, p, e):
+    p.errors += 1
+    if isinstance(e, error.AlgodHTTPError) and e.code == 404:
+      self.fail(p, Exception("Transaction "+p.txid+" not found: "+str(e)))
+    elif p.errors >= self.max_errors:
+      self.fail(p, e)
+    else:
+      print("Lookup of "+p.txid+" failed: "+str(e))
+
+  def poll(self, round):
+    with self.lock:
+      for p in self.pending.values():
+        if p.last_valid is None:
+          p.last_valid = round+MAX_TXN_LIFE
+      late = [p for p in self.pending.values()
+        if p.checked is None or round-p.checked >= self.fallback_rounds]
+    for p in late:
+      p.checked = round
+      try:
+        info = self.client.pending_transaction_info(p.txid)
+      except Exception as e:
+        self.lookup_failed(p, e)
+        continue
+      if info.get('confirmed-round'):
+        self.confirmed(p, info)
+      elif info.get('pool-error'):
+        self.fail(p, Exception(info.get('pool-error')))
+      elif round > p.last_valid:
+        self.fail(p, TimeoutError("Transaction "+p.txid+" expired after round "+str(p.last_valid)))
+
+  def advance(self, round):
+    self.poll(round)
+    done = []
+    with self.lock:
+      self.last_round = round
+      for p in [p for p in self.visible if p.visible_round <= round]:
+        self.visible.remove(p)
+        done.append((p.future, p.info))
+      while self.round_waiters and self.round_waiters[0][0] <= round:
+        done.append((heapq.heappop(self.round_waiters)[2], round))
+    for future, result in done:
+      future.set_result(result)
+
+follower = None
+
+# Shared follower of the current algod client, replaced when the client
+# changes (config.use_profile, config.use). Waiters of the previous one
+# are still served by it.
+def get_follower():
+  global follower
+  client = config.algod_client
+  if follower is None or follower.client is not client:
+    follower = BlockFollower(client)
+  return follower
@@ -0,0 +1,73 @@
+from .transaction import send_transactions
+from .passkit import StateCheckError, TransactionByPasswd
+from .txid import assign_group_id
+
+MAX_GROUP = 16
+
+# Atomic group with password-authenticated transactions of several users.
+# Each user contributes their transactions followed by their own confirm
+# call; all users' prepare calls go out together one round earlier as a
+# group of their own. Every user keeps their own TransactionByPasswd.
+class GroupComposer:
+  def __init__(self):
+    self.entries = []
+
+  def size(self):
+    return sum([len(txns)+1 for _, txns in self.entries])
+
+  def fits(self, txns):
+    return self.size()+len(txns)+1 <= MAX_GROUP
+
+  def add(self, by_passwd, txns):
+    address = by_passwd.lsigs["address"]
+    if len(txns) == 0:
+      raise ValueError("No transactions to authenticate")
+    if any([b.lsigs["address"] == address for b, _ in self.entries]):
+      raise ValueError("Account "+address+" is already in the group")
+    for txn in txns:
+      if txn.sender != address:
+        raise ValueError("Transaction sender differs from credentials address")
+    if not self.fits(txns):
+      raise ValueError("Group would exceed "+str(MAX_GROUP)+" transactions")
+    self.entries.append((by_passwd, list(txns)))
+    return self
+
+  def build(self, params=None):
+    confirms = []
+    group = []
+    for by_passwd, txns in self.entries:
+      tx_confirm = TransactionByPasswd.gen_tx_confirm(by_passwd, params)
+      group += txns
+      confirms.append((len(group), tx_confirm))
+      group.append(tx_confirm.transaction)
+    assign_group_id(group)
+
+    self.marks = []
+    self.prepares = []
+    self.group = []
+    for (by_passwd, txns), (pos, tx_confirm) in zip(self.entries, confirms):
+      mark = by_passwd.gen_mark(tx_confirm)
+      self.marks.append(mark)
+      self.prepares.append(TransactionByPasswd.gen_tx_prepare(by_passwd, mark, params))
+      self.group += by_passwd.sign_txs(txns, pos)+[tx_confirm]
+    if len(self.prepares) > 1:
+      assign_group_id([p.transaction for p in self.prepares])
+    return self
+
+  def check(self, passed, stage):
+    failed = [b.lsigs["address"] for b, ok in passed if not ok]
+    if failed:
+      raise StateCheckError("Contract state check "+stage+" failed for "+", ".join(failed))
+
+  def send(self):
+    for by_passwd, _ in self.entries:
+      by_passwd.reload()
+    self.check([(b, b.check_mark_before_prepare()) for b, _ in self.entries], "before prepare")
+    self.build()
+    if send_transactions(self.prepares) is None:
+      raise StateCheckError("Prepare group failed")
+    self.check([(b, b.check_mark_after_prepare(m)) for (b, _), m in zip(self.entries, self.marks)], "after prepare")
+    tx_info = send_transactions(self.group)
+    for by_passwd, _ in self.entries:
+      by_passwd.reload()
+    return tx_info
@@ -0,0 +1,84 @@
+import hashlib
+import threading
+from bisect import bisect_right, insort
+from . import metrics
+
+def sha256(h):
+  return hashlib.sha256(h).digest()
+
+def zero(buf):
+  if isinstance(buf, bytearray):
+    buf[:] = bytes(len(buf))
+
+# Hash chain H^i(seed) with checkpoints (pebbles).
+# The protocol walks the chain downwards from the counter, so on every
+# miss we hash forward from the nearest lower checkpoint and leave pebbles
+# at k-d/2, k-d/4, ..., k-1. The next few lower indices are then only a
+# handful of hashes away and a full descent costs O(log k) per step.
+# Checkpoints are kept in bytearrays so wipe() and discard_above() can
+# zero them; get() hands out immutable copies.
+class HashChain:
+  def __init__(self, seed):
+    self.seed = seed
+    self.indices = [0]
+    self.values = {0: seed}
+    self.hashes = 0
+    self.lock = threading.Lock()
+
+  def get(self, k):
+    if k < 0:
+      raise ValueError("Negative chain index")
+    if self.seed is None:
+      raise ValueError("Hash chain was wiped")
+    if k == 0:
+      return bytes(self.seed)
+    with self.lock:
+      return self._get(k)
+
+  def _get(self, k):
+    j = self.indices[bisect_right(self.indices, k)-1]
+    h = bytes(self.values[j])
+    if j == k:
+      return h
+    stops = set()
+    step = k-j
+    while step > 1:
+      step //= 2
+      stops.add(k-step)
+    i = j
+    while i < k:
+      h = sha256(h)
+      i = i+1
+      if i in stops:
+        self.put(i, h)
+    self.hashes += k-j
+    metrics.count("hash_iterations", k-j)
+    return h
+
+  def put(self, i, h):
+    if i in self.values:
+      zero(self.values[i])
+    else:
+      insort(self.indices, i)
+    self.values[i] = bytearray(h)
+
+  # Counter in the contract only decreases, so checkpoints above it
+  # are never needed again.
+  def discard_above(self, k):
+    with self.lock:
+      n = bisect_right(self.indices, max(k, 0))
+      for i in self.indices[n:]:
+        zero(self.values.pop(i))
+      del self.indices[n:]
+
+  # Seed (when it is a bytearray) and checkpoints are zeroed in place
+  def wipe(self):
+    with self.lock:
+      for h in self.values.values():
+        zero(h)
+      self.seed = None
+      self.values.clear()
+      self.indices = [0]
+
+  def __len__(self):
+    return len(self.indices)
@@ -0,0 +1,108 @@
+import base64
+from collections.abc import Mapping
+from algosdk import encoding
+from algosdk.future import transaction
+
+# Compact credential bundle stored in setup notes after the chain head.
+#
+#   magic "PDL", version 1
+#   32 bytes  public key of the account, shared by all lsigs
+#   1 byte    number of lsigs n, in the order of NAMES
+#   n entries of 72 bytes: raw ed25519 signature (64), then big-endian
+#             u16 prefix, suffix, offset, length
+#   body      program bytes
+#
+# The first program is stored whole. The others are delta coded against
+# it: the first `prefix` and last `suffix` bytes of the first program
+# with body[offset:offset+length] in between. The lsig programs differ
+# only in the step name, so most of each program is shared.
+
+MAGIC = b"PDL"
+VERSION = 1
+NAMES = ("prepare", "confirm", "confirmTxn", "cancel")
+HEADER = len(MAGIC)+1+32+1
+ENTRY = 72
+
+def is_compact(data):
+  return bytes(data[:len(MAGIC)]) == MAGIC
+
+def common_prefix(a, b):
+  n = min(len(a), len(b))
+  i = 0
+  while i < n and a[i] == b[i]:
+    i += 1
+  return i
+
+def encode_bundle(lsigs):
+  programs = []
+  sigs = []
+  for name in NAMES:
+    lsig = lsigs[name]
+    if lsig.msig is not None or lsig.sig is None or lsig.args:
+      raise ValueError("Only single-signed lsigs without args can be encoded compactly")
+    programs.append(lsig.logic)
+    sigs.append(base64.b64decode(lsig.sig))
+  base = programs[0]
+  entries = b""
+  body = b""
+  for i, (program, sig) in enumerate(zip(programs, sigs)):
+    prefix = suffix = 0
+    if i > 0:
+      prefix = common_prefix(base, program)
+      limit = min(len(base), len(program))-prefix
+      suffix = min(common_prefix(base[::-1], program[::-1]), limit)
+    middle = program[prefix:len(program)-suffix]
+    entries += sig+b"".join([v.to_bytes(2, "big") for v in (prefix, suffix, len(body), len(middle))])
+    body += middle
+  return MAGIC+bytes([VERSION])+encoding.decode_address(lsigs["address"])+bytes([len(NAMES)])+entries+body
+
+# Read-only view of an encoded bundle. LogicSig objects are built on
+# first access; the note is referenced, not copied.
+class LSigBundle(Mapping):
+  def __init__(self, data):
+    self.data = memoryview(data)
+    if not is_compact(self.data):
+      raise ValueError("Not a compact lsig bundle")
+    if self.data[len(MAGIC)] != VERSION:
+      raise ValueError("Unsupported lsig bundle version "+str(self.data[len(MAGIC)]))
+    count = self.data[HEADER-1]
+    if count != len(NAMES) or len(self.data) < HEADER+count*ENTRY:
+      raise ValueError("Truncated lsig bundle")
+    self.body = HEADER+count*ENTRY
+    self.cache = {}
+
+  def entry(self, i):
+    e = HEADER+i*ENTRY
+    fields = [int.from_bytes(self.data[e+64+2*j:e+66+2*j], "big") for j in range(4)]
+    return self.data[e:e+64], fields
+
+  def program(self, i):
+    _, (prefix, suffix, offset, length) = self.entry(i)
+    start = self.body+offset
+    if start+length > len(self.data):
+      raise ValueError("Truncated lsig bundle")
+    middle = self.data[start:start+length]
+    if i == 0:
+      return bytes(middle)
+    base = self.program(0)
+    return base[:prefix]+bytes(middle)+base[len(base)-suffix:]
+
+  def __getitem__(self, name):
+    if name in self.cache:
+      return self.cache[name]
+    if name == "address":
+      value = encoding.encode_address(bytes(self.data[len(MAGIC)+1:len(MAGIC)+33]))
+    elif name in NAMES:
+      i = NAMES.index(name)
+      sig, _ = self.entry(i)
+      value = transaction.LogicSig.undictify({"l": self.program(i), "sig": bytes(sig)})
+    else:
+      raise KeyError(name)
+    self.cache[name] = value
+    return value
+
+  def __iter__(self):
+    return iter(("address",)+NAMES)
+
+  def __len__(self):
+    return len(NAMES)+1
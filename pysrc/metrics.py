@@ -0,0 +1,212 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# Timing spans and counters for the protocol hot paths.
+# Disabled by default: span() hands out one shared no-op context manager
+# and count()/observe() return after a single attribute check, so the
+# instrumented code pays a method call and nothing else. enable() turns
+# recording on and installs an exporter; PASSDAPP_METRICS=<path> enables
+# the Prometheus text exporter writing to <path> on export().
+#
+# Metrics are keyed by name and an optional tuple of (label, value)
+# pairs, e.g. count("http_calls", labels=(("endpoint", "algod"),)).
+
+SPAN_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+class Histogram:
+  def __init__(self, buckets=SPAN_BUCKETS):
+    self.buckets = list(buckets)
+    self.counts = [0]*(len(self.buckets)+1)
+    self.count = 0
+    self.sum = 0.0
+
+  def observe(self, value):
+    self.counts[bisect_left(self.buckets, value)] += 1
+    self.count += 1
+    self.sum += value
+
+  # Upper bound of the bucket holding quantile q
+  def quantile(self, q):
+    if self.count == 0:
+      return None
+    seen = 0
+    for bound, n in zip(self.buckets+[float("inf")], self.counts):
+      seen += n
+      if seen >= q*self.count:
+        return bound
+
+class NoSpan:
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    return False
+
+NO_SPAN = NoSpan()
+
+# Records its duration as <name>_seconds and, when the block raises,
+# counts <name>_errors
+class Span:
+  __slots__ = ("registry", "name", "labels", "start")
+
+  def __init__(self, registry, name, labels):
+    self.registry = registry
+    self.name = name
+    self.labels = labels
+
+  def __enter__(self):
+    self.start = time.perf_counter()
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    self.registry.observe(self.name, time.perf_counter()-self.start, self.labels)
+    if exc_type is not None:
+      self.registry.count(self.name+"_errors", 1, self.labels)
+    return False
+
+class NullExporter:
+  def export(self, registry):
+    return None
+
+def label_text(labels, extra=()):
+  pairs = list(labels)+list(extra)
+  if not pairs:
+    return ""
+  escape = lambda v: str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+  return "{"+",".join([k+"=\""+escape(v)+"\"" for k, v in pairs])+"}"
+
+# Prometheus text exposition format. export() returns the text and, with
+# a path, replaces the file atomically (node_exporter textfile style);
+# serve() exposes it over HTTP for scraping.
+class PrometheusExporter:
+  def __init__(self, path=None, prefix="passdapp_"):
+    self.path = path
+    self.prefix = prefix
+    self.server = None
+
+  def render(self, registry):
+    counters, histograms = registry.snapshot()
+    lines = []
+    for name in sorted(set([n for n, _ in counters])):
+      metric = self.prefix+name+"_total"
+      lines.append("# TYPE "+metric+" counter")
+      for (n, labels), value in sorted(counters.items()):
+        if n == name:
+          lines.append(metric+label_text(labels)+" "+str(value))
+    for name in sorted(set([n for n, _ in histograms])):
+      metric = self.prefix+name+"_seconds"
+      lines.append("# TYPE "+metric+" histogram")
+      for (n, labels), h in sorted(histograms.items(), key=lambda i: i[0]):
+        if n != name:
+          continue
+        seen = 0
+        for bound, c in zip(h.buckets+["+Inf"], h.counts):
+          seen += c
+          lines.append(metric+"_bucket"+label_text(labels, [("le", bound)])+" "+str(seen))
+        lines.append(metric+"_sum"+label_text(labels)+" "+repr(h.sum))
+        lines.append(metric+"_count"+label_text(labels)+" "+str(h.count))
+    return "\n".join(lines)+"\n"
+
+  def export(self, registry):
+    text = self.render(registry)
+    if self.path is not None:
+      tmp = self.path+".tmp"
+      with open(tmp, "w") as f:
+        f.write(text)
+      os.replace(tmp, self.path)
+    return text
+
+  def serve(self, registry, port=9464, host="127.0.0.1"):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    exporter = self
+    class Handler(BaseHTTPRequestHandler):
+      def do_GET(self):
+        body = exporter.render(registry).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+      def log_message(self, *args):
+        pass
+    self.server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    return self.server
+
+class Registry:
+  def __init__(self):
+    self.enabled = False
+    self.exporter = NullExporter()
+    self.counters = {}
+    self.histograms = {}
+    self.lock = threading.Lock()
+
+  def enable(self, exporter=None):
+    if exporter is not None:
+      self.exporter = exporter
+    self.enabled = True
+    return self
+
+  def disable(self):
+    self.enabled = False
+    return self
+
+  def span(self, name, labels=()):
+    if not self.enabled:
+      return NO_SPAN
+    return Span(self, name, labels)
+
+  def count(self, name, n=1, labels=()):
+    if not self.enabled:
+      return
+    key = (name, labels)
+    with self.lock:
+      self.counters[key] = self.counters.get(key, 0)+n
+
+  def observe(self, name, seconds, labels=()):
+    if not self.enabled:
+      return
+    key = (name, labels)
+    with self.lock:
+      h = self.histograms.get(key)
+      if h is None:
+        h = self.histograms[key] = Histogram()
+      h.observe(seconds)
+
+  # Observes the time until a future completes, e.g. a confirmation wait
+  def track(self, name, future, labels=()):
+    if not self.enabled:
+      return future
+    start = time.perf_counter()
+    future.add_done_callback(lambda f: self.observe(name, time.perf_counter()-start, labels))
+    return future
+
+  def snapshot(self):
+    with self.lock:
+      histograms = {}
+      for key, h in self.histograms.items():
+        copy = Histogram(h.buckets)
+        copy.counts = list(h.counts)
+        copy.count = h.count
+        copy.sum = h.sum
+        histograms[key] = copy
+      return dict(self.counters), histograms
+
+  def export(self):
+    return self.exporter.export(self)
+
+  def reset(self):
+    with self.lock:
+      self.counters.clear()
+      self.histograms.clear()
+
+registry = Registry()
+if os.environ.get("PASSDAPP_METRICS"):
+  registry.enable(PrometheusExporter(os.environ["PASSDAPP_METRICS"]))
+
+span = registry.span
+count = registry.count
+observe = registry.observe
+track = registry.track
@@ -0,0 +1,117 @@
+import json
+import os
+import threading
+import time
+from . import config
+from .follower import get_follower
+from .search import search_pages
+
+# Delta actions reported by the indexer
+SET_BYTES = 1
+SET_UINT = 2
+DELETE = 3
+
+# In-memory copy of every opted-in account's local state for one app,
+# fed by the app's transactions from the indexer. Values are kept in the
+# algod account_info "key-value" format so Smart can use them directly.
+class StateMirror:
+  def __init__(self, app_id, client=None, path=None, interval=1, max_lag=2):
+    self.app_id = int(app_id)
+    self.client = client or config.indexer_client
+    self.path = path
+    self.interval = interval
+    self.max_lag = max_lag
+    self.states = {}
+    self.round = None
+    self.lock = threading.Lock()
+    self.thread = None
+    self.running = False
+    self.load()
+
+  def load(self):
+    if self.path is None or not os.path.exists(self.path):
+      return
+    with open(self.path) as f:
+      d = json.load(f)
+    if d.get("app_id") == self.app_id:
+      self.states = d["states"]
+      self.round = d["round"]
+
+  def save(self):
+    if self.path is None:
+      return
+    with self.lock:
+      d = {"app_id": self.app_id, "round": self.round, "states": self.states}
+      tmp = self.path+".tmp"
+      with open(tmp, "w") as f:
+        json.dump(d, f)
+    os.replace(tmp, self.path)
+
+  def apply(self, tx):
+    apptx = tx.get("application-transaction", {})
+    if apptx.get("on-completion") in ("closeout", "clear"):
+      self.states.pop(tx["sender"], None)
+    for account in tx.get("local-state-delta", []):
+      state = self.states.setdefault(account["address"], {})
+      for kv in account["delta"]:
+        value = kv["value"]
+        if value["action"] == DELETE:
+          state.pop(kv["key"], None)
+        elif value["action"] == SET_BYTES:
+          state[kv["key"]] = {"type": 1, "bytes": value.get("bytes", ""), "uint": 0}
+        else:
+          state[kv["key"]] = {"type": 2, "bytes": "", "uint": value.get("uint", 0)}
+
+  def sync(self):
+    min_round = self.round+1 if self.round is not None else None
+    current_round = None
+    updated = False
+    for page in search_pages(self.client, application_id=self.app_id, min_round=min_round):
+      with self.lock:
+        for tx in page.get("transactions", []):
+          self.apply(tx)
+          updated = True
+      current_round = page.get("current-round")
+    with self.lock:
+      if current_round is not None:
+        self.round = current_round
+    if updated:
+      self.save()
+    return self.round
+
+  def start(self):
+    if self.thread is None:
+      self.running = True
+      self.thread = threading.Thread(target=self.run, daemon=True)
+      self.thread.start()
+    return self
+
+  def stop(self):
+    self.running = False
+
+  def run(self):
+    while self.running:
+      try:
+        self.sync()
+      except Exception as e:
+        print(e)
+      time.sleep(self.interval)
+
+  # Local state of `address` in account_info format, or None when the
+  # mirror cannot answer. Strict reads require the mirror to have seen
+  # the latest round known to the block follower, other reads to be at
+  # most `max_lag` rounds behind it. Until the follower knows a round
+  # the age of the mirror is unknown (e.g. right after load()), so
+  # nothing is answered.
+  def local_state(self, address, strict=False, app_id=None):
+    with self.lock:
+      if app_id is not None and int(app_id) != self.app_id:
+        return None
+      if self.round is None or address not in self.states:
+        return None
+      tip = get_follower().last_round
+      if tip is None or tip-self.round > self.max_lag:
+        return None
+      if strict and self.round < tip:
+        return None
+      return [{"key": k, "value": dict(v)} for k, v in self.states[address].items()]
@@ -0,0 +1,118 @@
+import copy
+import threading
+import time
+from . import config, metrics
+from . import follower as block_follower
+
+# Shared cache for algod suggested params.
+# The current round is estimated from the time elapsed since the params
+# were fetched; cached params are reused while that estimate stays at
+# least `margin` rounds below their last valid round and they are not
+# older than `max_age` seconds (fee changes). Past half of either limit
+# a background refresh is started and the cached value is still served.
+#
+# Served params start at the last round seen by the block follower, when
+# it runs, with the validity window of the fetched ones, so the same
+# transaction built again in a later round still gets a new txid.
+# Without the follower, or within one round, identical transactions
+# (same sender, receiver, amount and no note or lease) get the same txid
+# and the second one is rejected as a duplicate: give them a note or a
+# lease.
+class ParamsProvider:
+  def __init__(self, client, round_time=4.5, margin=50, max_age=60):
+    self.client = client
+    self.round_time = round_time
+    self.margin = margin
+    self.max_age = max_age
+    self.params = None
+    self.fetched = 0
+    self.lock = threading.Lock()
+    self.refreshing = False
+    self.hits = 0
+    self.misses = 0
+
+  def estimated_round(self, now):
+    return self.params.first+int((now-self.fetched)/self.round_time)
+
+  def rounds_left(self, now):
+    return self.params.last-self.estimated_round(now)
+
+  def usable(self, now):
+    return self.params is not None and \
+      now-self.fetched < self.max_age and \
+      self.rounds_left(now) > self.margin
+
+  def stale(self, now):
+    validity = self.params.last-self.params.first
+    return now-self.fetched > self.max_age/2 or \
+      self.rounds_left(now) < (validity+self.margin)/2
+
+  def fetch(self):
+    metrics.count("params_fetches")
+    return self.store(self.client.suggested_params())
+
+  # Caches a copy, callers may change the fee of the params they got
+  def store(self, params):
+    with self.lock:
+      self.params = copy.copy(params)
+      self.fetched = time.monotonic()
+    return params
+
+  def refresh(self):
+    try:
+      self.fetch()
+    except Exception as e:
+      print(e)
+    finally:
+      with self.lock:
+        self.refreshing = False
+
+  # Copy of the cached params moved to the last seen round
+  def current(self):
+    params = copy.copy(self.params)
+    f = block_follower.follower
+    seen = f.last_round if f is not None and f.client is self.client else None
+    if seen is not None and seen > params.first:
+      params.last += seen-params.first
+      params.first = seen
+    return params
+
+  def get(self):
+    now = time.monotonic()
+    with self.lock:
+      if self.usable(now):
+        self.hits += 1
+        if self.stale(now) and not self.refreshing:
+          self.refreshing = True
+          threading.Thread(target=self.refresh, daemon=True).start()
+        return self.current()
+      self.misses += 1
+    return self.fetch()
+
+  # Cached params without fetching, for callers with their own transport
+  def cached(self):
+    with self.lock:
+      if self.usable(time.monotonic()):
+        self.hits += 1
+        return self.current()
+      self.misses += 1
+    return None
+
+  def invalidate(self):
+    with self.lock:
+      self.params = None
+
+provider = None
+
+# Shared provider of the current algod client, replaced when the client
+# changes (config.use_profile, config.use)
+def get_provider():
+  global provider
+  client = config.algod_client
+  if provider is None or provider.client is not client:
+    provider = ParamsProvider(client)
+  return provider
+
+def suggested_params():
+  with metrics.span("suggested_params"):
+    return get_provider().get()
@@ -1,28 +1,86 @@
 import msgpack
 import base64
-from algosdk import constants, encoding
+import copy
+import hmac
 from algosdk.future import transaction
-from pysrc.config import algod_client, indexer_client
+from pysrc import config
+from pysrc.params import suggested_params
+from pysrc.hashchain import HashChain
+from pysrc.session import Session, sessions
+from pysrc.search import search_pages
+from pysrc.txid import encode_group, txid_raw
+from pysrc.lsigbundle import LSigBundle, encode_bundle, is_compact
+from pysrc import metrics
 import hashlib
 
 def secret_iterate(passwd, k):
-  i = 0
-  h = passwd
-  while i<k:
-    m = hashlib.sha256()
-    m.update(h)
-    h = m.digest()
-    i = i+1
+  with metrics.span("secret_iterate"):
+    i = 0
+    h = passwd
+    while i<k:
+      m = hashlib.sha256()
+      m.update(h)
+      h = m.digest()
+      i = i+1
+  metrics.count("hash_iterations", k)
   return h
 
+def get_chain(passwd):
+  if isinstance(passwd, Session):
+    return passwd.chain
+  return HashChain(passwd)
+
+# Renewing with the same chain would be insecure: every H^i(seed) below
+# the old counter has already been revealed on chain. Each renewal
+# (renewal.RenewalScheduler) starts a new epoch whose seed is derived
+# from the password key; epoch 0 is the password itself. The epoch is
+# not stored anywhere, clients find it from the contract's secret,
+# starting at the last epoch they knew. Renewals stop at EPOCH_LIMIT
+# (see renewal.EpochLimitError), so the search always ends.
+EPOCH_LIMIT = 64
+
+def epoch_seed(passwd, epoch):
+  if epoch == 0:
+    return passwd
+  key = passwd.key if isinstance(passwd, Session) else passwd
+  return hmac.new(bytes(key), b"passdapp-epoch"+epoch.to_bytes(8, 'big'), hashlib.sha256).digest()
+
+# A Session keeps the chains of its epochs, with their checkpoints
+def epoch_chain(passwd, epoch):
+  if epoch == 0:
+    return get_chain(passwd)
+  if isinstance(passwd, Session):
+    chain = passwd.chains.get(epoch)
+    if chain is None:
+      chain = passwd.chains.setdefault(epoch, HashChain(bytearray(epoch_seed(passwd, epoch))))
+    return chain
+  return HashChain(bytearray(epoch_seed(passwd, epoch)))
+
+# (epoch, chain) whose H^counter is the secret, or (None, None).
+# Epochs from `start` up are tried first, renewals only move forward.
+# Chains tried in vain are not kept in the session.
+def find_chain(passwd, counter, secret, start=None, limit=EPOCH_LIMIT):
+  if not counter or not secret:
+    return None, None
+  session = passwd if isinstance(passwd, Session) else None
+  if start is None:
+    start = session.epoch if session is not None else 0
+  start = min(max(start, 0), limit-1)
+  for epoch in list(range(start, limit))+list(range(start-1, -1, -1)):
+    if epoch == 0 or (session is not None and epoch in session.chains):
+      chain = epoch_chain(passwd, epoch)
+    else:
+      chain = HashChain(bytearray(epoch_seed(passwd, epoch)))
+    if chain.get(counter) == secret:
+      if session is not None:
+        chain = session.chains.setdefault(epoch, chain)
+        session.epoch = epoch
+      return epoch, chain
+  return None, None
+
+# Raw 32-byte id, tx.get_txid() is its base32 form
 def get_bytes_txid_raw(tx):
-  txn = encoding.msgpack_encode(tx)
-  to_sign = constants.txid_prefix + base64.b64decode(txn)
-  txid = encoding.checksum(to_sign)
-# Diff vs tx.get_txid() - exclude following lines
-#  txid = base64.b32encode(txid).decode()
-#  return encoding._undo_padding(txid)
-  return txid
+  return txid_raw(tx)
 
 def loadK(smart):
   return smart.get_local_state_int("counter")
@@ -32,6 +90,14 @@ def makeLSig(private, compiled):
   lsig.sign(private)
   return lsig
 
+# Shallow copy of a signed LogicSig with its own args.
+# Args are not covered by the signature, so the program and signature
+# are shared and the original is never modified.
+def lsig_view(lsig, args):
+  view = copy.copy(lsig)
+  view.args = args
+  return view
+
 def make_lsigs(account, d):
   return {
     "address": account.address,
@@ -44,7 +110,10 @@ def make_lsigs(account, d):
 def packLSig(lsig):
   return msgpack.packb(lsig.dictify())
 
-def encodeLSigs(lsigs):
+# compact=False writes the original msgpack format
+def encodeLSigs(lsigs, compact=True):
+  if compact:
+    return encode_bundle(lsigs)
   return msgpack.packb({
     "address": lsigs["address"],
     "prepare": packLSig(lsigs["prepare"]),
@@ -56,7 +125,10 @@ def encodeLSigs(lsigs):
 def unpackLSig(packed):
   return transaction.LogicSig.undictify(msgpack.unpackb(packed, raw=False))
 
+# Reads both the compact bundle and notes written in the msgpack format
 def decodeLSigs(msg):
+  if is_compact(msg):
+    return LSigBundle(msg)
   obj = msgpack.unpackb(msg, raw=False)
   return {
     "address": obj["address"],
@@ -66,22 +138,34 @@ def decodeLSigs(msg):
     "cancel": unpackLSig(obj["cancel"])
   }
 
-def load_lsigs(app_id: int, passwd: str, k: int):
-  note_prefix = secret_iterate(passwd, k)
-  txs = indexer_client.search_transactions(
+def find_setup_note(app_id, note_prefix):
+  tx_note = None
+  for page in search_pages(
+    config.indexer_client,
     txn_type="appl",
     note_prefix=note_prefix,
     application_id=app_id
-  )
+  ):
+    for tx in page["transactions"]:
+      if "note" not in tx:
+        continue;
+      note = base64.b64decode(tx["note"])
+      if note.startswith(note_prefix):
+        tx_note = note
+  return tx_note
 
-  tx_note = None
-  for tx in reversed(txs["transactions"]):
-    if "note" not in tx:
-      continue;
-    tx_note = base64.b64decode(tx["note"])
-    if tx_note.startswith(note_prefix):
-      break
-    tx_note = None
+def load_lsigs(app_id: int, passwd, k: int, index=None):
+  note_prefix = get_chain(passwd).get(k)
+  if index is not None:
+    bundle = index.get(note_prefix)
+    if bundle is None and index.update() > 0:
+      bundle = index.get(note_prefix)
+    if bundle is not None:
+      return decodeLSigs(bundle)
+    print("Credentials not found")
+    return None
+
+  tx_note = find_setup_note(app_id, note_prefix)
   if tx_note is None:
     print("Credentials not found")
     return None
@@ -89,8 +173,8 @@ def load_lsigs(app_id: int, passwd: str, k: int):
   note = tx_note[len(note_prefix):]
   return decodeLSigs(note)
 
-def prepare(appId, lsigs, secret, mark):
-  params = algod_client.suggested_params()
+def prepare(appId, lsigs, secret, mark, params=None):
+  params = params or suggested_params()
   params.fee = 1000
   params.flat_fee = True
   txn = transaction.ApplicationNoOpTxn(
@@ -99,8 +183,8 @@ def prepare(appId, lsigs, secret, mark):
   )
   return transaction.LogicSigTransaction(txn, lsigs["prepare"])
 
-def confirm(appId, lsigs, secret):
-  params = algod_client.suggested_params()
+def confirm(appId, lsigs, secret, params=None):
+  params = params or suggested_params()
   params.fee = 1000
   params.flat_fee = True
   txn = transaction.ApplicationNoOpTxn(
@@ -109,8 +193,8 @@ def confirm(appId, lsigs, secret):
   )
   return transaction.LogicSigTransaction(txn, lsigs["confirm"])
 
-def cancel(appId, lsigs, secret):
-  params = algod_client.suggested_params()
+def cancel(appId, lsigs, secret, params=None):
+  params = params or suggested_params()
   params.fee = 1000
   params.flat_fee = True
   txn = transaction.ApplicationNoOpTxn(
@@ -119,34 +203,73 @@ def cancel(appId, lsigs, secret):
   )
   return transaction.LogicSigTransaction(txn, lsigs["cancel"])
 
+class StateCheckError(Exception):
+  pass
+
 class TransactionByPasswd:  
-  def __init__(self, smart, lsigs, passwd):
+  # local_state, in account_info "key-value" format, skips the initial
+  # read when the state is already known (see sessionstore.restore_user).
+  # epoch is the first chain tried (by default the last one the session
+  # matched), the others are searched when the contract secret does not
+  # match it. A Session is held until close().
+  def __init__(self, smart, lsigs, passwd, local_state=None, epoch=None):
+    if isinstance(passwd, Session):
+      passwd.acquire()
     self.smart = smart
-    smart.read_local_state()
-    self.k = loadK(smart)
+    if local_state is None:
+      smart.read_local_state()
+    else:
+      smart.local_state = local_state
+    self.k = None
     self.lsigs = lsigs
     self.passwd = passwd
+    if epoch is None:
+      epoch = passwd.epoch if isinstance(passwd, Session) else 0
+    self.epoch = epoch
+    self.chain = epoch_chain(passwd, epoch)
+    self.follow_epoch(loadK(smart))
+
+  # The counter only goes up through setup, which may have moved the
+  # contract to the chain of another epoch
+  def follow_epoch(self, k):
+    if k is not None and (self.k is None or k > self.k):
+      secret = self.smart.get_local_state_bytes("secret")
+      if secret and self.chain.get(k) != secret:
+        epoch, chain = find_chain(self.passwd, k, secret, self.epoch)
+        if chain is not None:
+          self.epoch, self.chain = epoch, chain
+    self.k = k
+
+  def close(self):
+    if isinstance(self.passwd, Session):
+      self.passwd.release()
+      self.passwd = None
 
   def reload(self):
     self.smart.read_local_state()
-    self.k = loadK(self.smart)
+    self.follow_epoch(loadK(self.smart))
+    self.chain.discard_above(self.k)
+
+  def secret(self, i):
+    return self.chain.get(i)
 
-  def gen_tx_confirm(self):
+  def gen_tx_confirm(self, params=None):
     return confirm(
       self.smart.id,
       self.lsigs,
-      secret_iterate(self.passwd, self.get_prepare_k()-2)
+      self.secret(self.get_prepare_k()-2),
+      params
     )
 
   def gen_mark(self, confirm_tx: transaction.LogicSigTransaction):
     return get_bytes_txid_raw(confirm_tx.transaction)
   
   def check_mark_before_prepare(self):
-    self.smart.read_local_state()
+    self.smart.read_local_state(strict=True)
     return self.smart.get_local_state_bytes("mark") == b""
 
   def check_mark_after_prepare(self, mark):
-    self.smart.read_local_state()
+    self.smart.read_local_state(strict=True)
     return self.smart.get_local_state_bytes("mark") == mark
 
   def get_prepare_k(self):
@@ -154,30 +277,47 @@ class TransactionByPasswd:
     if dk==0: dk=3
     return self.k-dk
 
-  def gen_tx_prepare(self, mark):
-    secret_prepare = secret_iterate(self.passwd, self.get_prepare_k())
+  def gen_tx_prepare(self, mark, params=None):
+    secret_prepare = self.secret(self.get_prepare_k())
     return prepare(
       self.smart.id,
       self.lsigs,
       secret_prepare, 
-      mark
+      mark,
+      params
     )
   
-  def gen_cancel(self):
-    return cancel(self.smart.id, self.lsigs, secret_iterate(self.passwd, self.k-1))
+  def gen_cancel(self, params=None):
+    return cancel(self.smart.id, self.lsigs, self.secret(self.k-1), params)
 
   def sign_tx(self, tx, confirm_pos):
-    lsig = self.lsigs["confirmTxn"]
-    lsig.args = [(confirm_pos).to_bytes(8, 'big')]
+    lsig = lsig_view(self.lsigs["confirmTxn"], [(confirm_pos).to_bytes(8, 'big')])
     return transaction.LogicSigTransaction(tx, lsig)
 
+  # confirm_pos is either one position for all txs or one per tx
+  def sign_txs(self, txs, confirm_pos):
+    if isinstance(confirm_pos, int):
+      confirm_pos = [confirm_pos]*len(txs)
+    views = {}
+    signed = []
+    for tx, pos in zip(txs, confirm_pos):
+      if pos not in views:
+        views[pos] = lsig_view(self.lsigs["confirmTxn"], [(pos).to_bytes(8, 'big')])
+      signed.append(transaction.LogicSigTransaction(tx, views[pos]))
+    return signed
+
+  # sign_txs already in the wire format, ready for send_raw_transaction
+  def encode_txs(self, txs, confirm_pos):
+    return encode_group(self.sign_txs(txs, confirm_pos))
+
 def sendCancel(smart, lsigs, passwd, k):
   smart.read_local_state()
   k = loadK(smart)
 
-def setup(smart, lsigs, passwd, k):
+# chain defaults to the password's own chain (see epoch_chain)
+def setup(smart, lsigs, passwd, k, chain=None):
   smart.read_local_state()
-  secret = secret_iterate(passwd, k)
+  secret = (chain or get_chain(passwd)).get(k)
   smart.call(
     [
       "setup", 
@@ -189,4 +329,11 @@ def setup(smart, lsigs, passwd, k):
 
 def pbkdf2_hash_password(salt, passwd, iterations_count):  
   salt = base64.b64decode(salt.encode("UTF8"))
-  return hashlib.pbkdf2_hmac('sha256', passwd.encode("UTF8"), salt, iterations_count)
\ No newline at end of file
+  with metrics.span("pbkdf2_hash_password"):
+    key = hashlib.pbkdf2_hmac('sha256', passwd.encode("UTF8"), salt, iterations_count)
+  metrics.count("pbkdf2_iterations", iterations_count)
+  return key
+
+# Acquired session for the password, release() it when done
+def open_session(salt, passwd, iterations_count, cache=sessions):
+  return cache.get(salt, passwd, iterations_count, pbkdf2_hash_password)
@@ -1,10 +1,10 @@
 from .transaction import send_transaction
-from .config import algod_client
+from .params import suggested_params
 from algosdk import transaction
 
 def payTxn(acFromAddr, acToAddr, amount):  
   account_public_key = acFromAddr
-  params = algod_client.suggested_params()
+  params = suggested_params()
 
   gh = params.gh
   first_valid_round = params.first
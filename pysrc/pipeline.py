@@ -0,0 +1,329 @@
+import base64
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from . import config, metrics
+from .follower import get_follower
+from .metrics import Histogram
+from .params import suggested_params
+from .passkit import StateCheckError, prepare, confirm
+from .renewal import EpochLimitError
+from .transaction import last_valid
+from .txid import assign_group_id, encode_group, txid, txid_raw
+
+# Pipelined authentication: the prepare of request n+1 rides in the same
+# group as the confirm of request n,
+#
+#   round r:    prepare_1
+#   round r+1:  [txns_1, confirm_1, prepare_2]
+#   round r+2:  [txns_2, confirm_2, prepare_3]  ...
+#
+# so a user gets one authenticated group per round. prepare_{n+1} stores
+# the txid of confirm_{n+1}, which depends on the whole next group, so a
+# chain of up to `depth` queued requests is built backwards from its
+# last group; requests queued later go into the next chain. Before each
+# group is sent the contract mark is read back and must equal the txid
+# of the confirm in that group, so no secret is revealed on a state we
+# did not set up ourselves. Users are independent and advance together.
+# A failed step counts as an attempt of its request (of the chain's
+# first request for the standalone prepare); the user's chain is rebuilt
+# after retry_delay seconds per attempt and a request fails after
+# max_attempts. A step whose confirmation was missed (timeout, failed
+# lookups) is first checked against the contract: when counter and mark
+# are what the step leaves behind it landed and the chain goes on, so
+# its requests are not paid twice. Otherwise a prepare of ours may still
+# be set; it is cancelled, and a failed cancel is retried the same way.
+
+MAX_TXNS = 14
+
+class Request:
+  def __init__(self, txns):
+    self.txns = txns
+    self.future = Future()
+    self.enqueued = time.monotonic()
+    self.attempts = 0
+
+class UserPipeline:
+  def __init__(self, by_passwd, renewal=None):
+    self.by_passwd = by_passwd
+    self.renewal = renewal
+    self.queue = deque()
+    self.chain = None
+    self.requests = None
+    self.marks = None
+    self.after = None
+    self.pos = 0
+    self.pending = None
+    self.failed = None
+    self.retry_at = 0
+    self.recovering = False
+    self.cancels = 0
+
+  @property
+  def address(self):
+    return self.by_passwd.lsigs["address"]
+
+  def state(self):
+    smart = self.by_passwd.smart
+    smart.read_local_state(strict=True)
+    return smart.get_local_state_int("counter"), smart.get_local_state_bytes("mark")
+
+  # Whether the contract is in the state the step in flight leaves behind
+  def landed(self):
+    try:
+      return self.state() == self.after[self.pos]
+    except Exception as e:
+      print("State check of "+self.address+" failed: "+str(e))
+      return False
+
+  # Prepare/confirm indices of the next n requests from counter k
+  def indices(self, k, n):
+    dk = k%3
+    if dk == 0: dk = 3
+    first = k-dk
+    count = max(0, min(n, (first-2)//3+1))
+    return [(first-3*j, first-3*j-2) for j in range(count)]
+
+  def build(self, depth, params):
+    by_passwd = self.by_passwd
+    indices = self.indices(by_passwd.k, min(depth, len(self.queue)))
+    if not indices:
+      raise StateCheckError("Counter of "+self.address+" is too low, setup is required")
+    requests = [self.queue.popleft() for _ in indices]
+    chain = [None]*len(requests)
+    marks = [None]*len(requests)
+    following = None
+    for j in reversed(range(len(requests))):
+      prepare_k, confirm_k = indices[j]
+      txns = requests[j].txns
+      tx_confirm = confirm(by_passwd.smart.id, by_passwd.lsigs, by_passwd.secret(confirm_k), params)
+      group = txns+[tx_confirm.transaction]
+      if following is not None:
+        group.append(following.transaction)
+      assign_group_id(group)
+      chain[j] = by_passwd.sign_txs(txns, len(txns))+[tx_confirm]+([following] if following else [])
+      marks[j] = txid_raw(tx_confirm.transaction)
+      following = prepare(by_passwd.smart.id, by_passwd.lsigs, by_passwd.secret(prepare_k), marks[j], params)
+    self.chain = [[following]]+chain
+    self.marks = [b""]+marks
+    # Counter and mark after each step: the next prepare, and after the
+    # last confirm the bare counter
+    self.after = [(i[0], mark) for i, mark in zip(indices, marks)]+[(indices[-1][1], b"")]
+    self.requests = [None]+requests
+    self.pos = 0
+
+  def abort(self):
+    if self.requests is not None:
+      rest = [r for r in self.requests[max(self.pos, 1):] if r is not None]
+      self.queue.extendleft(reversed(rest))
+    self.chain = None
+    self.requests = None
+    self.marks = None
+    self.after = None
+    self.pending = None
+
+class PipelineScheduler:
+  def __init__(self, depth=8, client=None, follower=None, max_attempts=2, retry_delay=1.0):
+    if depth < 1:
+      raise ValueError("Pipeline depth must be at least 1")
+    self.depth = depth
+    self.client = client
+    self.follower = follower
+    self.max_attempts = max_attempts
+    self.retry_delay = retry_delay
+    self.users = {}
+    self.lock = threading.Lock()
+    self.latency = Histogram((1, 2, 5, 10, 15, 20, 30, 60, 120))
+    self.sent = 0
+    self.confirmed = 0
+    self.failures = 0
+    self.max_backlog = 0
+
+  def add_user(self, by_passwd, renewal=None):
+    user = UserPipeline(by_passwd, renewal)
+    with self.lock:
+      self.users[user.address] = user
+    return user
+
+  # Future resolved with the confirmation info of the request's group
+  def submit(self, address, txns):
+    if len(txns) == 0 or len(txns) > MAX_TXNS:
+      raise ValueError("Request must contain 1 to "+str(MAX_TXNS)+" transactions")
+    for txn in txns:
+      if txn.sender != address:
+        raise ValueError("Transaction sender differs from credentials address")
+    request = Request(list(txns))
+    with self.lock:
+      user = self.users[address]
+      if user.failed is not None:
+        raise user.failed
+      user.queue.append(request)
+      self.max_backlog = max(self.max_backlog, self.backlog())
+    return request.future
+
+  def backlog(self):
+    return sum([len(u.queue)+len([r for r in (u.requests or [])[u.pos+1:] if r]) for u in self.users.values()])
+
+  def send(self, stxns):
+    client = self.client or config.algod_client
+    follower = self.follower or get_follower()
+    with metrics.span("send"):
+      client.send_raw_transaction(base64.b64encode(encode_group(stxns)))
+    self.sent += 1
+    return metrics.track("confirmation_wait", follower.wait_for(txid(stxns[0].transaction), last_valid=last_valid(stxns)))
+
+  def finish(self, user):
+    if user.chain is None:
+      # Cancel sent by recover()
+      try:
+        user.pending.result()
+        user.pending = None
+        user.recovering = False
+        user.cancels = 0
+        user.by_passwd.reload()
+      except Exception as e:
+        user.pending = None
+        self.cancel_failed(user, e)
+      return
+    try:
+      tx_info = user.pending.result()
+    except Exception as e:
+      if user.landed():
+        print("Confirmation of "+user.address+" missed, the step landed: "+str(e))
+        tx_info = {"txid": txid(user.chain[user.pos][0].transaction)}
+      else:
+        self.step_failed(user, e)
+        return
+    user.pending = None
+    request = user.requests[user.pos]
+    if request is not None:
+      self.confirmed += 1
+      latency = time.monotonic()-request.enqueued
+      self.latency.observe(latency)
+      metrics.observe("pipeline_latency", latency)
+      request.future.set_result(tx_info)
+    user.pos += 1
+    if user.pos == len(user.chain):
+      user.chain = None
+      user.requests = None
+
+  def step_failed(self, user, e):
+    self.failures += 1
+    metrics.count("pipeline_failures")
+    print("Pipeline step failed for "+user.address+": "+str(e))
+    # A failed standalone prepare is charged to the first request of
+    # the chain, so a chain that can never pass is not resent forever
+    request = user.requests[max(user.pos, 1)]
+    user.abort()
+    request.attempts += 1
+    if request.attempts >= self.max_attempts:
+      user.queue.remove(request)
+      request.future.set_exception(e)
+    user.retry_at = time.monotonic()+self.retry_delay*request.attempts
+    user.recovering = True
+    self.recover(user)
+
+  # After a failed step a prepare of ours may still be pending; it is
+  # cancelled and the chain is rebuilt once the cancel is confirmed
+  def recover(self, user):
+    try:
+      user.by_passwd.reload()
+      counter, mark = user.state()
+      if mark == b"":
+        user.recovering = False
+        user.cancels = 0
+        return
+      user.pending = self.send([user.by_passwd.gen_cancel()])
+    except Exception as e:
+      self.cancel_failed(user, e)
+
+  def cancel_failed(self, user, e):
+    user.cancels += 1
+    if user.cancels >= self.max_attempts:
+      self.fail(user, e)
+      return
+    print("Cancel failed for "+user.address+": "+str(e))
+    user.retry_at = time.monotonic()+self.retry_delay*user.cancels
+
+  def fail(self, user, e):
+    user.failed = e if isinstance(e, StateCheckError) else StateCheckError(str(e))
+    user.recovering = False
+    user.abort()
+    while user.queue:
+      user.queue.popleft().future.set_exception(user.failed)
+
+  def advance(self, user):
+    if user.failed is not None:
+      return
+    if user.pending is not None:
+      if not user.pending.done():
+        return
+      self.finish(user)
+      if user.failed is not None or user.pending is not None:
+        return
+    if user.chain is None:
+      if time.monotonic() < user.retry_at:
+        return
+      if user.recovering:
+        self.recover(user)
+        if user.recovering:
+          return
+      if not user.queue:
+        return
+      if user.renewal is not None:
+        try:
+          user.renewal.check()
+        except EpochLimitError as e:
+          self.fail(user, e)
+          return
+      user.by_passwd.reload()
+      try:
+        user.build(self.depth, suggested_params())
+      except StateCheckError as e:
+        self.fail(user, e)
+        return
+    counter, mark = user.state()
+    if mark != user.marks[user.pos]:
+      self.fail(user, StateCheckError("Contract state check failed for "+user.address+". For security reasons you have to do setup again."))
+      return
+    try:
+      user.pending = self.send(user.chain[user.pos])
+    except Exception as e:
+      user.pending = Future()
+      user.pending.set_exception(e)
+
+  # One pass over all users; returns the futures still in flight
+  def step(self):
+    with self.lock:
+      users = list(self.users.values())
+    for user in users:
+      if user.renewal is not None:
+        with user.renewal.lock:
+          self.advance(user)
+      else:
+        self.advance(user)
+    return [u.pending for u in users if u.pending is not None]
+
+  def idle(self):
+    with self.lock:
+      return all([u.pending is None and u.chain is None and not u.queue and not u.recovering for u in self.users.values()])
+
+  def run(self, timeout=10):
+    while not self.idle():
+      pending = self.step()
+      if pending:
+        wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+      else:
+        time.sleep(0.01)
+
+  def stats(self):
+    return {
+      "sent": self.sent,
+      "confirmed": self.confirmed,
+      "failures": self.failures,
+      "backlog": self.backlog(),
+      "max_backlog": self.max_backlog,
+      "latency_p50": self.latency.quantile(0.5),
+      "latency_p99": self.latency.quantile(0.99)
+    }
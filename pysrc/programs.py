@@ -0,0 +1,213 @@
+from algosdk.future import transaction
+from pyteal import Mod, Arg, Add, Minus, TealType, If, Gt, Ge, Seq, Assert, Txn, App, Bytes, Int, Btoi, Return, And, Or, OnComplete, Cond, Global, Gtxn, Sha256, ScratchVar
+
+def approval_program():
+    register = Seq([
+        App.localPut(Int(0), Bytes("counter"), Int(0)),
+        App.localPut(Int(0), Bytes("secret"), Bytes("")),
+        App.localPut(Int(0), Bytes("mark"), Bytes("")),
+        Return(Int(1))
+    ])
+
+    setup = Seq([
+        Assert(Txn.application_args.length() == Int(3)),
+        App.localPut(Int(0), Bytes("secret"), Txn.application_args[1]),
+        App.localPut(Int(0), Bytes("counter"), Btoi(Txn.application_args[2])),
+        App.localPut(Int(0), Bytes("mark"), Bytes("")),
+        Return(Int(1))
+    ])
+
+    hash_secret = ScratchVar(TealType.bytes)
+    prepare = Seq([
+        Assert(Txn.application_args.length() == Int(3)),
+        
+        # Check if app is in wait_prepare state
+        Assert(Bytes("")==App.localGet(Int(0), Bytes("mark"))),
+        
+        # After a secret is acquired counter must be equal to 3*k
+        hash_secret.store(Sha256(Txn.application_args[1])),
+        App.localPut(Int(0), Bytes("counter"), App.localGet(Int(0), Bytes("counter"))-Int(1)),
+        If(
+            Mod(App.localGet(Int(0), Bytes("counter")), Int(3)) != Int(0),
+            Seq([
+                hash_secret.store(Sha256(hash_secret.load())),
+                App.localPut(Int(0), Bytes("counter"), App.localGet(Int(0), Bytes("counter"))-Int(1)),
+            ])
+        ),
+        If(
+            Mod(App.localGet(Int(0), Bytes("counter")), Int(3)) != Int(0),
+            Seq([
+                hash_secret.store(Sha256(hash_secret.load())),
+                App.localPut(Int(0), Bytes("counter"), App.localGet(Int(0), Bytes("counter"))-Int(1)),
+            ])
+        ),
+
+        # Assert hash^d(new secret) = secret, where d = old_counter-counter
+        Assert(hash_secret.load()==App.localGet(Int(0), Bytes("secret"))),
+        App.localPut(Int(0), Bytes("secret"), Txn.application_args[1]),
+        App.localPut(Int(0), Bytes("mark"), Txn.application_args[2]),
+        Return(Int(1))
+    ])
+
+    confirm = Seq([
+        Assert(Txn.application_args.length() == Int(2)),
+        Assert(Sha256(Sha256(Txn.application_args[1]))==App.localGet(Int(0), Bytes("secret"))),
+        Assert(Txn.tx_id()==App.localGet(Int(0), Bytes("mark"))),
+        App.localPut(Int(0), Bytes("counter"), App.localGet(Int(0), Bytes("counter"))-Int(2)),
+        App.localPut(Int(0), Bytes("secret"), Txn.application_args[1]),
+        App.localPut(Int(0), Bytes("mark"), Bytes("")),
+        Return(Int(1))
+    ])
+
+    cancel = Seq([
+        Assert(Txn.application_args.length() == Int(2)),
+        Assert(Sha256(Txn.application_args[1])==App.localGet(Int(0), Bytes("secret"))),
+        App.localPut(Int(0), Bytes("counter"), App.localGet(Int(0), Bytes("counter"))-Int(1)),
+        App.localPut(Int(0), Bytes("secret"), Txn.application_args[1]),
+        App.localPut(Int(0), Bytes("mark"), Bytes("")),
+        Return(Int(1))
+    ])
+
+    program = Cond(
+        [Txn.application_id() == Int(0), Return(Int(1))],
+        [Txn.on_completion() == OnComplete.DeleteApplication, Return(Txn.sender() == Global.creator_address())],
+        [Txn.on_completion() == OnComplete.UpdateApplication, Return(Int(0))],
+        [Txn.on_completion() == OnComplete.CloseOut, Return(Int(1))],
+        [Txn.on_completion() == OnComplete.OptIn, register],
+        [Txn.application_args[0] == Bytes("prepare"), prepare],
+        [Txn.application_args[0] == Bytes("setup"), setup],
+        [Txn.application_args[0] == Bytes("confirm"), confirm],
+        [Txn.application_args[0] == Bytes("cancel"), cancel]
+    )
+
+    return {
+        "program": program,
+        "local_schema": transaction.StateSchema(1, 2),
+        "global_schema": transaction.StateSchema(0, 0)
+    }
+
+# Same contract as approval_program() with fewer opcodes per call:
+# local state is read once into scratch slots, the prepare step derives
+# d = ((counter-1) mod 3)+1 with a single Mod, and dispatch checks NoOp
+# calls first, ordered by how often each step is used.
+def approval_program_optimized():
+    register = Seq([
+        App.localPut(Int(0), Bytes("counter"), Int(0)),
+        App.localPut(Int(0), Bytes("secret"), Bytes("")),
+        App.localPut(Int(0), Bytes("mark"), Bytes("")),
+        Return(Int(1))
+    ])
+
+    setup = Seq([
+        Assert(Txn.application_args.length() == Int(3)),
+        App.localPut(Int(0), Bytes("secret"), Txn.application_args[1]),
+        App.localPut(Int(0), Bytes("counter"), Btoi(Txn.application_args[2])),
+        App.localPut(Int(0), Bytes("mark"), Bytes("")),
+        Return(Int(1))
+    ])
+
+    counter = ScratchVar(TealType.uint64)
+    d = ScratchVar(TealType.uint64)
+    hash_secret = ScratchVar(TealType.bytes)
+    prepare = Seq([
+        Assert(Txn.application_args.length() == Int(3)),
+        Assert(Bytes("")==App.localGet(Int(0), Bytes("mark"))),
+        counter.store(App.localGet(Int(0), Bytes("counter"))),
+
+        # Counter goes down by d to the nearest multiple of 3 below it
+        d.store(Mod(counter.load()-Int(1), Int(3))+Int(1)),
+        hash_secret.store(Sha256(Txn.application_args[1])),
+        If(d.load() >= Int(2), hash_secret.store(Sha256(hash_secret.load()))),
+        If(d.load() == Int(3), hash_secret.store(Sha256(hash_secret.load()))),
+
+        Assert(hash_secret.load()==App.localGet(Int(0), Bytes("secret"))),
+        App.localPut(Int(0), Bytes("counter"), counter.load()-d.load()),
+        App.localPut(Int(0), Bytes("secret"), Txn.application_args[1]),
+        App.localPut(Int(0), Bytes("mark"), Txn.application_args[2]),
+        Return(Int(1))
+    ])
+
+    confirm = Seq([
+        Assert(Txn.application_args.length() == Int(2)),
+        Assert(Sha256(Sha256(Txn.application_args[1]))==App.localGet(Int(0), Bytes("secret"))),
+        Assert(Txn.tx_id()==App.localGet(Int(0), Bytes("mark"))),
+        App.localPut(Int(0), Bytes("counter"), App.localGet(Int(0), Bytes("counter"))-Int(2)),
+        App.localPut(Int(0), Bytes("secret"), Txn.application_args[1]),
+        App.localPut(Int(0), Bytes("mark"), Bytes("")),
+        Return(Int(1))
+    ])
+
+    cancel = Seq([
+        Assert(Txn.application_args.length() == Int(2)),
+        Assert(Sha256(Txn.application_args[1])==App.localGet(Int(0), Bytes("secret"))),
+        App.localPut(Int(0), Bytes("counter"), App.localGet(Int(0), Bytes("counter"))-Int(1)),
+        App.localPut(Int(0), Bytes("secret"), Txn.application_args[1]),
+        App.localPut(Int(0), Bytes("mark"), Bytes("")),
+        Return(Int(1))
+    ])
+
+    noop = Cond(
+        [Txn.application_args[0] == Bytes("prepare"), prepare],
+        [Txn.application_args[0] == Bytes("confirm"), confirm],
+        [Txn.application_args[0] == Bytes("cancel"), cancel],
+        [Txn.application_args[0] == Bytes("setup"), setup]
+    )
+
+    program = Cond(
+        [Txn.application_id() == Int(0), Return(Int(1))],
+        [Txn.on_completion() == OnComplete.NoOp, noop],
+        [Txn.on_completion() == OnComplete.OptIn, register],
+        [Txn.on_completion() == OnComplete.CloseOut, Return(Int(1))],
+        [Txn.on_completion() == OnComplete.DeleteApplication, Return(Txn.sender() == Global.creator_address())],
+        [Txn.on_completion() == OnComplete.UpdateApplication, Return(Int(0))]
+    )
+
+    return {
+        "program": program,
+        "local_schema": transaction.StateSchema(1, 2),
+        "global_schema": transaction.StateSchema(0, 0)
+    }
+
+def clear_program():
+    return Int(1)
+
+def prepare_lsig_program(appId):        
+    return And(
+        Txn.fee() <= Int(1000),
+        Txn.application_id() == Int(appId),
+        Txn.on_completion() == OnComplete.NoOp,
+        Txn.application_args[0] == Bytes("prepare")
+    )
+def confirm_lsig_program(appId):
+    return And(
+        Txn.fee() <= Int(1000),
+        Txn.application_id() == Int(appId),
+        Txn.on_completion() == OnComplete.NoOp,
+        Txn.application_args[0] == Bytes("confirm")
+    )
+def cancel_lsig_program(appId):
+    return And(
+        Txn.fee() <= Int(1000),
+        Txn.application_id() == Int(appId),
+        Txn.on_completion() == OnComplete.NoOp,
+        Txn.application_args[0] == Bytes("cancel")
+    )
+def confirm_txn_lsig_program(appId):
+    return Seq([
+        Assert(Txn.rekey_to() == Global.zero_address()),
+        Assert(Txn.fee() <= Int(1000)),
+        Assert(Gtxn[Btoi(Arg(0))].sender() == Txn.sender()),
+        Assert(Gtxn[Btoi(Arg(0))].application_id() == Int(appId)),
+        Assert(Gtxn[Btoi(Arg(0))].on_completion() == OnComplete.NoOp),
+        Return(Gtxn[Btoi(Arg(0))].application_args[0] == Bytes("confirm"))
+    ])
+
+def approval_expression(optimized):
+    return (approval_program_optimized() if optimized else approval_program())["program"]
+
+def app_schema(optimized):
+    d = approval_program_optimized() if optimized else approval_program()
+    return [
+        [d["local_schema"].num_uints, d["local_schema"].num_byte_slices],
+        [d["global_schema"].num_uints, d["global_schema"].num_byte_slices]
+    ]
@@ -0,0 +1,105 @@
+import threading
+from pysrc.passkit import EPOCH_LIMIT, epoch_chain, find_chain, setup
+
+# Epochs (see passkit.epoch_chain): existing setups are epoch 0, every
+# renewal moves the contract to the next one. TransactionByPasswd finds
+# the current epoch from the contract state by itself.
+
+# Raised instead of renewing into an epoch clients would not search;
+# the user has to run setup again with a new password
+class EpochLimitError(Exception):
+  pass
+
+# Epoch whose chain matches the secret stored in the contract, or None
+def find_epoch(smart, passwd, start=None, limit=EPOCH_LIMIT):
+  smart.read_local_state()
+  counter = smart.get_local_state_int("counter")
+  secret = smart.get_local_state_bytes("secret")
+  return find_chain(passwd, counter, secret, start, limit)[0]
+
+# Watches the counter of a TransactionByPasswd and runs setup with the
+# next epoch's chain before it runs out. The new chain head is hashed in
+# the background once the counter falls to precompute_at; setup is sent
+# at threshold when no prepare is pending (mark is empty), or as soon as
+# the counter is too low for another payment. Hold `lock` around
+# prepare/confirm cycles so a renewal never lands between them.
+# The last epoch is EPOCH_LIMIT-1: from `warn_epochs` before it every
+# renewal prints a warning, and renewing past it raises EpochLimitError.
+class RenewalScheduler:
+  def __init__(self, by_passwd, k=1000, threshold=30, precompute_at=None, epoch=None, interval=4.5, warn_epochs=8):
+    self.by_passwd = by_passwd
+    self.smart = by_passwd.smart
+    self.k = k
+    self.threshold = threshold
+    self.precompute_at = precompute_at or 3*threshold
+    self.interval = interval
+    self.warn_epochs = warn_epochs
+    self.epoch = epoch if epoch is not None else find_epoch(self.smart, by_passwd.passwd, by_passwd.epoch)
+    if self.epoch is None:
+      raise ValueError("Contract state does not match any chain of this password")
+    if self.epoch != by_passwd.epoch:
+      by_passwd.epoch = self.epoch
+      by_passwd.chain = epoch_chain(by_passwd.passwd, self.epoch)
+    self.next = None
+    self.worker = None
+    self.thread = None
+    self.lock = threading.RLock()
+    self.stopping = threading.Event()
+    self.renewals = 0
+
+  def precompute(self):
+    if self.epoch+1 >= EPOCH_LIMIT:
+      raise EpochLimitError("Chain of "+self.by_passwd.lsigs["address"]+" cannot be renewed past epoch "+str(self.epoch)+", setup with a new password is required")
+    if self.next is None:
+      self.next = epoch_chain(self.by_passwd.passwd, self.epoch+1)
+      self.worker = threading.Thread(target=self.next.get, args=(self.k,), daemon=True)
+      self.worker.start()
+
+  def renew(self):
+    self.precompute()
+    self.worker.join()
+    setup(self.smart, self.by_passwd.lsigs, self.by_passwd.passwd, self.k, self.next)
+    self.epoch += 1
+    self.by_passwd.epoch = self.epoch
+    self.by_passwd.chain = self.next
+    self.by_passwd.reload()
+    self.next = None
+    self.worker = None
+    self.renewals += 1
+    print("Renewed chain, epoch "+str(self.epoch)+", counter "+str(self.by_passwd.k))
+    if self.epoch >= EPOCH_LIMIT-1-self.warn_epochs:
+      print("Warning: "+str(EPOCH_LIMIT-1-self.epoch)+" renewals left for "+self.by_passwd.lsigs["address"]+", setup with a new password before they run out")
+
+  # Returns True if setup was sent
+  def check(self):
+    with self.lock:
+      self.smart.read_local_state(strict=True)
+      counter = self.smart.get_local_state_int("counter")
+      if counter is None:
+        return False
+      if counter <= self.precompute_at:
+        self.precompute()
+      if counter <= self.threshold and (self.smart.get_local_state_bytes("mark") == b"" or counter < 3):
+        self.renew()
+        return True
+      return False
+
+  def run(self):
+    while not self.stopping.is_set():
+      try:
+        self.check()
+      except Exception as e:
+        print("Renewal check failed: "+str(e))
+      self.stopping.wait(self.interval)
+
+  def start(self):
+    self.stopping.clear()
+    self.thread = threading.Thread(target=self.run, daemon=True)
+    self.thread.start()
+    return self
+
+  def stop(self):
+    self.stopping.set()
+    if self.thread is not None:
+      self.thread.join()
+      self.thread = None
@@ -0,0 +1,10 @@
+# Indexer transaction search following "next-token" until exhausted.
+# Yields response pages, each with its "current-round".
+def search_pages(client, limit=1000, **query):
+  next_page = None
+  while True:
+    page = client.search_transactions(limit=limit, next_page=next_page, **query)
+    yield page
+    next_page = page.get("next-token")
+    if not next_page or len(page.get("transactions", [])) == 0:
+      return
@@ -0,0 +1,139 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from pysrc.hashchain import HashChain
+
+def wipe_key(buf, chains):
+  for chain in list(chains.values()):
+    chain.wipe()
+  buf[:] = bytes(len(buf))
+
+# Derived password key together with its hash chain checkpoints.
+# Can be passed instead of the raw derived password wherever passkit
+# expects one (TransactionByPasswd, load_lsigs, setup). Holders take a
+# reference with acquire() and give it back with release(); once the
+# cache has evicted or expired the session, the last release() wipes the
+# key and checkpoints. A session nobody releases is wiped when it is
+# garbage collected.
+class Session:
+  def __init__(self, key, ttl):
+    self.buf = bytearray(key)
+    self.chain = HashChain(self.buf)
+    # Chains by renewal epoch (see passkit.epoch_chain) and the epoch
+    # last matched against the contract
+    self.chains = {0: self.chain}
+    self.epoch = 0
+    self.expires = time.monotonic()+ttl
+    self.refs = 0
+    self.evicted = False
+    self.lock = threading.Lock()
+    self.finalizer = weakref.finalize(self, wipe_key, self.buf, self.chains)
+
+  @property
+  def key(self):
+    if self.closed:
+      raise ValueError("Session was closed")
+    return bytes(self.buf)
+
+  @property
+  def closed(self):
+    return self.chain.seed is None
+
+  def expired(self, now=None):
+    return (now or time.monotonic()) >= self.expires
+
+  def acquire(self):
+    with self.lock:
+      if self.closed:
+        raise ValueError("Session was closed")
+      self.refs += 1
+    return self
+
+  def release(self):
+    with self.lock:
+      self.refs -= 1
+      if self.refs <= 0 and self.evicted:
+        self.wipe()
+
+  # The cache let go of the session
+  def evict(self):
+    with self.lock:
+      self.evicted = True
+      if self.refs <= 0:
+        self.wipe()
+
+  def wipe(self):
+    self.finalizer()
+
+# Bounded LRU of sessions with absolute TTL. Entries are looked up by
+# HMAC(process secret, salt | password | iterations), so neither the
+# password nor a plain hash of it is kept as a dict key.
+# get() returns the session acquired for the caller, who releases it (a
+# TransactionByPasswd takes its own reference). Evicted and expired
+# sessions are wiped at once when nobody holds them, otherwise on the
+# last release(), so a flow in progress keeps its key. drop() and
+# clear() wipe at once.
+class SessionCache:
+  def __init__(self, max_size=1024, ttl=15*60):
+    self.max_size = max_size
+    self.ttl = ttl
+    self.secret = os.urandom(32)
+    self.entries = OrderedDict()
+    self.lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+
+  def digest(self, salt, passwd, iterations):
+    m = hmac.new(self.secret, digestmod=hashlib.sha256)
+    for part in [salt.encode("UTF8"), passwd.encode("UTF8"), str(iterations).encode()]:
+      m.update(len(part).to_bytes(4, 'big'))
+      m.update(part)
+    return m.digest()
+
+  def get(self, salt, passwd, iterations, derive):
+    id = self.digest(salt, passwd, iterations)
+    with self.lock:
+      self.expire()
+      session = self.entries.get(id)
+      if session is not None and not session.closed:
+        self.entries.move_to_end(id)
+        self.hits += 1
+        return session.acquire()
+      self.misses += 1
+    session = Session(derive(salt, passwd, iterations), self.ttl)
+    with self.lock:
+      old = self.entries.get(id)
+      if old is not None and not old.closed:
+        session.wipe()
+        return old.acquire()
+      self.entries[id] = session.acquire()
+      while len(self.entries) > self.max_size:
+        self.entries.popitem(last=False)[1].evict()
+    return session
+
+  def expire(self):
+    now = time.monotonic()
+    for id in [id for id, s in self.entries.items() if s.expired(now)]:
+      self.entries.pop(id).evict()
+
+  def drop(self, salt, passwd, iterations):
+    id = self.digest(salt, passwd, iterations)
+    with self.lock:
+      session = self.entries.pop(id, None)
+    if session is not None:
+      session.wipe()
+
+  def clear(self):
+    with self.lock:
+      for session in self.entries.values():
+        session.wipe()
+      self.entries.clear()
+
+  def __len__(self):
+    return len(self.entries)
+
+sessions = SessionCache()
@@ -0,0 +1,312 @@
+import base64
+import contextlib
+import fcntl
+import hashlib
+import hmac
+import mmap
+import os
+import threading
+from collections import OrderedDict
+import msgpack
+from nacl.secret import SecretBox
+from nacl.exceptions import CryptoError
+from . import metrics
+
+# On-disk session store, so a restarted worker does not redo PBKDF2,
+# the indexer lookup of its lsigs and the local state read for every
+# active user.
+#
+# Each entry holds the derived password key, the hash chain checkpoints,
+# the encoded lsig bundle, the app id, the last known local state
+# (counter, secret, mark) and the round it was read in. Entries are
+# encrypted with SecretBox under the store key and looked up by
+# HMAC(store key, salt | password | iterations), like SessionCache.
+#
+# The file is an append-only log, memory-mapped for reading:
+#
+#   magic "PDS1"
+#   records: 32-byte id, big-endian u32 length, SecretBox ciphertext
+#            (length 0 marks a deleted id)
+#
+# Opening scans the record headers only; an entry is decrypted when it
+# is looked up. The last record of an id wins, a truncated tail from a
+# crash is ignored. At most `max_entries` are kept, least recently used
+# first out, and a file over `min_compact` bytes is rewritten once dead
+# records take more than `compact_ratio` of it.
+#
+# The store key is `key`, else PASSDAPP_STORE_KEY (base64), else a
+# random key kept in <path>.key with mode 0600.
+#
+# Several processes may open the same store. Every operation holds an
+# flock on <path>.lock, first picks up the records other processes
+# appended (or reopens the file if one of them compacted it) and then
+# appends at the real end of the file.
+
+MAGIC = b"PDS1"
+ID = 32
+HEADER = ID+4
+
+def load_key(path):
+  env = os.environ.get("PASSDAPP_STORE_KEY")
+  if env:
+    return base64.b64decode(env)
+  key_path = path+".key"
+  if os.path.exists(key_path):
+    with open(key_path, "rb") as f:
+      return f.read()
+  key = os.urandom(SecretBox.KEY_SIZE)
+  fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+  with os.fdopen(fd, "wb") as f:
+    f.write(key)
+  return key
+
+class SessionStore:
+  def __init__(self, path, key=None, max_entries=10000, compact_ratio=0.5, min_compact=1<<20):
+    self.path = path
+    key = key or load_key(path)
+    if len(key) != SecretBox.KEY_SIZE:
+      raise ValueError("Store key must be "+str(SecretBox.KEY_SIZE)+" bytes")
+    self.box = SecretBox(key)
+    self.mac_key = hmac.new(key, b"passdapp-session-id", hashlib.sha256).digest()
+    self.max_entries = max_entries
+    self.compact_ratio = compact_ratio
+    self.min_compact = min_compact
+    self.index = OrderedDict()
+    self.lock = threading.Lock()
+    self.map = None
+    self.file = None
+    self.hits = 0
+    self.misses = 0
+    self.lock_file = open(path+".lock", "a+b")
+    with self.locked():
+      self.open()
+
+  # Exclusive over threads and processes
+  @contextlib.contextmanager
+  def locked(self):
+    with self.lock:
+      fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+      try:
+        yield
+      finally:
+        fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+
+  def open(self):
+    if self.map is not None:
+      self.map.close()
+      self.map = None
+    if self.file is not None:
+      self.file.close()
+    if not os.path.exists(self.path) or os.path.getsize(self.path) < len(MAGIC):
+      with open(self.path, "wb") as f:
+        f.write(MAGIC)
+    self.file = open(self.path, "r+b")
+    if self.file.read(len(MAGIC)) != MAGIC:
+      raise ValueError(self.path+" is not a session store")
+    self.index.clear()
+    self.dead = 0
+    self.scan(len(MAGIC))
+
+  # Catches up with the writes of other processes
+  def sync(self):
+    try:
+      replaced = os.stat(self.path).st_ino != os.fstat(self.file.fileno()).st_ino
+    except FileNotFoundError:
+      replaced = True
+    if replaced:
+      self.open()
+    elif os.fstat(self.file.fileno()).st_size != self.size:
+      self.scan(self.size)
+
+  # Indexes the records from `pos` on
+  def scan(self, pos):
+    self.remap()
+    size = len(self.map)
+    while pos+HEADER <= size:
+      id = bytes(self.map[pos:pos+ID])
+      length = int.from_bytes(self.map[pos+ID:pos+HEADER], "big")
+      if pos+HEADER+length > size:
+        break
+      old = self.index.pop(id, None)
+      if old is not None:
+        self.dead += HEADER+old[1]
+      if length == 0:
+        self.dead += HEADER
+      else:
+        self.index[id] = (pos+HEADER, length)
+      pos += HEADER+length
+    # Drop a partially written record
+    if pos < size:
+      self.map.close()
+      self.map = None
+      self.file.truncate(pos)
+      self.remap()
+    self.size = pos
+
+  def remap(self):
+    if self.map is not None:
+      self.map.close()
+    self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+  def id(self, salt, passwd, iterations):
+    m = hmac.new(self.mac_key, digestmod=hashlib.sha256)
+    for part in [salt.encode("UTF8"), passwd.encode("UTF8"), str(iterations).encode()]:
+      m.update(len(part).to_bytes(4, 'big'))
+      m.update(part)
+    return m.digest()
+
+  def append(self, id, data):
+    self.file.seek(0, os.SEEK_END)
+    offset = self.file.tell()+HEADER
+    self.file.write(id+len(data).to_bytes(4, "big")+data)
+    self.file.flush()
+    self.size = offset+len(data)
+    return offset
+
+  # Entry dict for the password, or None
+  def get(self, salt, passwd, iterations):
+    id = self.id(salt, passwd, iterations)
+    with self.locked():
+      self.sync()
+      location = self.index.get(id)
+      if location is None:
+        self.misses += 1
+        metrics.count("session_store", 1, (("result", "miss"),))
+        return None
+      offset, length = location
+      if offset+length > len(self.map):
+        self.remap()
+      data = bytes(self.map[offset:offset+length])
+      try:
+        entry = msgpack.unpackb(self.box.decrypt(data), raw=False)
+        if entry["id"] != id:
+          raise CryptoError("Entry stored under a different id")
+      except (CryptoError, ValueError, KeyError):
+        self.misses += 1
+        metrics.count("session_store", 1, (("result", "error"),))
+        return None
+      self.index.move_to_end(id)
+      self.hits += 1
+      metrics.count("session_store", 1, (("result", "hit"),))
+      return entry
+
+  def put(self, salt, passwd, iterations, entry):
+    id = self.id(salt, passwd, iterations)
+    data = self.box.encrypt(msgpack.packb(dict(entry, id=id), use_bin_type=True))
+    with self.locked():
+      self.sync()
+      old = self.index.pop(id, None)
+      if old is not None:
+        self.dead += HEADER+old[1]
+      self.index[id] = (self.append(id, data), len(data))
+      while len(self.index) > self.max_entries:
+        self.remove(next(iter(self.index)))
+      if self.size > self.min_compact and self.dead > self.compact_ratio*self.size:
+        self.compact()
+
+  def remove(self, id):
+    old = self.index.pop(id, None)
+    if old is not None:
+      self.append(id, b"")
+      self.dead += 2*HEADER+old[1]
+
+  def drop(self, salt, passwd, iterations):
+    with self.locked():
+      self.sync()
+      self.remove(self.id(salt, passwd, iterations))
+
+  # Rewrites the live records in LRU order; ciphertexts are copied as is
+  def compact(self):
+    tmp = self.path+".tmp"
+    with open(tmp, "wb") as f:
+      f.write(MAGIC)
+      for id, (offset, length) in self.index.items():
+        if offset+length > len(self.map):
+          self.remap()
+        f.write(id+length.to_bytes(4, "big"))
+        f.write(self.map[offset:offset+length])
+      f.flush()
+      os.fsync(f.fileno())
+    os.replace(tmp, self.path)
+    self.open()
+
+  def close(self):
+    with self.lock:
+      if self.map is not None:
+        self.map.close()
+        self.map = None
+      self.file.close()
+      self.lock_file.close()
+
+  def __len__(self):
+    return len(self.index)
+
+def chain_checkpoints(chain):
+  with chain.lock:
+    return [[i, bytes(chain.values[i])] for i in chain.indices if i > 0]
+
+def restore_checkpoints(chain, checkpoints):
+  with chain.lock:
+    for i, h in checkpoints:
+      chain.put(i, h)
+
+# Saves what a restart would otherwise have to recompute or fetch for
+# the user: derived key, checkpoints, lsigs and the last read local state
+def save_user(store, salt, passwd, iterations, session, by_passwd, round=None):
+  from .passkit import encodeLSigs
+  from .follower import get_follower
+  lsigs = by_passwd.lsigs
+  bundle = bytes(lsigs.data) if hasattr(lsigs, "data") else encodeLSigs(lsigs)
+  store.put(salt, passwd, iterations, {
+    "key": session.key,
+    "epoch": by_passwd.epoch,
+    "chain": chain_checkpoints(by_passwd.chain),
+    "lsigs": bundle,
+    "app_id": int(by_passwd.smart.id),
+    "local_state": by_passwd.smart.local_state,
+    "round": round if round is not None else get_follower().last_round
+  })
+
+# TransactionByPasswd for the user, from the store when possible.
+# A stored entry costs no PBKDF2, indexer or account lookup. Its local
+# state is re-read only when it may be outdated in a way that matters: a
+# prepare was pending (mark set), the entry has no round, or it is more
+# than `max_lag` rounds behind the tip. The tip is the follower's round,
+# or asked from algod once when the follower has none yet. Everything
+# that sends re-reads the state anyway before revealing a secret.
+# Without an entry the user is set up the usual way and saved.
+def restore_user(store, smart, salt, passwd, iterations, k, max_lag=1000, cache=None):
+  from .passkit import TransactionByPasswd, decodeLSigs, epoch_chain, load_lsigs, open_session
+  from .follower import get_follower
+  from .session import sessions
+  cache = cache or sessions
+  entry = store.get(salt, passwd, iterations)
+  if entry is not None and entry["app_id"] == int(smart.id):
+    session = cache.get(salt, passwd, iterations, lambda *args: entry["key"])
+    try:
+      epoch = entry.get("epoch", 0)
+      restore_checkpoints(epoch_chain(session, epoch), entry["chain"])
+      by_passwd = TransactionByPasswd(smart, decodeLSigs(entry["lsigs"]), session, entry["local_state"], epoch)
+    finally:
+      session.release()
+    mark = smart.get_local_state_bytes("mark")
+    if mark or entry["round"] is None:
+      by_passwd.reload()
+      return by_passwd
+    follower = get_follower()
+    tip = follower.last_round
+    if tip is None:
+      tip = follower.client.status()["last-round"]
+    if tip-entry["round"] > max_lag:
+      by_passwd.reload()
+    return by_passwd
+  session = open_session(salt, passwd, iterations, cache)
+  try:
+    lsigs = load_lsigs(smart.id, session, k)
+    if lsigs is None:
+      return None
+    by_passwd = TransactionByPasswd(smart, lsigs, session)
+  finally:
+    session.release()
+  save_user(store, salt, passwd, iterations, session, by_passwd)
+  return by_passwd
@@ -0,0 +1,345 @@
+import base64
+import copy
+from nacl.signing import VerifyKey
+from nacl.exceptions import BadSignatureError
+from algosdk import constants, encoding
+from algosdk.future import transaction
+from .teal import Context, evaluate, SIGNATURE, ZERO_ADDRESS
+from .assembler import assemble, disassemble
+from .passkit import get_bytes_txid_raw
+from .txid import calculate_group_id, txid_str
+
+# In-process ledger stand-in for the PassDApp protocol.
+# Groups are checked the way algod does for the parts the protocol uses:
+# group ids, validity rounds, signatures and logic signatures, app calls
+# against per-account local state. Balances and assets are not modelled.
+# Accepted groups are applied at once and confirmed with the next
+# advance(), so a group may depend on one submitted earlier in the round.
+
+TYPE_ENUM = {"pay": 1, "keyreg": 2, "acfg": 3, "axfer": 4, "afrz": 5, "appl": 6}
+
+NOOP = 0
+OPT_IN = 1
+CLOSE_OUT = 2
+CLEAR_STATE = 3
+UPDATE = 4
+DELETE = 5
+
+MAX_GROUP = 16
+
+class Rejected(Exception):
+  def __init__(self, reason, index=None, txid=None):
+    super().__init__(reason if index is None else "transaction %d (%s): %s" % (index, txid, reason))
+    self.reason = reason
+    self.index = index
+    self.txid = txid
+
+class App:
+  def __init__(self, app_id, creator, approval, clear):
+    self.id = app_id
+    self.creator = creator
+    self.approval = approval
+    self.clear = clear
+
+# Zero fields are omitted on the wire, so decoded transactions have None
+def teal_txn(txn, txid):
+  d = {
+    "Sender": encoding.decode_address(txn.sender),
+    "Fee": txn.fee,
+    "FirstValid": txn.first_valid_round,
+    "LastValid": txn.last_valid_round,
+    "Note": txn.note or b"",
+    "Lease": txn.lease or b"",
+    "TxID": txid,
+    "Type": txn.type.encode(),
+    "TypeEnum": TYPE_ENUM.get(txn.type, 0),
+    "RekeyTo": encoding.decode_address(txn.rekey_to) if txn.rekey_to else ZERO_ADDRESS
+  }
+  if txn.type == "pay":
+    d["Receiver"] = encoding.decode_address(txn.receiver)
+    d["Amount"] = txn.amt or 0
+    if txn.close_remainder_to:
+      d["CloseRemainderTo"] = encoding.decode_address(txn.close_remainder_to)
+  if txn.type == "appl":
+    d["ApplicationID"] = txn.index or 0
+    d["OnCompletion"] = int(txn.on_complete or 0)
+    d["ApplicationArgs"] = list(txn.app_args or [])
+    d["Accounts"] = [encoding.decode_address(a) for a in txn.accounts or []]
+    d["ApprovalProgram"] = txn.approval_program or b""
+    d["ClearStateProgram"] = txn.clear_program or b""
+  return d
+
+# Group id as algod computes it: over the transactions without their group field
+def group_id(txns):
+  ungrouped = []
+  for txn in txns:
+    txn = copy.copy(txn)
+    txn.group = None
+    ungrouped.append(txn)
+  return calculate_group_id(ungrouped)
+
+def kv_value(v):
+  if isinstance(v, int):
+    return {"type": 2, "bytes": "", "uint": v}
+  return {"type": 1, "bytes": base64.b64encode(v).decode(), "uint": 0}
+
+def key_value(state):
+  return [{"key": base64.b64encode(k).decode(), "value": kv_value(v)} for k, v in state.items()]
+
+def state_delta(before, after):
+  delta = []
+  for k, v in after.items():
+    if before.get(k) != v or k not in before:
+      value = kv_value(v)
+      if value["type"] == 1:
+        delta.append({"key": base64.b64encode(k).decode(), "value": {"action": 1, "bytes": value["bytes"]}})
+      else:
+        delta.append({"key": base64.b64encode(k).decode(), "value": {"action": 2, "uint": value["uint"]}})
+  for k in before:
+    if k not in after:
+      delta.append({"key": base64.b64encode(k).decode(), "value": {"action": 3}})
+  return delta
+
+# Local state of one app as seen by a group being evaluated:
+# reads fall through to the ledger, writes stay in the overlay.
+class LocalView:
+  def __init__(self, ledger, overlay, app_id):
+    self.ledger = ledger
+    self.overlay = overlay
+    self.app_id = app_id
+
+  def get(self, address):
+    key = (address, self.app_id)
+    if key in self.overlay:
+      return self.overlay[key]
+    return self.ledger.local.get(address, {}).get(self.app_id)
+
+  def __contains__(self, address):
+    return self.get(address) is not None
+
+  def __getitem__(self, address):
+    key = (address, self.app_id)
+    if key not in self.overlay:
+      state = self.get(address)
+      self.overlay[key] = dict(state) if state is not None else None
+    return self.overlay[key]
+
+  def set(self, address, state):
+    self.overlay[(address, self.app_id)] = state
+
+class Ledger:
+  def __init__(self, genesis_id="sim-v1", genesis_hash=None, verify_signatures=True, round=1):
+    self.genesis_id = genesis_id
+    self.genesis_hash = genesis_hash or base64.b64encode(b"passdapp-simulator".ljust(32, b"\0")).decode()
+    self.verify_signatures = verify_signatures
+    self.round = round
+    self.apps = {}
+    self.local = {}
+    self.txns = {}
+    self.pool = []
+    self.blocks = {}
+    self.programs = {}
+    self.verified = set()
+    self.next_app_id = 1
+
+  def suggested_params(self):
+    return transaction.SuggestedParams(
+      0, self.round, self.round+1000, self.genesis_hash, self.genesis_id,
+      False, "simulator", 1000
+    )
+
+  def program(self, code):
+    p = self.programs.get(code)
+    if p is None:
+      p = disassemble(code)
+      self.programs[code] = p
+    return p
+
+  def verify_signature(self, stxn, msg_prefix, message, signature, signer):
+    key = (message, signature, signer)
+    if key in self.verified:
+      return
+    try:
+      VerifyKey(encoding.decode_address(signer)).verify(msg_prefix+message, base64.b64decode(signature))
+    except BadSignatureError:
+      raise Rejected("signature validation failed")
+    self.verified.add(key)
+
+  def check_auth(self, stxn, group, i):
+    txn = stxn.transaction
+    if isinstance(stxn, transaction.LogicSigTransaction):
+      lsig = stxn.lsig
+      if lsig.sig:
+        if self.verify_signatures:
+          self.verify_signature(stxn, b"Program", lsig.logic, lsig.sig, txn.sender)
+      elif lsig.msig:
+        raise Rejected("multisig logic signatures are not supported")
+      elif encoding.encode_address(encoding.checksum(b"Program"+lsig.logic)) != txn.sender:
+        raise Rejected("logic signature does not match sender")
+      ctx = Context(group[i], group, i, lsig.args or [], round=self.round, mode=SIGNATURE)
+      result = evaluate(self.program(lsig.logic), ctx)
+      if not result.approved:
+        raise Rejected("logic signature rejected: "+str(result.error))
+    elif isinstance(stxn, transaction.SignedTransaction):
+      if self.verify_signatures:
+        signer = stxn.authorizing_address or txn.sender
+        message = base64.b64decode(encoding.msgpack_encode(txn))
+        self.verify_signature(stxn, constants.txid_prefix, message, stxn.signature, signer)
+    else:
+      raise Rejected("unsupported signed transaction type")
+
+  def app_call(self, group, i, overlay, created):
+    t = group[i]
+    sender = t["Sender"]
+    app_id = t["ApplicationID"]
+    on_complete = t["OnCompletion"]
+    if app_id == 0:
+      app = App(self.next_app_id+len(created), sender, self.program(t["ApprovalProgram"]), self.program(t["ClearStateProgram"]))
+      created.append(app)
+      ctx = Context(t, group, i, local=LocalView(self, overlay, app.id), app_id=0, creator=sender, round=self.round)
+      result = evaluate(app.approval, ctx)
+      if not result.approved:
+        raise Rejected("application create rejected: "+str(result.error))
+      return app.id, []
+    app = self.apps.get(app_id)
+    if app is None:
+      raise Rejected("application does not exist")
+    view = LocalView(self, overlay, app_id)
+    accounts = [sender]+t.get("Accounts", [])
+    before = {a: dict(view.get(a) or {}) for a in accounts}
+    if on_complete == CLEAR_STATE:
+      evaluate(app.clear, Context(t, group, i, local=view, app_id=app_id, creator=app.creator, round=self.round))
+      view.set(sender, None)
+    else:
+      if on_complete == OPT_IN:
+        if sender in view:
+          raise Rejected("account already opted in to app")
+        view.set(sender, {})
+      result = evaluate(app.approval, Context(t, group, i, local=view, app_id=app_id, creator=app.creator, round=self.round))
+      if not result.approved:
+        raise Rejected("application call rejected: "+str(result.error))
+      if on_complete == CLOSE_OUT:
+        view.set(sender, None)
+    delta = []
+    for a in accounts:
+      d = state_delta(before[a], view.get(a) or {})
+      if d:
+        delta.append({"address": encoding.encode_address(a), "delta": d})
+    return app_id, delta
+
+  def evaluate_group(self, stxns):
+    if len(stxns) == 0 or len(stxns) > MAX_GROUP:
+      raise Rejected("group size must be 1 to "+str(MAX_GROUP))
+    txns = [s.transaction for s in stxns]
+    raw_ids = [get_bytes_txid_raw(t) for t in txns]
+    ids = [txid_str(r) for r in raw_ids]
+    if len(txns) > 1:
+      gid = group_id(txns)
+      if any([t.group != gid for t in txns]):
+        raise Rejected("incomplete group or wrong group id")
+    elif txns[0].group:
+      raise Rejected("incomplete group or wrong group id", 0, ids[0])
+    group = [teal_txn(t, r) for t, r in zip(txns, raw_ids)]
+    overlay = {}
+    created = []
+    deleted = []
+    results = []
+    for i, (stxn, t) in enumerate(zip(stxns, txns)):
+      try:
+        if ids[i] in self.txns:
+          raise Rejected("transaction already in ledger")
+        if not (t.first_valid_round <= self.round+1 <= t.last_valid_round):
+          raise Rejected("transaction is not valid in round "+str(self.round+1))
+        if t.genesis_hash != self.genesis_hash:
+          raise Rejected("genesis hash mismatch")
+        self.check_auth(stxn, group, i)
+        info = {"pool-error": "", "txn": {"txn": {"type": t.type, "snd": t.sender}}}
+        if t.type == "appl":
+          app_id, delta = self.app_call(group, i, overlay, created)
+          info["txn"]["txn"]["apid"] = app_id
+          if not t.index:
+            info["application-index"] = app_id
+          if delta:
+            info["local-state-delta"] = delta
+          if t.on_complete == DELETE:
+            deleted.append(app_id)
+        results.append(info)
+      except Rejected as e:
+        raise Rejected(e.reason, i, ids[i])
+    return ids, results, overlay, created, deleted
+
+  # Raises Rejected without changing the ledger if the group is invalid
+  def submit(self, stxns):
+    ids, results, overlay, created, deleted = self.evaluate_group(stxns)
+    for (address, app_id), state in overlay.items():
+      states = self.local.setdefault(address, {})
+      if state is None:
+        states.pop(app_id, None)
+      else:
+        states[app_id] = state
+    for app in created:
+      self.apps[app.id] = app
+      self.next_app_id = max(self.next_app_id, app.id+1)
+    for app_id in deleted:
+      self.apps.pop(app_id, None)
+    for txid, info in zip(ids, results):
+      self.txns[txid] = info
+      self.pool.append(txid)
+    return ids[0]
+
+  def check(self, stxns):
+    self.evaluate_group(stxns)
+
+  def advance(self, rounds=1):
+    for _ in range(rounds):
+      self.round += 1
+      for txid in self.pool:
+        self.txns[txid]["confirmed-round"] = self.round
+      self.blocks[self.round] = self.pool
+      self.pool = []
+    return self.round
+
+  def pending_transaction_info(self, txid):
+    return self.txns.get(txid, {"pool-error": "transaction not found"})
+
+  def account_info(self, address):
+    states = self.local.get(encoding.decode_address(address), {})
+    return {
+      "address": address,
+      "apps-local-state": [{"id": app_id, "key-value": key_value(s)} for app_id, s in states.items()]
+    }
+
+  # Same interface as StateMirror, so the ledger can back a Smart object.
+  # Without app_id the account must have opted into a single app.
+  def local_state(self, address, strict=False, app_id=None):
+    states = self.local.get(encoding.decode_address(address), {})
+    if app_id is not None:
+      state = states.get(int(app_id))
+    elif len(states) == 1:
+      state = next(iter(states.values()))
+    else:
+      state = None
+    return key_value(state) if state is not None else None
+
+# Creates PassDApp on the ledger and returns its description in the
+# format of src/dapp.json, with programs assembled locally.
+def deploy(ledger, creator, optimized=False):
+  from .passdapp import get_app, compile_teal
+  app = get_app(optimized)
+  txn = transaction.ApplicationCreateTxn(
+    creator.address, ledger.suggested_params(), transaction.OnComplete.NoOpOC.real,
+    assemble(app["approval_program"]), assemble(app["clear_program"]),
+    app["global_schema"], app["local_schema"]
+  )
+  txid = ledger.submit([txn.sign(creator.private)])
+  ledger.advance()
+  app_id = ledger.pending_transaction_info(txid)["application-index"]
+  def compiled(name):
+    return base64.b64encode(assemble(compile_teal(name, "Signature", app_id))).decode()
+  return {
+    "appId": app_id,
+    "prepare": compiled("prepare_lsig_program"),
+    "confirm": compiled("confirm_lsig_program"),
+    "confirmTxn": compiled("confirm_txn_lsig_program"),
+    "cancel": compiled("cancel_lsig_program")
+  }
@@ -2,7 +2,9 @@ import base64
 
 from algosdk.future import transaction
 from .transaction import send_transaction
-from .config import algod_client
+from . import config, metrics
+from .params import suggested_params
+from .compile_cache import get_cache
 
 class Smart:
   def __init__(self, **param):
@@ -22,11 +24,12 @@ class Smart:
     self.set_one("clear_program", param)
     self.set_one("global_schema", param)
     self.set_one("local_schema", param)
+    self.set_one("mirror", param)
     return self
   def create(self):
     sender = self.account['sender']
     on_complete = transaction.OnComplete.NoOpOC.real
-    params = algod_client.suggested_params()
+    params = suggested_params()
     params.fee = 1000
     params.flat_fee = True
     txn = transaction.ApplicationCreateTxn(
@@ -43,7 +46,7 @@ class Smart:
     return self
   def update(self):
     sender = self.account['sender']
-    params = algod_client.suggested_params()
+    params = suggested_params()
     params.fee = 1000
     params.flat_fee = True
     txn = transaction.ApplicationUpdateTxn(
@@ -57,7 +60,7 @@ class Smart:
     return self
   def delete(self):
     sender = self.account['sender']
-    params = algod_client.suggested_params()
+    params = suggested_params()
     params.fee = 1000
     params.flat_fee = True
     txn = transaction.ApplicationDeleteTxn(
@@ -68,7 +71,7 @@ class Smart:
     print('Deleted application ID '+str(pxt["txn"]["txn"]["apid"]))
   def close_out(self):
     sender = self.account['sender']
-    params = algod_client.suggested_params()
+    params = suggested_params()
     params.fee = 1000
     params.flat_fee = True
     txn = transaction.ApplicationCloseOutTxn(
@@ -79,7 +82,7 @@ class Smart:
     print('CloseOut application ID '+str(pxt["txn"]["txn"]["apid"]))
   def clear(self):
     sender = self.account['sender']
-    params = algod_client.suggested_params()
+    params = suggested_params()
     params.fee = 1000
     params.flat_fee = True
     txn = transaction.ApplicationClearStateTxn(
@@ -90,7 +93,7 @@ class Smart:
     print('Cleared application ID '+str(pxt["txn"]["txn"]["apid"]))
   def opt_in(self):
     sender = self.account['sender']
-    params = algod_client.suggested_params()
+    params = suggested_params()
     params.fee = 1000
     params.flat_fee = True
     txn = transaction.ApplicationOptInTxn(
@@ -102,7 +105,7 @@ class Smart:
     return self
   def call(self, app_args, note):
     sender = self.account['sender']
-    params = algod_client.suggested_params()
+    params = suggested_params()
     params.fee = 1000
     params.flat_fee = True
     txn = transaction.ApplicationNoOpTxn(
@@ -135,25 +138,38 @@ class Smart:
     state = self.get_local_state(key)
     if state is None: return None
     return state["bytes"]
-  def read_local_state(self):
-    sender_address = self.param['sender']
-    local_states = algod_client.account_info(sender_address)['apps-local-state']
+  def read_local_state(self, strict=False):
+    with metrics.span("read_local_state"):
+      sender_address = self.param['sender']
+      mirror = self.param.get("mirror")
+      if mirror is not None:
+        local_state = mirror.local_state(sender_address, strict, int(self.id))
+        if local_state is not None:
+          self.local_state = local_state
+          return self
+      return self.set_local_state(config.algod_client.account_info(sender_address))
+  def set_local_state(self, account_info):
+    local_states = account_info['apps-local-state']
     for local_state in local_states :
       if local_state["id"] == int(self.id) :
           self.local_state = local_state["key-value"]
     return self
   def set_app(self, app):
+    approval_program, clear_program = compile_programs([app["approval_program"], app["clear_program"]])
     self.set(
       local_schema = app["local_schema"],
       global_schema = app["global_schema"],
-      approval_program = compile_program(app["approval_program"]),
-      clear_program = compile_program(app["clear_program"])
+      approval_program = approval_program,
+      clear_program = clear_program
     )
     return self
 def compile_program(source_code) :
-  compile_response = algod_client.compile(source_code)
+  compile_response = get_cache().compile(source_code)
   return base64.b64decode(compile_response['result'])
 
+def compile_programs(source_codes) :
+  return [base64.b64decode(r['result']) for r in get_cache().compile_many(source_codes)]
+
 def compile_program_file(source_code_path) :
   fileAddr = open(source_code_path+".teal", "r+")
   source_code = fileAddr.read()
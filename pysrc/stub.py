@@ -0,0 +1,285 @@
+import base64
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import parse
+import msgpack
+from algosdk import encoding
+from .simulator import Ledger, Rejected, deploy
+from .txid import canonical, txn_dict, txid
+
+# Local HTTP stand-in for the algod and indexer endpoints used by pysrc,
+# backed by the simulator ledger. A background thread closes a round
+# every `round_time` seconds; every request is delayed by `latency`
+# seconds to model the network. Calls are counted per endpoint, so a
+# benchmark can report how many requests an operation costs.
+#
+#   algod:   status, wait-for-block-after, blocks (msgpack), pending
+#            transaction info, send, params, accounts, teal/compile
+#   indexer: transaction search by type, app id, note prefix, address
+#            and round range, paged with "next"
+
+ON_COMPLETE = ["noop", "optin", "closeout", "clear", "update", "delete"]
+
+# Ledger that keeps the signed transactions, so blocks and indexer
+# records can be served for them
+class StubLedger(Ledger):
+  def __init__(self, **kwargs):
+    super().__init__(**kwargs)
+    self.signed = {}
+    self.records = []
+
+  def submit(self, stxns):
+    first = super().submit(stxns)
+    for stxn in stxns:
+      self.signed[txid(stxn.transaction)] = stxn
+    return first
+
+  def advance(self, rounds=1):
+    for _ in range(rounds):
+      pool = self.pool
+      super().advance()
+      self.records += [self.record(tx_id) for tx_id in pool if tx_id in self.signed]
+    return self.round
+
+  def record(self, tx_id):
+    txn = self.signed[tx_id].transaction
+    info = self.txns[tx_id]
+    r = {
+      "id": tx_id,
+      "sender": txn.sender,
+      "tx-type": txn.type,
+      "fee": txn.fee,
+      "first-valid": txn.first_valid_round,
+      "last-valid": txn.last_valid_round,
+      "confirmed-round": info["confirmed-round"]
+    }
+    if txn.note:
+      r["note"] = base64.b64encode(txn.note).decode()
+    if txn.group:
+      r["group"] = base64.b64encode(txn.group).decode()
+    if txn.type == "pay":
+      r["payment-transaction"] = {"receiver": txn.receiver, "amount": txn.amt or 0}
+    if txn.type == "appl":
+      r["application-transaction"] = {
+        "application-id": txn.index or 0,
+        "on-completion": ON_COMPLETE[int(txn.on_complete or 0)],
+        "application-args": [base64.b64encode(a).decode() for a in txn.app_args or []],
+        "accounts": list(txn.accounts or [])
+      }
+      if not txn.index:
+        r["created-application-index"] = info["application-index"]
+      if "local-state-delta" in info:
+        r["local-state-delta"] = info["local-state-delta"]
+    return r
+
+  def block(self, round):
+    txns = []
+    for tx_id in self.blocks.get(round, []):
+      if tx_id not in self.signed:
+        continue
+      txn = canonical(txn_dict(self.signed[tx_id].transaction))
+      txn.pop("gh", None)
+      txn.pop("gen", None)
+      txns.append({"txn": txn, "hgi": True})
+    return {"block": {"rnd": round, "gen": self.genesis_id, "gh": base64.b64decode(self.genesis_hash), "txns": txns}}
+
+  def search(self, query):
+    note_prefix = base64.b64decode(query["note-prefix"]) if "note-prefix" in query else None
+    app_id = int(query["application-id"]) if "application-id" in query else None
+    min_round = int(query.get("min-round", 0))
+    max_round = int(query["max-round"]) if "max-round" in query else None
+    address = query.get("address")
+    found = []
+    for r in self.records:
+      if "tx-type" in query and r["tx-type"] != query["tx-type"]:
+        continue
+      if app_id is not None and r.get("application-transaction", {}).get("application-id") != app_id:
+        continue
+      if r["confirmed-round"] < min_round or (max_round is not None and r["confirmed-round"] > max_round):
+        continue
+      if address is not None and address not in (r["sender"], r.get("payment-transaction", {}).get("receiver")):
+        continue
+      if "txid" in query and r["id"] != query["txid"]:
+        continue
+      if note_prefix is not None and not base64.b64decode(r.get("note", "")).startswith(note_prefix):
+        continue
+      found.append(r)
+    return found
+
+class NodeStub:
+  def __init__(self, ledger=None, round_time=0.1, latency=0, host="127.0.0.1"):
+    self.ledger = ledger or StubLedger(verify_signatures=True)
+    self.round_time = round_time
+    self.latency = latency
+    self.host = host
+    self.calls = Counter()
+    self.lock = threading.Lock()
+    self.new_round = threading.Condition(self.lock)
+    self.round_started = time.monotonic()
+    self.running = False
+    self.servers = {}
+
+  def start(self):
+    self.running = True
+    for kind in ("algod", "indexer"):
+      server = ThreadingHTTPServer((self.host, 0), handler(self, kind))
+      server.daemon_threads = True
+      threading.Thread(target=server.serve_forever, daemon=True).start()
+      self.servers[kind] = server
+    threading.Thread(target=self.produce, daemon=True).start()
+    return self
+
+  def stop(self):
+    self.running = False
+    for server in self.servers.values():
+      server.shutdown()
+      server.server_close()
+
+  def address(self, kind):
+    return "http://%s:%d" % (self.host, self.servers[kind].server_address[1])
+
+  def algod_client(self, **transport):
+    from .transport import PooledAlgodClient
+    return PooledAlgodClient("a"*64, self.address("algod"), **transport)
+
+  def indexer_client(self, **transport):
+    from .transport import PooledIndexerClient
+    return PooledIndexerClient("a"*64, self.address("indexer"), **transport)
+
+  def deploy(self, creator, optimized=False):
+    with self.lock:
+      d = deploy(self.ledger, creator, optimized)
+      self.new_round.notify_all()
+    return d
+
+  def produce(self):
+    while self.running:
+      time.sleep(self.round_time)
+      with self.lock:
+        self.ledger.advance()
+        self.round_started = time.monotonic()
+        self.new_round.notify_all()
+
+  def status(self):
+    return {
+      "last-round": self.ledger.round,
+      "last-version": "simulator",
+      "time-since-last-round": int((time.monotonic()-self.round_started)*1e9),
+      "catchup-time": 0
+    }
+
+  def wait_after(self, round, timeout=60):
+    with self.lock:
+      self.new_round.wait_for(lambda: self.ledger.round > round or not self.running, timeout)
+      return self.status()
+
+  def submit(self, raw):
+    stxns = []
+    unpacker = msgpack.Unpacker(raw=False, strict_map_key=False)
+    unpacker.feed(raw)
+    for obj in unpacker:
+      stxns.append(encoding.future_msgpack_decode(base64.b64encode(msgpack.packb(obj, use_bin_type=True)).decode()))
+    with self.lock:
+      return {"txId": self.ledger.submit(stxns)}
+
+  def algod(self, method, path, query, body):
+    parts = path.strip("/").split("/")[1:]
+    if method == "POST" and parts == ["transactions"]:
+      return "send", self.submit(body)
+    if method == "POST" and parts == ["teal", "compile"]:
+      from .assembler import assemble
+      program = assemble(body.decode())
+      return "compile", {
+        "hash": encoding.encode_address(encoding.checksum(b"Program"+program)),
+        "result": base64.b64encode(program).decode()
+      }
+    if parts == ["status"]:
+      with self.lock:
+        return "status", self.status()
+    if parts[:2] == ["status", "wait-for-block-after"]:
+      return "wait", self.wait_after(int(parts[2]))
+    if parts[:1] == ["blocks"]:
+      with self.lock:
+        block = self.ledger.block(int(parts[1]))
+      return "block", msgpack.packb(block, use_bin_type=True)
+    if parts[:2] == ["transactions", "pending"]:
+      with self.lock:
+        return "pending", self.ledger.pending_transaction_info(parts[2])
+    if parts == ["transactions", "params"]:
+      with self.lock:
+        return "params", {
+          "consensus-version": "simulator",
+          "fee": 0,
+          "genesis-hash": self.ledger.genesis_hash,
+          "genesis-id": self.ledger.genesis_id,
+          "last-round": self.ledger.round,
+          "min-fee": 1000
+        }
+    if parts[:1] == ["accounts"]:
+      with self.lock:
+        info = self.ledger.account_info(parts[1])
+        info.update({"amount": 10**12, "round": self.ledger.round, "status": "Offline"})
+      return "account", info
+    return None, None
+
+  def indexer(self, method, path, query, body):
+    parts = path.strip("/").split("/")[1:]
+    if method == "GET" and parts == ["transactions"]:
+      limit = int(query.get("limit", 1000))
+      offset = int(query.get("next", 0))
+      with self.lock:
+        found = self.ledger.search(query)
+        current_round = self.ledger.round
+      page = found[offset:offset+limit]
+      result = {"current-round": current_round, "transactions": page}
+      if offset+limit < len(found):
+        result["next-token"] = str(offset+limit)
+      return "search", result
+    return None, None
+
+def handler(stub, kind):
+  class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def handle_request(self, method):
+      url = parse.urlsplit(self.path)
+      query = dict(parse.parse_qsl(url.query))
+      length = int(self.headers.get("Content-Length") or 0)
+      body = self.rfile.read(length) if length else b""
+      if stub.latency:
+        time.sleep(stub.latency)
+      try:
+        route, result = getattr(stub, kind)(method, url.path, query, body)
+        status = 200 if route is not None else 404
+        if route is None:
+          result = {"message": "unknown endpoint "+url.path}
+      except Rejected as e:
+        route, status, result = "send", 400, {"message": "TransactionPool.Remember: "+str(e)}
+      except Exception as e:
+        route, status, result = "error", 400, {"message": str(e)}
+      with stub.lock:
+        stub.calls[(kind, route or "unknown")] += 1
+      if isinstance(result, bytes):
+        content_type = "application/msgpack"
+      else:
+        content_type = "application/json"
+        result = json.dumps(result).encode()
+      self.send_response(status)
+      self.send_header("Content-Type", content_type)
+      self.send_header("Content-Length", str(len(result)))
+      self.end_headers()
+      self.wfile.write(result)
+
+    def do_GET(self):
+      self.handle_request("GET")
+
+    def do_POST(self):
+      self.handle_request("POST")
+
+    def log_message(self, *args):
+      pass
+  return Handler
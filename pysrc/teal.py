@@ -0,0 +1,340 @@
+import base64
+import hashlib
+
+# Evaluator for the subset of TEAL v3 that PyTeal emits for passdapp.py.
+# Programs are parsed from assembler text; every executed opcode is
+# counted so the same run gives both the result and its cost.
+
+APPLICATION = "Application"
+SIGNATURE = "Signature"
+
+# Budgets for TEAL v3
+BUDGET = {APPLICATION: 700, SIGNATURE: 20000}
+
+COST = {"sha256": 35, "keccak256": 130, "sha512_256": 45, "ed25519verify": 1900}
+
+NAMED_INTS = {
+  "NoOp": 0, "OptIn": 1, "CloseOut": 2, "ClearState": 3, "UpdateApplication": 4, "DeleteApplication": 5,
+  "unknown": 0, "pay": 1, "keyreg": 2, "acfg": 3, "axfer": 4, "afrz": 5, "appl": 6
+}
+
+ZERO_ADDRESS = bytes(32)
+MAX_UINT = 2**64-1
+
+BYTES_FIELDS = {
+  "Sender", "Note", "Lease", "Receiver", "CloseRemainderTo", "VotePK", "SelectionPK", "Type",
+  "AssetSender", "AssetReceiver", "AssetCloseTo", "TxID", "ApprovalProgram", "ClearStateProgram",
+  "RekeyTo", "ConfigAssetMetadataHash", "ConfigAssetName", "ConfigAssetUnitName", "ConfigAssetURL",
+  "ConfigAssetManager", "ConfigAssetReserve", "ConfigAssetFreeze", "ConfigAssetClawback",
+  "FreezeAssetAccount"
+}
+ADDRESS_FIELDS = {
+  "Sender", "Receiver", "CloseRemainderTo", "AssetSender", "AssetReceiver", "AssetCloseTo",
+  "RekeyTo", "ConfigAssetManager", "ConfigAssetReserve", "ConfigAssetFreeze",
+  "ConfigAssetClawback", "FreezeAssetAccount"
+}
+
+class TealError(Exception):
+  def __init__(self, message, pc=None, op=None):
+    super().__init__(message if pc is None else "%s at pc=%d (%s)" % (message, pc, op))
+    self.reason = message
+    self.pc = pc
+    self.op = op
+
+class Program:
+  def __init__(self, ops, version=1, name=None):
+    self.ops = ops
+    self.version = version
+    self.name = name
+
+def parse_bytes(args):
+  if len(args) == 1 and args[0].startswith('"'):
+    return args[0][1:-1].encode("utf-8").decode("unicode_escape").encode("latin-1")
+  if len(args) == 1 and args[0].startswith("0x"):
+    return bytes.fromhex(args[0][2:])
+  if args[0] in ("base64", "b64"):
+    return base64.b64decode(args[1])
+  if args[0] in ("base32", "b32"):
+    return base64.b32decode(args[1]+"="*(-len(args[1]) % 8))
+  raise TealError("Unsupported byte constant "+" ".join(args))
+
+def split_line(line):
+  line = line.strip()
+  if line.startswith('byte "') or line.startswith('pushbytes "'):
+    op, rest = line.split(" ", 1)
+    end = rest.index('"', 1)
+    while rest[end-1] == "\\":
+      end = rest.index('"', end+1)
+    return op, [rest[:end+1]]
+  return line.split()[0], line.split("//")[0].split()[1:]
+
+def parse(source, name=None):
+  ops = []
+  labels = {}
+  version = 1
+  for line in source.splitlines():
+    line = line.strip()
+    if line.startswith("#pragma version"):
+      version = int(line.split()[2])
+      continue
+    if line == "" or line.startswith("//"):
+      continue
+    if line.endswith(":"):
+      labels[line[:-1]] = len(ops)
+      continue
+    op, args = split_line(line)
+    if op in ("int", "pushint"):
+      v = args[0]
+      ops.append(("int", NAMED_INTS[v] if v in NAMED_INTS else int(v, 0)))
+    elif op in ("byte", "pushbytes", "addr"):
+      if op == "addr":
+        from algosdk import encoding
+        ops.append(("byte", encoding.decode_address(args[0])))
+      else:
+        ops.append(("byte", parse_bytes(args)))
+    elif op in ("arg_0", "arg_1", "arg_2", "arg_3"):
+      ops.append(("arg", int(op[-1])))
+    elif op in ("arg", "load", "store"):
+      ops.append((op, int(args[0])))
+    elif op in ("txna", "gtxnsa"):
+      ops.append((op, (args[0], int(args[1]))))
+    elif op == "gtxn":
+      ops.append((op, (int(args[0]), args[1])))
+    elif op == "gtxna":
+      ops.append((op, (int(args[0]), args[1], int(args[2]))))
+    else:
+      ops.append((op, args[0] if args else None))
+  resolved = []
+  for op, arg in ops:
+    if op in ("bnz", "bz", "b"):
+      if arg not in labels:
+        raise TealError("Unknown label "+arg)
+      arg = labels[arg]
+    resolved.append((op, arg))
+  return Program(resolved, version, name)
+
+# Transaction as seen by TEAL: a dict keyed by field names
+# (Sender, Fee, ApplicationID, OnCompletion, ApplicationArgs, TxID, ...).
+def txn_field(txn, field):
+  if field == "NumAppArgs":
+    return len(txn.get("ApplicationArgs", []))
+  if field == "NumAccounts":
+    return len(txn.get("Accounts", []))
+  if field in txn:
+    return txn[field]
+  if field in ADDRESS_FIELDS:
+    return ZERO_ADDRESS
+  if field in BYTES_FIELDS:
+    return b""
+  return 0
+
+def txn_array(txn, field, i):
+  values = txn.get(field, [])
+  if i >= len(values):
+    raise TealError("Invalid "+field+" index "+str(i))
+  return values[i]
+
+# Evaluation context.
+# local: address -> {key: value}, modified in place on success of the
+# caller's choosing; evaluate() works on whatever mapping it is given.
+class Context:
+  def __init__(self, txn, group=None, group_index=0, args=None, local=None,
+               app_id=0, creator=ZERO_ADDRESS, round=0, mode=APPLICATION):
+    self.txn = txn
+    self.group = group if group is not None else [txn]
+    self.group_index = group_index
+    self.args = args or []
+    self.local = local if local is not None else {}
+    self.app_id = app_id
+    self.creator = creator
+    self.round = round
+    self.mode = mode
+
+  def global_field(self, field):
+    values = {
+      "MinTxnFee": 1000, "MinBalance": 100000, "MaxTxnLife": 1000,
+      "ZeroAddress": ZERO_ADDRESS, "GroupSize": len(self.group),
+      "LogicSigVersion": 3, "Round": self.round, "LatestTimestamp": 0,
+      "CurrentApplicationID": self.app_id, "CreatorAddress": self.creator
+    }
+    if field not in values:
+      raise TealError("Unsupported global "+field)
+    return values[field]
+
+  def account(self, index):
+    if index == 0:
+      return self.txn["Sender"]
+    return txn_array(self.txn, "Accounts", index-1)
+
+  def local_state(self, index):
+    address = self.account(index)
+    if address not in self.local:
+      raise TealError("Account is not opted in")
+    return self.local[address]
+
+class Result:
+  def __init__(self, approved, cost, steps, error=None, trace=None):
+    self.approved = approved
+    self.cost = cost
+    self.steps = steps
+    self.error = error
+    self.trace = trace
+
+def as_int(v):
+  if not isinstance(v, int):
+    raise TealError("Expected uint64")
+  return v
+
+def as_bytes(v):
+  if not isinstance(v, bytes):
+    raise TealError("Expected bytes")
+  return v
+
+def nonzero(v):
+  if v == 0:
+    raise TealError("Division by zero")
+  return v
+
+def checked(v):
+  if v < 0 or v > MAX_UINT:
+    raise TealError("Integer overflow")
+  return v
+
+BINARY = {
+  "+": lambda a, b: checked(a+b),
+  "-": lambda a, b: checked(a-b),
+  "*": lambda a, b: checked(a*b),
+  "/": lambda a, b: a//nonzero(b),
+  "%": lambda a, b: a%nonzero(b),
+  "<": lambda a, b: int(a < b),
+  ">": lambda a, b: int(a > b),
+  "<=": lambda a, b: int(a <= b),
+  ">=": lambda a, b: int(a >= b),
+  "&&": lambda a, b: int(bool(a) and bool(b)),
+  "||": lambda a, b: int(bool(a) or bool(b)),
+  "&": lambda a, b: a & b,
+  "|": lambda a, b: a | b,
+  "^": lambda a, b: a ^ b,
+}
+
+HASHES = {
+  "sha256": lambda v: hashlib.sha256(v).digest(),
+  "sha512_256": lambda v: hashlib.new("sha512_256", v).digest(),
+}
+
+def evaluate(program, ctx, trace=False):
+  stack = []
+  scratch = [0]*256
+  pc = 0
+  cost = 0
+  steps = 0
+  budget = BUDGET[ctx.mode]
+  ops = program.ops
+  log = [] if trace else None
+  try:
+    while pc < len(ops):
+      op, arg = ops[pc]
+      cost += COST.get(op, 1)
+      steps += 1
+      if cost > budget:
+        raise TealError("Dynamic cost budget exceeded")
+      if log is not None:
+        log.append((pc, op))
+      pc += 1
+      if op == "int" or op == "byte":
+        stack.append(arg)
+      elif op in BINARY:
+        b = as_int(stack.pop())
+        a = as_int(stack.pop())
+        stack.append(BINARY[op](a, b))
+      elif op == "==" or op == "!=":
+        b = stack.pop()
+        a = stack.pop()
+        if type(a) != type(b):
+          raise TealError("Type mismatch")
+        stack.append(int((a == b) == (op == "==")))
+      elif op == "!":
+        stack.append(int(as_int(stack.pop()) == 0))
+      elif op in HASHES:
+        stack.append(HASHES[op](as_bytes(stack.pop())))
+      elif op == "btoi":
+        v = as_bytes(stack.pop())
+        if len(v) > 8:
+          raise TealError("btoi arg too long")
+        stack.append(int.from_bytes(v, "big"))
+      elif op == "itob":
+        stack.append(as_int(stack.pop()).to_bytes(8, "big"))
+      elif op == "len":
+        stack.append(len(as_bytes(stack.pop())))
+      elif op == "pop":
+        stack.pop()
+      elif op == "dup":
+        stack.append(stack[-1])
+      elif op == "store":
+        scratch[arg] = stack.pop()
+      elif op == "load":
+        stack.append(scratch[arg])
+      elif op == "bnz":
+        if as_int(stack.pop()) != 0:
+          pc = arg
+      elif op == "bz":
+        if as_int(stack.pop()) == 0:
+          pc = arg
+      elif op == "b":
+        pc = arg
+      elif op == "return":
+        v = as_int(stack.pop())
+        return Result(v != 0, cost, steps, None if v else "Rejected", log)
+      elif op == "assert":
+        if as_int(stack.pop()) == 0:
+          raise TealError("Assert failed")
+      elif op == "err":
+        raise TealError("err opcode executed")
+      elif op == "txn":
+        stack.append(txn_field(ctx.txn, arg) if arg != "GroupIndex" else ctx.group_index)
+      elif op == "txna":
+        stack.append(txn_array(ctx.txn, arg[0], arg[1]))
+      elif op == "gtxn":
+        stack.append(txn_field(group_txn(ctx, arg[0]), arg[1]))
+      elif op == "gtxna":
+        stack.append(txn_array(group_txn(ctx, arg[0]), arg[1], arg[2]))
+      elif op == "gtxns":
+        stack.append(txn_field(group_txn(ctx, as_int(stack.pop())), arg))
+      elif op == "gtxnsa":
+        stack.append(txn_array(group_txn(ctx, as_int(stack.pop())), arg[0], arg[1]))
+      elif op == "global":
+        stack.append(ctx.global_field(arg))
+      elif op == "arg":
+        if ctx.mode != SIGNATURE:
+          raise TealError("arg is only allowed in signature mode")
+        if arg >= len(ctx.args):
+          raise TealError("Invalid arg index")
+        stack.append(ctx.args[arg])
+      elif op == "app_local_get":
+        key = as_bytes(stack.pop())
+        state = ctx.local_state(as_int(stack.pop()))
+        stack.append(state.get(key, 0))
+      elif op == "app_local_put":
+        value = stack.pop()
+        key = as_bytes(stack.pop())
+        ctx.local_state(as_int(stack.pop()))[key] = value
+      elif op == "app_local_del":
+        key = as_bytes(stack.pop())
+        ctx.local_state(as_int(stack.pop())).pop(key, None)
+      else:
+        raise TealError("Unsupported opcode "+op)
+  except TealError as e:
+    return Result(False, cost, steps, str(TealError(e.reason, pc-1, ops[pc-1][0])), log)
+  except IndexError:
+    return Result(False, cost, steps, str(TealError("Stack underflow", pc-1, ops[pc-1][0])), log)
+  if len(stack) != 1:
+    return Result(False, cost, steps, "Stack must contain exactly one value", log)
+  v = stack[0]
+  if not isinstance(v, int):
+    return Result(False, cost, steps, "Stack top must be uint64", log)
+  return Result(v != 0, cost, steps, None if v else "Rejected", log)
+
+def group_txn(ctx, i):
+  if i >= len(ctx.group):
+    raise TealError("Group index out of range")
+  return ctx.group[i]
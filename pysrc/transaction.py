@@ -1,40 +1,52 @@
-from .config import algod_client
+import base64
+from . import config, metrics
+from .follower import get_follower
+from .txid import encode_group
 
-def wait_for_confirmation(txid, wait_for_next_round=False):
-  # Wait for the next round to give state time to update
-  last_round = algod_client.status().get('last-round')
-  txinfo = algod_client.pending_transaction_info(txid)
-  while not (txinfo.get('confirmed-round') and txinfo.get('confirmed-round') > 0):
-      print('Waiting for confirmation')
-      last_round += 1
-      algod_client.status_after_block(last_round)
-      txinfo = algod_client.pending_transaction_info(txid)
+def wait_for_confirmation(txid, wait_for_next_round=False, timeout=None, last_valid=None):
+  # With wait_for_next_round the result is delivered once the round after
+  # confirmation is known, so state changes are visible to readers.
+  # The wait fails once the chain passes last_valid (by default
+  # MAX_TXN_LIFE rounds after it started)
+  print('Waiting for confirmation')
+  with metrics.span("confirmation_wait"):
+    txinfo = get_follower().wait_for(txid, wait_for_next_round, last_valid).result(timeout)
   print('Transaction confirmed in round', txinfo.get('confirmed-round'))
-
-  if wait_for_next_round:
-    print('Waiting for current block to be assimilated')
-    last_round = algod_client.status().get('last-round')
-    algod_client.status_after_block(last_round+1)
   return txinfo
 
-def send_transaction(signed_tx, **kwargs):
+# A group can only be confirmed while all of its transactions are valid
+def last_valid(signed_txs):
+  return min([stxn.transaction.last_valid_round for stxn in signed_txs])
+
+# validate is True for the default validator or a Validator instance;
+# a group that would be rejected raises GroupRejected before sending
+def check(signed_txs, validate):
+  if validate:
+    from .validate import validate_group
+    validate_group(signed_txs, None if validate is True else validate)
+
+def send_transaction(signed_tx, validate=None, **kwargs):
+  check([signed_tx], validate)
   tx_info = None
   try:
-      tx_confirm = algod_client.send_transaction(signed_tx)
+      with metrics.span("send"):
+        tx_confirm = config.algod_client.send_transaction(signed_tx)
       print('Transaction sent with ID', signed_tx.transaction.get_txid())
-      tx_info = wait_for_confirmation(tx_confirm, **kwargs)
+      tx_info = wait_for_confirmation(tx_confirm, last_valid=signed_tx.transaction.last_valid_round, **kwargs)
   except Exception as e:
+      metrics.count("send_failures")
       print(e)
   return tx_info
 
-def send_transactions(signed_txs, **kwargs):
+def send_transactions(signed_txs, validate=None, **kwargs):
+  check(signed_txs, validate)
   tx_info = None
   try:
-      tx_confirm = algod_client.send_transactions(signed_txs)
+      with metrics.span("send"):
+        tx_confirm = config.algod_client.send_raw_transaction(base64.b64encode(encode_group(signed_txs)))
       print('Transactions sent with ID', tx_confirm)
-      tx_info = wait_for_confirmation(tx_confirm, **kwargs)
+      tx_info = wait_for_confirmation(tx_confirm, last_valid=last_valid(signed_txs), **kwargs)
   except Exception as e:
+      metrics.count("send_failures")
       print(e)
   return tx_info
-
-
@@ -0,0 +1,165 @@
+import http.client
+import json
+import queue
+import ssl
+import threading
+import time
+from urllib import parse
+from algosdk import constants, error
+from algosdk.v2client import algod, indexer
+from . import metrics
+
+# Keep-alive HTTP connections to one endpoint.
+# Connections are reused from a pool instead of opening (and for https
+# handshaking) a new one per call. `max_concurrency` bounds in-flight
+# requests per endpoint; connection errors and 429/5xx responses are
+# retried with exponential backoff. Requests that are not idempotent
+# (submitting transactions) are only retried when the server cannot have
+# seen them: 429, refused connections and kept-alive connections the
+# server closed while they sat in the pool. The latter are reopened once
+# right away without counting as a retry.
+class Transport:
+  retry_statuses = (429, 502, 503, 504)
+
+  def __init__(self, address, pool_size=8, max_concurrency=None, retries=3, backoff=0.2, timeout=90, name="http"):
+    url = parse.urlsplit(address)
+    self.labels = (("endpoint", name),)
+    self.https = url.scheme == "https"
+    self.host = url.hostname
+    self.port = url.port
+    self.base_path = url.path.rstrip("/")
+    self.pool_size = pool_size
+    self.retries = retries
+    self.backoff = backoff
+    self.timeout = timeout
+    self.pool = queue.LifoQueue()
+    self.slots = threading.BoundedSemaphore(max_concurrency or pool_size)
+    self.context = ssl.create_default_context() if self.https else None
+    self.calls = 0
+    self.retried = 0
+    self.failures = 0
+
+  def connect(self):
+    if self.https:
+      return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout, context=self.context)
+    return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+  # Connection and whether it was reused from the pool
+  def acquire(self):
+    try:
+      return self.pool.get_nowait(), True
+    except queue.Empty:
+      return self.connect(), False
+
+  def release(self, conn, resp):
+    if resp.will_close or self.pool.qsize() >= self.pool_size:
+      conn.close()
+    else:
+      self.pool.put(conn)
+
+  def request(self, method, path, data=None, headers=None, idempotent=True):
+    self.calls += 1
+    metrics.count("http_calls", 1, self.labels)
+    with metrics.span("http_request", self.labels):
+      return self.send(method, path, data, headers, idempotent)
+
+  def send(self, method, path, data, headers, idempotent):
+    attempt = 0
+    reconnected = False
+    with self.slots:
+      while True:
+        conn, pooled = (self.connect(), False) if reconnected else self.acquire()
+        try:
+          conn.request(method, self.base_path+path, body=data, headers=headers or {})
+          resp = conn.getresponse()
+          body = resp.read()
+        except (OSError, http.client.HTTPException) as e:
+          conn.close()
+          if pooled and not reconnected and isinstance(e, (ConnectionResetError, BrokenPipeError)):
+            reconnected = True
+            continue
+          if attempt >= self.retries or not (idempotent or isinstance(e, ConnectionRefusedError)):
+            self.failures += 1
+            metrics.count("http_failures", 1, self.labels)
+            raise
+        else:
+          self.release(conn, resp)
+          if resp.status not in self.retry_statuses or attempt >= self.retries or \
+              not (idempotent or resp.status == 429):
+            return resp.status, body
+        self.retried += 1
+        metrics.count("http_retries", 1, self.labels)
+        time.sleep(self.backoff*2**attempt)
+        attempt += 1
+
+  def close(self):
+    while True:
+      try:
+        self.pool.get_nowait().close()
+      except queue.Empty:
+        return
+
+def error_message(body):
+  e = body.decode("utf-8")
+  try:
+    return json.loads(e)["message"]
+  except Exception:
+    return e
+
+class PooledAlgodClient(algod.AlgodClient):
+  def __init__(self, algod_token, algod_address, headers=None, **transport):
+    super().__init__(algod_token, algod_address, headers)
+    self.transport = Transport(algod_address, name="algod", **transport)
+
+  def algod_request(self, method, requrl, params=None, data=None,
+                    headers=None, response_format="json"):
+    header = {}
+    if self.headers:
+      header.update(self.headers)
+    if headers:
+      header.update(headers)
+    if requrl not in constants.no_auth:
+      header.update({constants.algod_auth_header: self.algod_token})
+    if requrl not in constants.unversioned_paths:
+      requrl = algod.api_version_path_prefix + requrl
+    if params:
+      requrl = requrl + "?" + parse.urlencode(params)
+
+    # A submission may have been accepted before the error
+    idempotent = not (method == "POST" and requrl.endswith("/transactions"))
+    status, body = self.transport.request(method, requrl, data, header, idempotent)
+    if status >= 400:
+      raise error.AlgodHTTPError(error_message(body), status)
+    if response_format == "json":
+      try:
+        return json.loads(body)
+      except json.JSONDecodeError:
+        return None
+    return body
+
+class PooledIndexerClient(indexer.IndexerClient):
+  def __init__(self, indexer_token, indexer_address, headers=None, **transport):
+    super().__init__(indexer_token, indexer_address, headers)
+    self.transport = Transport(indexer_address, name="indexer", **transport)
+
+  def indexer_request(self, method, requrl, params=None, data=None,
+                      headers=None):
+    header = {}
+    if self.headers:
+      header.update(self.headers)
+    if headers:
+      header.update(headers)
+    if (requrl not in constants.no_auth) and self.indexer_token:
+      header.update({constants.indexer_auth_header: self.indexer_token})
+    if requrl not in constants.unversioned_paths:
+      requrl = indexer.api_version_path_prefix + requrl
+    if params:
+      requrl = requrl + "?" + parse.urlencode(params)
+
+    status, body = self.transport.request(method, requrl, data, header)
+    if status >= 400:
+      raise error.IndexerHTTPError(error_message(body))
+    return indexer_sort(json.loads(body))
+
+def indexer_sort(d):
+  return {k: indexer_sort(v) if isinstance(v, dict) else v for k, v in sorted(d.items())}
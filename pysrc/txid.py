@@ -0,0 +1,135 @@
+import base64
+import hashlib
+import threading
+from functools import lru_cache
+import msgpack
+from algosdk import constants, encoding, error
+from algosdk.future import transaction
+
+# Transaction and group ids computed from canonical msgpack bytes.
+# algosdk encodes to a base64 string and decodes it again before hashing,
+# and its dictify re-validates every address (base32 decode plus a
+# SHA-512/256 checksum), which is most of the cost. Here decoded
+# addresses are memoized, payments and app calls are flattened directly,
+# and each thread reuses one Packer whose buffer is hashed in place.
+
+decode_address = lru_cache(maxsize=1 << 16)(encoding.decode_address)
+
+def hashlib_checksum(data):
+  return hashlib.new("sha512_256", data).digest()
+
+try:
+  hashlib_checksum(b"")
+  checksum = hashlib_checksum
+except ValueError:
+  checksum = encoding.checksum
+
+local = threading.local()
+
+def packer():
+  p = getattr(local, "packer", None)
+  if p is None:
+    p = msgpack.Packer(use_bin_type=True, autoreset=False)
+    local.packer = p
+  return p
+
+# Same result as encoding._sort_dict: sorted keys, zero values dropped
+def canonical(d):
+  return {k: canonical(v) if isinstance(v, dict) else v for k, v in sorted(d.items()) if v or isinstance(v, dict)}
+
+def header(txn, d):
+  d["fee"] = txn.fee
+  d["fv"] = txn.first_valid_round
+  d["gen"] = txn.genesis_id
+  d["gh"] = base64.b64decode(txn.genesis_hash)
+  d["grp"] = txn.group
+  d["lv"] = txn.last_valid_round
+  d["lx"] = txn.lease
+  d["note"] = txn.note
+  d["snd"] = decode_address(txn.sender)
+  d["type"] = txn.type
+  if txn.rekey_to:
+    d["rekey"] = decode_address(txn.rekey_to)
+  return d
+
+def txn_dict(txn):
+  if isinstance(txn, transaction.PaymentTxn):
+    d = {"amt": txn.amt}
+    if txn.close_remainder_to:
+      d["close"] = decode_address(txn.close_remainder_to)
+    d["rcv"] = decode_address(txn.receiver)
+    if not any(d["rcv"]):
+      del d["rcv"]
+  elif isinstance(txn, transaction.ApplicationCallTxn):
+    d = {
+      "apid": txn.index,
+      "apan": txn.on_complete,
+      "apap": txn.approval_program,
+      "apsu": txn.clear_program,
+      "apaa": txn.app_args,
+      "apfa": txn.foreign_apps,
+      "apas": txn.foreign_assets
+    }
+    if txn.local_schema:
+      d["apls"] = txn.local_schema.dictify()
+    if txn.global_schema:
+      d["apgs"] = txn.global_schema.dictify()
+    if txn.accounts:
+      d["apat"] = [decode_address(a) for a in txn.accounts]
+  else:
+    return txn.dictify()
+  return header(txn, d)
+
+def digest(prefix, obj):
+  p = packer()
+  try:
+    p.pack(obj)
+    if checksum is hashlib_checksum:
+      h = hashlib.new("sha512_256", prefix)
+      with p.getbuffer() as buf:
+        h.update(buf)
+      return h.digest()
+    return checksum(prefix+p.bytes())
+  finally:
+    p.reset()
+
+def txid_raw(txn):
+  return digest(constants.txid_prefix, canonical(txn_dict(txn)))
+
+def txid_str(raw):
+  return base64.b32encode(raw).decode().rstrip("=")
+
+def txid(txn):
+  return txid_str(txid_raw(txn))
+
+# Same result as transaction.calculate_group_id
+def calculate_group_id(txns):
+  if len(txns) > constants.tx_group_limit:
+    raise error.TransactionGroupSizeError
+  return digest(constants.tgid_prefix, {"txlist": [txid_raw(txn) for txn in txns]})
+
+# Signed transactions as algod takes them, encoded in one pass: each
+# distinct lsig (one per lsig_view) is packed once and spliced into the
+# {"lsig", "txn"} map of every transaction it signs, and transactions are
+# flattened like for their ids. Other signed types go through algosdk.
+def encode_group(stxns):
+  lsigs = {}
+  parts = []
+  for stxn in stxns:
+    if not isinstance(stxn, transaction.LogicSigTransaction) or not stxn.lsig:
+      parts.append(base64.b64decode(encoding.msgpack_encode(stxn)))
+      continue
+    lsig = lsigs.get(id(stxn.lsig))
+    if lsig is None:
+      lsig = lsigs[id(stxn.lsig)] = msgpack.packb(canonical(stxn.lsig.dictify()), use_bin_type=True)
+    parts += [b"\x82\xa4lsig", lsig, b"\xa3txn", msgpack.packb(canonical(txn_dict(stxn.transaction)), use_bin_type=True)]
+  return b"".join(parts)
+
+# Regrouping replaces any previous group id
+def assign_group_id(txns):
+  for txn in txns:
+    txn.group = None
+  group_id = calculate_group_id(txns)
+  for txn in txns:
+    txn.group = group_id
+  return group_id
@@ -0,0 +1,176 @@
+import base64
+import threading
+from collections import Counter
+from algosdk import encoding
+from algosdk.v2client.models import DryrunRequest
+from . import config, metrics
+from .follower import get_follower
+from .assembler import disassemble
+from .simulator import Ledger, App, Rejected
+from .teal import TealError
+
+# Checks a signed group before it is sent, so a stale counter, a mark
+# mismatch or a wrong confirm_pos fails at once instead of costing a round.
+# By default the group runs in the local simulator against the mirrored
+# (or freshly read) local state of the accounts it touches; with
+# dryrun=True it goes through algod's /teal/dryrun endpoint instead,
+# which needs EnableDeveloperAPI on the node.
+
+# Rejection reasons are counted by category, first match wins
+CATEGORIES = [
+  ("group", "group"),
+  ("not valid in round", "round"),
+  ("logic signature", "lsig"),
+  ("signature", "signature"),
+  ("opted in", "optin"),
+  ("application", "app")
+]
+
+def category(reason):
+  for text, name in CATEGORIES:
+    if text in reason:
+      return name
+  return "other"
+
+class GroupRejected(Exception):
+  def __init__(self, reason, index=None, txid=None, source="local"):
+    super().__init__(reason if index is None else "transaction %d (%s): %s" % (index, txid, reason))
+    self.reason = reason
+    self.index = index
+    self.txid = txid
+    self.source = source
+    self.category = category(reason)
+
+def decode_state(key_value):
+  state = {}
+  for kv in key_value or []:
+    value = kv["value"]
+    state[base64.b64decode(kv["key"])] = value["uint"] if value["type"] == 2 else base64.b64decode(value["bytes"])
+  return state
+
+class Validator:
+  def __init__(self, client=None, mirror=None, dryrun=False):
+    self.client = client or config.algod_client
+    self.mirror = mirror
+    self.dryrun = dryrun
+    self.apps = {}
+    self.lock = threading.Lock()
+    self.checked = 0
+    self.rejections = Counter()
+
+  def round(self):
+    tip = get_follower().last_round
+    if tip is None:
+      tip = self.client.status()["last-round"]
+    return tip
+
+  def app(self, app_id):
+    with self.lock:
+      app = self.apps.get(app_id)
+    if app is None:
+      params = self.client.application_info(app_id)["params"]
+      app = App(
+        app_id,
+        encoding.decode_address(params["creator"]),
+        disassemble(base64.b64decode(params["approval-program"])),
+        disassemble(base64.b64decode(params["clear-state-program"]))
+      )
+      with self.lock:
+        self.apps[app_id] = app
+    return app
+
+  # Call after updating an app, its programs are cached
+  def forget(self, app_id):
+    with self.lock:
+      self.apps.pop(app_id, None)
+
+  def local_state(self, address, app_id):
+    if self.mirror is not None and getattr(self.mirror, "app_id", app_id) == app_id:
+      key_value = self.mirror.local_state(address, True, app_id)
+      if key_value is not None:
+        return decode_state(key_value)
+    for local_state in self.client.account_info(address).get("apps-local-state", []):
+      if local_state["id"] == app_id:
+        return decode_state(local_state.get("key-value"))
+    return None
+
+  def ledger(self, stxns):
+    txns = [s.transaction for s in stxns]
+    ledger = Ledger(genesis_hash=txns[0].genesis_hash, round=self.round())
+    for txn in txns:
+      if txn.type != "appl" or txn.index == 0:
+        continue
+      ledger.apps[txn.index] = self.app(txn.index)
+      for address in [txn.sender]+list(txn.accounts or []):
+        key = encoding.decode_address(address)
+        if txn.index in ledger.local.get(key, {}):
+          continue
+        state = self.local_state(address, txn.index)
+        if state is not None:
+          ledger.local.setdefault(key, {})[txn.index] = state
+    return ledger
+
+  def check_local(self, stxns):
+    try:
+      self.ledger(stxns).check(stxns)
+    except Rejected as e:
+      raise GroupRejected(e.reason, e.index, e.txid)
+    except TealError as e:
+      # Program the simulator cannot disassemble (app or logic signature)
+      raise GroupRejected("program cannot be simulated: "+str(e))
+
+  def check_dryrun(self, stxns):
+    txns = [s.transaction for s in stxns]
+    addresses = []
+    app_ids = []
+    for txn in txns:
+      if txn.type == "appl" and txn.index != 0:
+        if txn.index not in app_ids:
+          app_ids.append(txn.index)
+        for address in [txn.sender]+list(txn.accounts or []):
+          if address not in addresses:
+            addresses.append(address)
+    apps = []
+    for app_id in app_ids:
+      app = self.client.application_info(app_id)
+      params = dict(app["params"])
+      params["approval-program"] = base64.b64decode(params["approval-program"])
+      params["clear-state-program"] = base64.b64decode(params["clear-state-program"])
+      apps.append({"id": app_id, "params": params})
+    accounts = [self.client.account_info(address) for address in addresses]
+    response = self.client.dryrun(DryrunRequest(txns=stxns, accounts=accounts, apps=apps, round=self.round()))
+    if response.get("error"):
+      raise GroupRejected(response["error"], source="dryrun")
+    for i, result in enumerate(response.get("txns", [])):
+      for field in ("logic-sig-messages", "app-call-messages"):
+        messages = result.get(field) or []
+        if "REJECT" in messages:
+          reason = "logic signature rejected" if field == "logic-sig-messages" else "application call rejected"
+          details = [m for m in messages if m not in ("PASS", "REJECT")]
+          if details:
+            reason += ": "+"; ".join(details)
+          raise GroupRejected(reason, i, txns[i].get_txid(), "dryrun")
+
+  def check(self, stxns):
+    self.checked += 1
+    try:
+      if self.dryrun:
+        self.check_dryrun(stxns)
+      else:
+        self.check_local(stxns)
+    except GroupRejected as e:
+      self.rejections[e.category] += 1
+      metrics.count("rejections", 1, (("category", e.category),))
+      raise
+
+validator = None
+
+def get_validator():
+  global validator
+  if validator is None:
+    validator = Validator()
+  return validator
+
+# Raises GroupRejected if the group would be rejected by the network
+def validate_group(stxns, validator=None):
+  (validator or get_validator()).check(stxns)
@@ -4,7 +4,8 @@ import { createSlice, PayloadAction } from '@reduxjs/toolkit'
 import { AppThunk, RootState } from '../../app/store'
 import {  
   checkAuthRequest,
-  checkPasswd
+  checkPasswd,
+  findChainSeed
 } from '../../lib/passkit'
 import algosdk from "algosdk"
 import { selectAddress, setAddress } from "../account/accountSlice"
@@ -122,7 +123,8 @@ AppThunk<Promise<{groupCTxn: algosdk.Transaction, groupTxn: algosdk.Transaction}
   try {
     let kPrepare = dappState.counter - dappState.counter%3
     let kConfirm = kPrepare - 2
-    let secretConfirm = makeHashIterate(passwd, kConfirm)
+    let seed = await findChainSeed(passwd, dappState) || passwd
+    let secretConfirm = makeHashIterate(seed, kConfirm)
     let ctxn = await makeConfirmTxn(
       algod, address, appId, 
       secretConfirm
@@ -190,6 +192,7 @@ export const requestCancel = (): AppThunk => async (
   const passwd = await selectPasswd(getState())
   if( !sigs ) throw "Signatures not loaded"
   if( !dappState || dappState.status!=="wait-confirm" ) throw "Not waiting for confirmation"
+  const seed = await findChainSeed(passwd, dappState) || passwd
   dispatch(setCurrentRequest("cancel"))
   try {
     await cancel(
@@ -197,7 +200,7 @@ export const requestCancel = (): AppThunk => async (
       address, 
       sigs, 
       appId, 
-      makeHashIterate(passwd, dappState.counter-1),
+      makeHashIterate(seed, dappState.counter-1),
     )
   } finally {
     dispatch(setCurrentRequest(null))
@@ -234,7 +237,7 @@ export const requestAuth = (
   const sigs = selectSigs(getState())
   const passwd = await selectPasswd(getState())
   const dappState = selectDAppState(getState())
-  if( !dappState || !sigs || !checkPasswd(appId, passwd, dappState)) {
+  if( !dappState || !sigs || !(await checkPasswd(appId, passwd, dappState))) {
     await dispatch(makeRequest(requestLSigs()))
   }
   const address = selectAddress(getState())
@@ -29,15 +29,51 @@ export function checkAuthRequest(mark: string, state: PassDAppConfirmState) {
   return mark==state.mark
 }
 
-export function checkPasswd(appId: number, passwd: Uint8Array, state: PassDAppState): boolean {
+// Renewals move the contract to the chain of a new epoch, seeded with
+// HMAC-SHA256(password hash, "passdapp-epoch" | epoch as uint64);
+// epoch 0 is the password hash itself (see epoch_seed in pysrc/passkit.py).
+// Renewals stop before epochLimit (EPOCH_LIMIT in pysrc/passkit.py), and
+// the search starts at the epoch found last, since renewals only move up.
+const epochLimit = 64
+let lastEpoch = 0
+
+export async function epochSeed(passwd: Uint8Array, epoch: number): Promise<Uint8Array> {
+  if( epoch===0 ) return passwd
+  let message = new Uint8Array(22)
+  message.set(Uint8Array.from("passdapp-epoch", (c: string) => c.charCodeAt(0)))
+  new DataView(message.buffer).setUint32(18, epoch)
+  let key = await window.crypto.subtle.importKey(
+    "raw",
+    passwd,
+    {name: "HMAC", hash: "SHA-256"},
+    false,
+    ["sign"]
+  )
+  return new Uint8Array(await window.crypto.subtle.sign("HMAC", key, message))
+}
+
+// Seed of the chain matching the secret stored in the contract, or null
+export async function findChainSeed(passwd: Uint8Array, state: PassDAppState): Promise<Uint8Array | null> {
   if( 
     state.status==="not-created" || 
     state.status==="not-opted-in" ||
     state.status==="wait-setup"
-  ) return false
-  return encode(makeHashIterate(
-    passwd, state.counter
-  ))==state.secret
+  ) return null
+  let epochs: number[] = []
+  for( let epoch=lastEpoch; epoch<epochLimit; ++epoch ) epochs.push(epoch)
+  for( let epoch=lastEpoch-1; epoch>=0; --epoch ) epochs.push(epoch)
+  for( let epoch of epochs ) {
+    let seed = await epochSeed(passwd, epoch)
+    if( encode(makeHashIterate(seed, state.counter))==state.secret ) {
+      lastEpoch = epoch
+      return seed
+    }
+  }
+  return null
+}
+
+export async function checkPasswd(appId: number, passwd: Uint8Array, state: PassDAppState): Promise<boolean> {
+  return (await findChainSeed(passwd, state))!==null
 }
 
 type StateValue = {
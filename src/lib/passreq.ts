@@ -112,6 +112,42 @@ export async function setup(
   return passwd
 }
 
+// Compact bundle written by pysrc/lsigbundle.py: "PDL", version, public key,
+// count, then per lsig a 64-byte signature and u16 prefix, suffix, offset and
+// length; programs after the first are delta coded against the first one
+function decodeCompactCredentials(note: Uint8Array): {address: string, sigs: Sigs} | null {
+  if( note.length<37 || note[0]!==0x50 || note[1]!==0x44 || note[2]!==0x4c ) return null
+  if( note[3]!==1 ) throw "Unsupported credentials version"
+  const view = new DataView(note.buffer, note.byteOffset, note.byteLength)
+  const count = note[36]
+  const body = 37+count*72
+  const programs: Uint8Array[] = []
+  const lsigs: string[] = []
+  for( let i=0; i<count; ++i ) {
+    const e = 37+i*72
+    const prefix = view.getUint16(e+64)
+    const suffix = view.getUint16(e+66)
+    const offset = view.getUint16(e+68)
+    const middle = note.slice(body+offset, body+offset+view.getUint16(e+70))
+    const base = i===0 ? new Uint8Array(0) : programs[0]
+    const program = concatUint8Arrays(
+      concatUint8Arrays(base.slice(0, prefix), middle),
+      base.slice(base.length-suffix)
+    )
+    programs.push(program)
+    lsigs.push(encode(algosdk.encodeObj({l: program, sig: note.slice(e, e+64)})))
+  }
+  return {
+    address: algosdk.encodeAddress(note.slice(4, 36)),
+    sigs: {
+      prepareSig: lsigs[0],
+      confirmSig: lsigs[1],
+      confirmTxnSig: lsigs[2],
+      cancelSig: lsigs[3]
+    }
+  }
+}
+
 export async function findCredentials(
   indexer: algosdk.Indexer, 
   appId: number, 
@@ -140,6 +176,8 @@ export async function findCredentials(
     txNote = null
   }
   if( !txNote ) throw "Password not found" 
+  const compact = decodeCompactCredentials(txNote.slice(notePrefix.length))
+  if( compact ) return compact
   let msg: any = algosdk.decodeObj(txNote.slice(notePrefix.length))
   return {
     address: msg.address,